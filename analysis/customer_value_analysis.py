@@ -1,72 +1,208 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import os
-
-def calculate_clv(simulation_file, rfm_file):
+from utils.plotting import box_stats, render_figure
+from models.monte_carlo_sim import analytic_purchase_moments
+from utils.schema import compact_counts
+from utils.quantile_sketch import QuantileSketch
+
+def _as_frame(data):
+    """Return `data` unchanged if it is a DataFrame, otherwise read it as a CSV path."""
+    if isinstance(data, pd.DataFrame):
+        return data
+    return pd.read_csv(data)
+
+def calculate_clv(simulation_file, rfm_file, method='simulation', days=180, num_simulations=1000, bgf=None,
+                  segment=True):
     """
     Calculate Customer Lifetime Value (CLV) based on simulated purchases and RFM data.
 
     Parameters:
-        simulation_file (str): Path to the Monte Carlo simulation output CSV.
-        rfm_file (str): Path to the RFM data CSV.
+        simulation_file (str or DataFrame): Per-customer simulation totals ('customer_totals'
+            from monte_carlo_simulation, or 'horizon_totals' from forecast_horizons with a
+            'Horizon' column) or a path to them. Long-format simulation output with one row
+            per simulation, customer and day is also accepted. Ignored when method is 'analytic'.
+        rfm_file (str or DataFrame): RFM data or a path to the RFM data CSV.
+        method (str): 'simulation' to use simulated purchases, or 'analytic' to use the
+            closed-form expectation of the simulated totals without running a simulation.
+        days (int or list): Forecast period in days, or several horizons (analytic method only).
+        num_simulations (int): Number of simulations the totals correspond to (analytic method only).
+        bgf (BetaGeoFitter): Fitted model for the analytic method; loaded from the model
+            artifact if omitted.
+        segment (bool): Assign segments from this table's CLV quantiles; disable when
+            segments are assigned later across partitions (see segment_customer_chunks).
     
     Returns:
-        clv_data (DataFrame): DataFrame with CLV and customer segmentation.
-    """
-    import numpy as np
-    import pandas as pd
-
-    # Load simulation and RFM data
-    simulation_results = pd.read_csv(simulation_file)
-    rfm_data = pd.read_csv(rfm_file)
-
-    # Aggregate total purchases per customer across all simulations
-    total_purchases_per_customer = (
-        simulation_results.groupby('CustomerID')['PurchasesToday'].sum().reset_index()
-    )
-
-    # Calculate CLV: Multiply total purchases by average monetary value from RFM
-    clv_data = pd.merge(rfm_data, total_purchases_per_customer, on='CustomerID', how='inner')
-    clv_data['CLV'] = clv_data['PurchasesToday'] * clv_data['MonetaryValue']
-
-    # Separate customers with zero CLV
-    clv_zero = clv_data[clv_data['CLV'] == 0].copy()
-    clv_positive = clv_data[clv_data['CLV'] > 0].copy()
-
-    # Debugging CLV values
-    print("CLV Value Counts:")
-    print(clv_data['CLV'].value_counts().head(10))
-    print(f"Number of unique CLV values: {clv_data['CLV'].nunique()}")
-
-    # Only apply binning to positive CLV values
-    if not clv_positive.empty:
-        q33 = clv_positive['CLV'].quantile(0.33)
-        q66 = clv_positive['CLV'].quantile(0.66)
-        max_clv = clv_positive['CLV'].max()
-
-        # Ensure bins are unique
-        bins = [0, q33, q66, max_clv]
-        labels = ['Low Predictive Buyers', 'Moderate Buyers', 'High-Value Customers']
-
-        # Ensure unique bins
-        if len(np.unique(bins)) == len(bins):
-            clv_positive['Segment'] = pd.cut(clv_positive['CLV'], bins=bins, labels=labels, include_lowest=True)
+        clv_data (DataFrame): DataFrame with CLV and customer segmentation. The analytic
+            method also includes the variance of the purchase totals ('PurchasesVariance').
+            With several horizons there is one row per horizon and customer, keyed by
+            'Horizon', and customers are segmented within each horizon.
+    """
+    rfm_data = _as_frame(rfm_file)
+
+    if method == 'analytic':
+        purchases, variance = analytic_purchase_moments(rfm_data, days, num_simulations, bgf)
+        if np.ndim(days):
+            # One vectorized evaluation for all horizons, laid out as one block of rows per horizon
+            clv_data = pd.concat([rfm_data.assign(Horizon=horizon, PurchasesToday=purchases[:, column],
+                                                  PurchasesVariance=variance[:, column])
+                                  for column, horizon in enumerate(days)], ignore_index=True)
         else:
-            print("Warning: Non-unique positive CLV bins detected. Adjusting to fewer segments.")
-            clv_positive['Segment'] = 'Unsegmented'
+            clv_data = rfm_data.copy()
+            clv_data['PurchasesToday'] = purchases
+            clv_data['PurchasesVariance'] = variance
+    elif method == 'simulation':
+        simulation_results = _as_frame(simulation_file)
+        keys = ['Horizon', 'CustomerID'] if 'Horizon' in simulation_results else ['CustomerID']
+
+        # Aggregate total purchases per customer (and horizon) across all simulations
+        total_purchases_per_customer = (
+            simulation_results.groupby(keys, observed=True)['PurchasesToday'].sum().reset_index()
+        )
+        total_purchases_per_customer['PurchasesToday'] = compact_counts(total_purchases_per_customer['PurchasesToday'])
+        clv_data = pd.merge(rfm_data, total_purchases_per_customer, on='CustomerID', how='inner')
     else:
+        raise ValueError(f"Unknown CLV method '{method}'. Use 'simulation' or 'analytic'.")
+
+    # Calculate CLV: Multiply total purchases by average monetary value from RFM, keeping
+    # the monetary precision (float32 under the compact schema)
+    clv_data['CLV'] = (clv_data['PurchasesToday'] * clv_data['MonetaryValue']).astype(clv_data['MonetaryValue'].dtype)
+
+    if not segment:
+        return clv_data
+    if 'Horizon' in clv_data:
+        return pd.concat([segment_customers(horizon_data) for _, horizon_data in clv_data.groupby('Horizon')],
+                         ignore_index=True)
+    return segment_customers(clv_data)
+
+def clv_distribution(distribution_file, rfm_file):
+    """
+    Per-customer CLV quantiles over one simulated period.
+
+    Parameters:
+        distribution_file (str or DataFrame): Per-customer purchase distribution
+            ('customer_distribution' from monte_carlo_simulation) or a path to it.
+        rfm_file (str or DataFrame): RFM data or a path to the RFM data CSV.
+
+    Returns:
+        distribution (DataFrame): Purchase quantiles ('PurchasesP10', 'PurchasesP50',
+            'PurchasesP90'), 'ProbabilityAtLeastOne' and the matching CLV quantiles
+            ('CLVP10', 'CLVP50', 'CLVP90'), i.e. purchase quantiles times average monetary value.
+    """
+    rfm_data = _as_frame(rfm_file)
+    distribution = pd.merge(_as_frame(distribution_file), rfm_data[['CustomerID', 'MonetaryValue']],
+                            on='CustomerID', how='inner')
+    for level in ('P10', 'P50', 'P90'):
+        distribution[f'CLV{level}'] = (distribution[f'Purchases{level}'] * distribution['MonetaryValue']).astype(
+            distribution['MonetaryValue'].dtype)
+    return distribution.drop(columns='MonetaryValue')
+
+# Default segments: positive CLV split at these quantiles, lowest segment first
+SEGMENT_QUANTILES = (0.33, 0.66)
+SEGMENT_LABELS = ('Low Predictive Buyers', 'Moderate Buyers', 'High-Value Customers')
+ZERO_SEGMENT = 'No Purchases'
+UNSEGMENTED = 'Unsegmented'
+
+def clv_sketch(clv_chunks, relative_accuracy=0.01):
+    """Stream chunks of CLV values into a mergeable sketch of the positive values."""
+    sketch = QuantileSketch(relative_accuracy)
+    for chunk in clv_chunks:
+        chunk = np.asarray(chunk, dtype=float)
+        sketch.add(chunk[chunk > 0])
+    return sketch
+
+def segment_boundaries(sketch, quantiles=SEGMENT_QUANTILES):
+    """
+    Segment boundaries at the given quantiles of positive CLV.
+
+    Returns:
+        boundaries (ndarray or None): Increasing boundaries, or None when there are no positive
+        values or the boundaries are not distinct.
+    """
+    if sketch.count == 0:
         print("Warning: No positive CLV values found.")
-        clv_positive['Segment'] = 'Unsegmented'
+        return None
+    boundaries = np.atleast_1d(sketch.quantile(quantiles))
+    if len(np.unique(np.concatenate([[0], boundaries, [sketch.max]]))) != len(boundaries) + 2:
+        print("Warning: Non-unique positive CLV bins detected. Adjusting to fewer segments.")
+        return None
+    return boundaries
+
+def assign_segments(clv, boundaries, labels=SEGMENT_LABELS):
+    """
+    Label CLV values: ZERO_SEGMENT for zero, otherwise the segment between boundaries.
+
+    A value equal to a boundary belongs to the lower segment. Positive values are labeled
+    UNSEGMENTED when `boundaries` is None.
+
+    Returns:
+        segments (Categorical): One label per value, with categories in alphabetical order.
+    """
+    clv = np.asarray(clv, dtype=float)
+    categories = sorted(set(labels) | {ZERO_SEGMENT, UNSEGMENTED})
+    if boundaries is None:
+        codes = np.full(len(clv), categories.index(UNSEGMENTED))
+    else:
+        label_codes = np.array([categories.index(label) for label in labels])
+        codes = label_codes[np.searchsorted(boundaries, clv, side='left')]
+    codes = np.where(clv == 0, categories.index(ZERO_SEGMENT), codes)
+    return pd.Categorical.from_codes(codes, categories=categories)
+
+def segment_customers(clv_data, quantiles=SEGMENT_QUANTILES, labels=SEGMENT_LABELS, chunk_size=1_000_000,
+                      relative_accuracy=0.01):
+    """
+    Assign customers to CLV segments: 'No Purchases' for zero CLV and quantile segments of positive CLV.
+
+    Boundaries come from a streaming quantile sketch over the CLV column in chunks, so no
+    copy, sort or concatenation of the customers is needed; boundaries are within
+    `relative_accuracy` of the exact quantiles.
+
+    Parameters:
+        clv_data (DataFrame): DataFrame with 'CustomerID' and 'CLV' columns.
+        quantiles (tuple): Quantiles of positive CLV separating the segments.
+        labels (tuple): Segment labels from lowest to highest CLV; one more than `quantiles`.
+        chunk_size (int): Customers added to the sketch at a time.
+        relative_accuracy (float): Relative accuracy of the quantile sketch.
 
-    # Assign 'No Purchases' to customers with zero CLV
-    clv_zero['Segment'] = 'No Purchases'
+    Returns:
+        clv_data (DataFrame): Copy of the input with a 'Segment' column, in input order.
+    """
+    if len(labels) != len(quantiles) + 1:
+        raise ValueError("Provide exactly one more segment label than quantiles.")
 
-    # Combine back the datasets
-    clv_data = pd.concat([clv_zero, clv_positive]).sort_values('CustomerID').reset_index(drop=True)
+    clv = clv_data['CLV'].to_numpy()
+    sketch = clv_sketch((clv[start:start + chunk_size] for start in range(0, len(clv), chunk_size)),
+                        relative_accuracy)
+    boundaries = segment_boundaries(sketch, quantiles)
 
+    clv_data = clv_data.copy()
+    clv_data['Segment'] = assign_segments(clv, boundaries, labels)
     return clv_data
 
+def segment_customer_chunks(read_chunks, quantiles=SEGMENT_QUANTILES, labels=SEGMENT_LABELS,
+                            relative_accuracy=0.01):
+    """
+    Segment customers that do not fit in memory in two streaming passes.
+
+    The first pass sketches the positive CLV values of every chunk; the second labels each
+    chunk against the resulting boundaries. Memory is bounded by one chunk plus the sketch.
+
+    Parameters:
+        read_chunks (callable): Returns a fresh iterator of DataFrames with a 'CLV' column,
+            e.g. lambda: pd.read_csv(path, chunksize=1_000_000); it is called twice.
+        quantiles (tuple): Quantiles of positive CLV separating the segments.
+        labels (tuple): Segment labels from lowest to highest CLV.
+        relative_accuracy (float): Relative accuracy of the quantile sketch.
+
+    Yields:
+        chunk (DataFrame): Each chunk with a 'Segment' column.
+    """
+    if len(labels) != len(quantiles) + 1:
+        raise ValueError("Provide exactly one more segment label than quantiles.")
+
+    sketch = clv_sketch((chunk['CLV'].to_numpy() for chunk in read_chunks()), relative_accuracy)
+    boundaries = segment_boundaries(sketch, quantiles)
+    for chunk in read_chunks():
+        yield chunk.assign(Segment=assign_segments(chunk['CLV'].to_numpy(), boundaries, labels))
 
 def plot_customer_segments(clv_data):
     """
@@ -77,20 +213,30 @@ def plot_customer_segments(clv_data):
     """
     # Count customers in each segment
     segment_counts = clv_data['Segment'].value_counts().sort_index()
+    segment_counts = segment_counts[segment_counts > 0]
+    labels = [str(label) for label in segment_counts.index]
+    counts = segment_counts.to_numpy()
+
+    def draw(fig):
+        ax = fig.subplots()
+        ax.bar(labels, counts, color=['green', 'orange', 'red'], alpha=0.7)
+        ax.set_title('Number of Customers by Segment')
+        ax.set_xlabel('Customer Segment')
+        ax.set_ylabel('Number of Customers')
+        ax.grid(axis='y', linestyle='--', alpha=0.7)
 
-    # Plot the customer segments
-    plt.figure(figsize=(8, 6))
-    segment_counts.plot(kind='bar', color=['green', 'orange', 'red'], alpha=0.7)
-    
-    plt.title('Number of Customers by Segment')
-    plt.xlabel('Customer Segment')
-    plt.ylabel('Number of Customers')
-    plt.xticks(rotation=0)
-    plt.grid(axis='y', linestyle='--', alpha=0.7)
-    
     # Save the plot
-    plt.savefig('outputs/eda_visualizations/customer_segments_distribution.png')
-    plt.show()
+    render_figure(draw, 'outputs/eda_visualizations/customer_segments_distribution.png', figsize=(8, 6))
+
+def _segment_box_stats(clv_data):
+    """Boxplot statistics of CLV per segment, grouping the DataFrame once."""
+    return [box_stats(values, str(segment))
+            for segment, values in clv_data.groupby('Segment', observed=True, sort=True)['CLV']]
+
+def _draw_boxplots(ax, stats):
+    ax.bxp(stats, patch_artist=True,
+           boxprops=dict(facecolor='lightblue', edgecolor='blue'),
+           medianprops=dict(color='red'))
 
 def plot_clv_separate_boxplots(clv_data):
     """
@@ -99,24 +245,19 @@ def plot_clv_separate_boxplots(clv_data):
     Parameters:
         clv_data (DataFrame): DataFrame containing customer segmentation and CLV.
     """
-    segments = clv_data['Segment'].unique()
-
-    for segment in segments:
-        segment_data = clv_data[clv_data['Segment'] == segment]
-
-        plt.figure(figsize=(6, 4))
-        plt.boxplot(segment_data['CLV'], patch_artist=True,
-                    boxprops=dict(facecolor='lightblue', color='blue'),
-                    medianprops=dict(color='red'))
+    for stats in _segment_box_stats(clv_data):
+        segment = stats['label']
 
-        plt.title(f'CLV Distribution: {segment}')
-        plt.ylabel('Customer Lifetime Value (CLV)')
-        plt.grid(axis='y', linestyle='--', alpha=0.7)
+        def draw(fig, stats=stats, segment=segment):
+            ax = fig.subplots()
+            _draw_boxplots(ax, [stats])
+            ax.set_title(f'CLV Distribution: {segment}')
+            ax.set_ylabel('Customer Lifetime Value (CLV)')
+            ax.grid(axis='y', linestyle='--', alpha=0.7)
 
         # Save each segment's box plot
         filename = f'outputs/eda_visualizations/clv_boxplot_{segment.replace(" ", "_").lower()}.png'
-        plt.savefig(filename)
-        plt.show()
+        render_figure(draw, filename, figsize=(6, 4))
 
 def plot_clv_boxplot(clv_data):
     """
@@ -125,53 +266,59 @@ def plot_clv_boxplot(clv_data):
     Parameters:
         clv_data (DataFrame): DataFrame containing customer segmentation and CLV.
     """
-    plt.figure(figsize=(10, 6))
-    clv_data.boxplot(column='CLV', by='Segment', grid=False, patch_artist=True,
-                     boxprops=dict(facecolor='lightblue', color='blue'),
-                     medianprops=dict(color='red'))
+    stats = _segment_box_stats(clv_data)
 
-    plt.title('CLV Distribution by Customer Segment')
-    plt.suptitle('')  # Suppress the default title
-    plt.xlabel('Customer Segment')
-    plt.ylabel('Customer Lifetime Value (CLV)')
-    plt.xticks(rotation=0)
-    plt.grid(axis='y', linestyle='--', alpha=0.7)
+    def draw(fig):
+        ax = fig.subplots()
+        _draw_boxplots(ax, stats)
+        ax.set_title('CLV Distribution by Customer Segment')
+        ax.set_xlabel('Customer Segment')
+        ax.set_ylabel('Customer Lifetime Value (CLV)')
+        ax.grid(axis='y', linestyle='--', alpha=0.7)
 
     # Save the plot
-    plt.savefig('outputs/eda_visualizations/clv_boxplot_by_segment.png')
-    plt.show()
+    render_figure(draw, 'outputs/eda_visualizations/clv_boxplot_by_segment.png')
 
 def plot_purchase_trends(daily_simulation_file):
     """
     Plot total predicted purchases per day and cumulative purchases over time using actual simulated events.
 
     Parameters:
-        daily_simulation_file (str): Path to the iterative daily purchase simulation results CSV.
+        daily_simulation_file (str or DataFrame): Per-day simulation totals ('daily_totals'
+            from monte_carlo_simulation, or 'daily_horizons' from forecast_horizons, whose
+            horizons are marked on the cumulative plot) or a path to them. Long-format
+            simulation output is also accepted.
     """
     # Load daily simulation results
-    daily_purchases_df = pd.read_csv(daily_simulation_file)
+    daily_purchases_df = _as_frame(daily_simulation_file)
 
     # Aggregate total purchases per day across all simulations and customers
-    daily_trends = daily_purchases_df.groupby('Day')['PurchasesToday'].sum().reset_index()
-
-    # Plot total predicted purchases per day
-    plt.figure(figsize=(12, 6))
-    plt.plot(daily_trends['Day'], daily_trends['PurchasesToday'], marker='o', linestyle='-', color='blue')
-    plt.title('Total Predicted Purchases per Day Over 180 Days')
-    plt.xlabel('Day')
-    plt.ylabel('Number of Purchases')
-    plt.grid(True)
-    plt.savefig('outputs/eda_visualizations/daily_purchase_trends_actual.png')
-    plt.show()
-
-    # Plot cumulative purchases over time
-    daily_trends['CumulativePurchases'] = daily_trends['PurchasesToday'].cumsum()
-
-    plt.figure(figsize=(12, 6))
-    plt.plot(daily_trends['Day'], daily_trends['CumulativePurchases'], marker='o', linestyle='-', color='green')
-    plt.title('Cumulative Predicted Purchases Over 180 Days')
-    plt.xlabel('Day')
-    plt.ylabel('Cumulative Purchases')
-    plt.grid(True)
-    plt.savefig('outputs/eda_visualizations/cumulative_purchase_trends_actual.png')
-    plt.show()
\ No newline at end of file
+    daily_trends = daily_purchases_df.groupby('Day')['PurchasesToday'].sum()
+    days = daily_trends.index.to_numpy()
+    purchases = daily_trends.to_numpy()
+    cumulative = purchases.cumsum()
+    horizons = np.unique(daily_purchases_df['Horizon']) if 'Horizon' in daily_purchases_df else []
+
+    def draw_daily(fig):
+        ax = fig.subplots()
+        ax.plot(days, purchases, marker='o', linestyle='-', color='blue')
+        ax.set_title(f'Total Predicted Purchases per Day Over {len(days)} Days')
+        ax.set_xlabel('Day')
+        ax.set_ylabel('Number of Purchases')
+        ax.grid(True)
+
+    def draw_cumulative(fig):
+        ax = fig.subplots()
+        ax.plot(days, cumulative, marker='o', linestyle='-', color='green')
+        for horizon in horizons:
+            total = cumulative[np.searchsorted(days, horizon, side='right') - 1]
+            ax.axvline(horizon, color='gray', linestyle='--')
+            ax.annotate(f'{horizon} days: {total:,.0f}', (horizon, total), textcoords='offset points',
+                        xytext=(-5, 5), ha='right')
+        ax.set_title(f'Cumulative Predicted Purchases Over {len(days)} Days')
+        ax.set_xlabel('Day')
+        ax.set_ylabel('Cumulative Purchases')
+        ax.grid(True)
+
+    render_figure(draw_daily, 'outputs/eda_visualizations/daily_purchase_trends_actual.png', figsize=(12, 6))
+    render_figure(draw_cumulative, 'outputs/eda_visualizations/cumulative_purchase_trends_actual.png', figsize=(12, 6))
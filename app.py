@@ -1,62 +1,257 @@
+import argparse
 import os
+import numpy as np
 import pandas as pd
-from utils.data_loader import load_data, create_rfm
-from utils.holdout_split import stratified_holdout_split
+from utils.data_loader import load_data, create_rfm, filter_rfm
+from utils.rfm_state import update_rfm_state, rfm_from_state
+from utils.holdout_split import hashed_holdout_customers, stratified_holdout_split
+from utils.partition import bucket_path, partition_transactions, read_bucket, write_bucket
+from utils.pipeline import Stage, run_pipeline
+from utils.plotting import wait_for_plots
+from utils.instrumentation import stage_timer, write_run_manifest
+from utils.schema import compact_rfm, compact_transactions
+from models.bgnbd import compress_rfm, fit_triples, merge_compressed_rfm
+from models.model_store import DEFAULT_ARTIFACT_PATH, save_model_artifact
+from models.prediction_table import predict_expected_purchases
 from models.train_model import train_bgnbd_model
 from models.evaluate_model import evaluate_model
-from models.monte_carlo_sim import monte_carlo_simulation
+from models.monte_carlo_sim import forecast_horizons, monte_carlo_simulation
 from analysis.customer_value_analysis import calculate_clv, plot_customer_segments, plot_clv_boxplot, plot_clv_separate_boxplots
-from analysis.customer_value_analysis import plot_purchase_trends
+from analysis.customer_value_analysis import plot_purchase_trends, clv_distribution, segment_customer_chunks
 from utils.eda import plot_rfm_distributions
 
-def main():
-    # Load Transaction Data
-    transactions_df = load_data('data/synthetic_customer_transactions.csv')
-    
-    # Generate and Save RFM Data if it doesn't exist
-    rfm_file_path = 'data/synthetic_customer_rfm.csv'
-    if not os.path.exists(rfm_file_path):
-        print("RFM file not found. Generating RFM data...")
-        rfm_df = create_rfm(transactions_df)
-        rfm_df.to_csv(rfm_file_path, index=False)
-    else:
-        rfm_df = pd.read_csv(rfm_file_path)
-     # Plot RFM distributions
-    plot_rfm_distributions(rfm_df)
-    
-    # Split Data into Calibration and Holdout Sets
-    calibration_df, holdout_df = stratified_holdout_split(transactions_df)
-    
-    # Create RFM for Holdout Set
-    holdout_rfm = create_rfm(holdout_df)
-    
-    # Train BG/NBD Model
-    bgf = train_bgnbd_model(rfm_df)
-    
-    # Evaluate Model on Holdout Data
-    evaluate_model(holdout_rfm)
-    
-    # Monte Carlo Simulation for Future Forecasting (180 Days)
-    monte_carlo_simulation(rfm_df, days=180, num_simulations=1000)
-    
-    # Customer Value Analysis
-    clv_data = calculate_clv('outputs/iterative_purchase_simulations.csv', 'data/synthetic_customer_rfm.csv')
-    
-    # Display Top 10 Customers by CLV
+TRANSACTIONS_PATH = 'data/synthetic_customer_transactions.csv'
+RFM_FILE_PATH = 'outputs/rfm.csv'
+PLOTS_DIR = 'outputs/eda_visualizations'
+CLV_DISTRIBUTION_PATH = 'outputs/clv_distribution.csv'
+TRANSACTIONS_CACHE_DIR = 'outputs/.data_cache'
+FORECAST_CACHE_DIR = 'outputs/forecast_cache'
+BUCKET_DIR = 'outputs/buckets'
+CLV_BY_HORIZON_PATH = 'outputs/clv_by_horizon.csv'
+
+def build_rfm_table(transactions_df):
+    """Apply new transactions to the incremental RFM state and derive RFM from it."""
+    # The transactions file is the full history, so a changed history rebuilds the state
+    rfm_state = update_rfm_state(transactions_df, rebuild=True)
+    rfm_df = compact_rfm(filter_rfm(rfm_from_state(state=rfm_state)))
+    rfm_df.to_csv(RFM_FILE_PATH, index=False)
+    return rfm_df
+
+def build_holdout_rfm(transactions_df, split):
+    """Create RFM for the holdout set of a (calibration, holdout) split of transaction indices."""
+    return create_rfm(transactions_df.take(split[1]), compact=True)
+
+def plot_simulated_trends(simulation_summary):
+    """Plot actual daily purchase trends from the simulated per-day totals."""
+    plot_purchase_trends(simulation_summary['daily_totals'])
+
+def customer_value(simulation_summary, rfm_df):
+    """Customer Value Analysis on the simulated per-customer totals."""
+    return calculate_clv(simulation_summary['customer_totals'], rfm_df)
+
+def customer_value_distribution(simulation_summary, rfm_df):
+    """Per-customer P10/P50/P90 CLV and probability of at least one purchase."""
+    distribution = clv_distribution(simulation_summary['customer_distribution'], rfm_df)
+    distribution.to_csv(CLV_DISTRIBUTION_PATH, index=False)
+    return distribution
+
+def customer_value_by_horizon(horizon_summary, rfm_df):
+    """CLV and segments per customer at every forecast horizon."""
+    clv_data = calculate_clv(horizon_summary['horizon_totals'], rfm_df)
+    clv_data.to_csv(CLV_BY_HORIZON_PATH, index=False)
+    return clv_data
+
+def report_top_customers(clv_data):
+    """Display Top 10 Customers by CLV."""
     print("\nTop 10 Customers by CLV:")
     print(clv_data[['CustomerID', 'CLV', 'Segment']].sort_values(by='CLV', ascending=False).head(10))
-    
-    # Plot Customer Segments
-    plot_customer_segments(clv_data)
 
-    # Plot CLV Boxplot
-    plot_clv_boxplot(clv_data)
+def build_stages(days=180, num_simulations=1000, penalizer_coef=0.01, holdout_fraction=0.2,
+                 holdout_period=90, seed=42, workers=None, horizons=None):
+    """
+    Declare the pipeline as a DAG of stages with their inputs, outputs and parameters.
+
+    With `horizons`, a multi-horizon forecast from one simulation to the longest horizon is
+    added, with CLV per horizon in CLV_BY_HORIZON_PATH.
+    """
+    workers = workers or os.cpu_count() or 1
+    simulation_outputs = [f'outputs/simulation_{name}.csv'
+                          for name in ('customer_totals', 'daily_totals', 'simulation_totals',
+                                       'customer_distribution')]
+
+    stages = [
+        # Load Transaction Data
+        # Not cached: the columnar copy in TRANSACTIONS_CACHE_DIR already makes reloading cheap
+        Stage('load', load_data, params={'filepath': TRANSACTIONS_PATH, 'compact': True, 'day_offsets': True},
+              options={'cache_dir': TRANSACTIONS_CACHE_DIR}, files=[TRANSACTIONS_PATH], cache=False),
+        Stage('rfm', build_rfm_table, inputs=['load'], outputs=[RFM_FILE_PATH]),
+        Stage('plot_rfm', plot_rfm_distributions, inputs=['rfm'],
+              outputs=[f'{PLOTS_DIR}/rfm_distributions.png']),
+
+        # Split Data into Calibration and Holdout Sets, kept as transaction indices
+        Stage('split', stratified_holdout_split, inputs=['load'],
+              params={'holdout_fraction': holdout_fraction, 'return_indices': True},
+              outputs=[f'{PLOTS_DIR}/rfm_distributions_comparison.png']),
+        Stage('holdout_rfm', build_holdout_rfm, inputs=['load', 'split']),
+
+        # Train BG/NBD Model
+        Stage('train', train_bgnbd_model, inputs=['rfm'], outputs=[DEFAULT_ARTIFACT_PATH],
+              params={'penalizer_coef': penalizer_coef, 'method': 'compressed'}),
+
+        # Evaluate Model on Holdout Data
+        Stage('evaluate', evaluate_model, inputs=['holdout_rfm'], after=['train'],
+              params={'holdout_period': holdout_period},
+              outputs=[f'{PLOTS_DIR}/predicted_vs_actual.png']),
+
+        # Monte Carlo Simulation for Future Forecasting
+        Stage('forecast', monte_carlo_simulation, inputs=['rfm'], after=['train'],
+              params={'days': days, 'num_simulations': num_simulations, 'seed': seed,
+                      'cache_dir': FORECAST_CACHE_DIR},
+              options={'workers': workers}, outputs=simulation_outputs),
+
+        # Customer Value Analysis
+        Stage('clv', customer_value, inputs=['forecast', 'rfm']),
+        Stage('report', report_top_customers, inputs=['clv'], cache=False),
+        Stage('clv_distribution', customer_value_distribution, inputs=['forecast', 'rfm'],
+              outputs=[CLV_DISTRIBUTION_PATH]),
+
+        # Plot Customer Segments, CLV Boxplots and actual daily purchase trends
+        Stage('plot_segments', plot_customer_segments, inputs=['clv'],
+              outputs=[f'{PLOTS_DIR}/customer_segments_distribution.png']),
+        Stage('plot_clv_boxplot', plot_clv_boxplot, inputs=['clv'],
+              outputs=[f'{PLOTS_DIR}/clv_boxplot_by_segment.png']),
+        Stage('plot_clv_segments', plot_clv_separate_boxplots, inputs=['clv']),
+        Stage('plot_trends', plot_simulated_trends, inputs=['forecast'],
+              outputs=[f'{PLOTS_DIR}/daily_purchase_trends_actual.png',
+                       f'{PLOTS_DIR}/cumulative_purchase_trends_actual.png'])
+    ]
+
+    if horizons:
+        stages += [
+            Stage('horizon_forecast', forecast_horizons, inputs=['rfm'], after=['train'],
+                  params={'horizons': sorted(horizons), 'num_simulations': num_simulations, 'seed': seed},
+                  options={'workers': workers},
+                  outputs=['outputs/simulation_horizon_totals.csv', 'outputs/simulation_daily_horizons.csv']),
+            Stage('horizon_clv', customer_value_by_horizon, inputs=['horizon_forecast', 'rfm'],
+                  outputs=[CLV_BY_HORIZON_PATH])
+        ]
+    return stages
+
+def run_out_of_core(transactions_path=TRANSACTIONS_PATH, num_buckets=64, days=180, num_simulations=1000, penalizer_coef=0.01, holdout_fraction=0.2,
+                    holdout_period=90, seed=42, workers=None):
+    """
+    Run the pipeline bucket by bucket for transaction data larger than memory.
+
+    Transactions are hash-partitioned by CustomerID into BUCKET_DIR, so every per-customer
+    stage (RFM, holdout assignment, scoring, simulation, CLV) only ever holds one bucket.
+    Only small global aggregates are combined centrally: the compressed (Frequency,
+    Recency, T) triples the model is fitted on, the holdout error, daily and per-simulation
+    totals, the CLV quantile sketch behind the segment boundaries and the top customers.
+    Per-customer results are written per bucket ('rfm', 'clv' and 'clv_distribution').
+
+    Holdout customers are chosen by hashed_holdout_customers rather than the exact
+    stratified shuffle, and CLV is simulated with per-customer random streams, so CLV
+    matches the in-memory pipeline with the same seed.
+
+    Parameters:
+        transactions_path (str): Transactions CSV or Parquet file, or a directory or glob of shards.
+        num_buckets (int): Number of customer buckets; memory scales with the largest bucket.
+        Other parameters as in build_stages.
+    """
+    workers = workers or os.cpu_count() or 1
+
+    with stage_timer('out_of_core_partition'):
+        meta = partition_transactions(transactions_path, BUCKET_DIR, num_buckets)
+    reference_date = pd.Timestamp(meta['last_purchase']) + pd.Timedelta(days=1)
+
+    # Pass 1: RFM per bucket, merged into the global (Frequency, Recency, T) triples
+    buckets, compressed = [], None
+    with stage_timer('out_of_core_rfm'):
+        for bucket in range(num_buckets):
+            transactions_df = read_bucket(BUCKET_DIR, 'transactions', bucket)
+            if transactions_df is None:
+                continue
+            rfm_df = create_rfm(compact_transactions(transactions_df, day_offsets=True), reference_date, compact=True)
+            write_bucket(rfm_df, BUCKET_DIR, 'rfm', bucket)
+            buckets.append(bucket)
+            triples = compress_rfm(rfm_df)
+            compressed = triples if compressed is None else merge_compressed_rfm([compressed, triples])
+
+    # Train BG/NBD Model on the global triples
+    with stage_timer('out_of_core_train'):
+        bgf, fit_stats = fit_triples(compressed, penalizer_coef)
+        save_model_artifact(bgf, compressed, DEFAULT_ARTIFACT_PATH, fit_stats)
+    print(f"Fitted {fit_stats['distinct_triples']} distinct (Frequency, Recency, T) triples "
+          f"covering {fit_stats['customers']} customers from {len(buckets)} buckets.")
+
+    # Pass 2: holdout error, simulation and CLV per bucket; totals are summed centrally
+    absolute_error, holdout_customers = 0.0, 0
+    daily_totals, simulation_totals = 0, 0
+    with stage_timer('out_of_core_forecast'):
+        for bucket in buckets:
+            rfm_df = read_bucket(BUCKET_DIR, 'rfm', bucket)
+            holdout_rfm = rfm_df[hashed_holdout_customers(rfm_df['CustomerID'], holdout_fraction, seed)]
+            predicted = predict_expected_purchases(bgf, holdout_period, holdout_rfm['Frequency'],
+                                                   holdout_rfm['Recency'], holdout_rfm['T'])
+            absolute_error += np.abs(holdout_rfm['Frequency'].to_numpy() - predicted).sum()
+            holdout_customers += len(holdout_rfm)
+
+            simulation_summary = monte_carlo_simulation(
+                rfm_df, days, num_simulations, seed=seed, workers=workers, bgf=bgf,
+                output_dir=bucket_path(BUCKET_DIR, 'simulation', bucket),
+                cache_dir=bucket_path(BUCKET_DIR, 'forecast_cache', bucket))
+            daily_totals = daily_totals + simulation_summary['daily_totals']['PurchasesToday'].to_numpy(np.int64)
+            simulation_totals = (simulation_totals
+                                 + simulation_summary['simulation_totals']['PurchasesToday'].to_numpy(np.int64))
+
+            write_bucket(calculate_clv(simulation_summary['customer_totals'], rfm_df, segment=False),
+                         BUCKET_DIR, 'clv', bucket)
+            write_bucket(clv_distribution(simulation_summary['customer_distribution'], rfm_df),
+                         BUCKET_DIR, 'clv_distribution', bucket)
+    print(f"Mean Absolute Error (MAE) of Predictions: {absolute_error / max(holdout_customers, 1):.2f}")
+
+    daily_frame = pd.DataFrame({'Day': np.arange(1, days + 1), 'PurchasesToday': daily_totals})
+    daily_frame.to_csv('outputs/simulation_daily_totals.csv', index=False)
+    pd.DataFrame({'Simulation': np.arange(1, num_simulations + 1), 'PurchasesToday': simulation_totals}).to_csv(
+        'outputs/simulation_simulation_totals.csv', index=False)
+    plot_purchase_trends(daily_frame)
+
+    # Pass 3: segment boundaries from a sketch over all buckets, then label each bucket
+    segment_counts, top_customers = None, None
+    with stage_timer('out_of_core_segments'):
+        read_chunks = lambda: (read_bucket(BUCKET_DIR, 'clv', bucket) for bucket in buckets)
+        for bucket, clv_data in zip(buckets, segment_customer_chunks(read_chunks)):
+            write_bucket(clv_data, BUCKET_DIR, 'clv', bucket)
+            counts = clv_data['Segment'].value_counts()
+            segment_counts = counts if segment_counts is None else segment_counts.add(counts, fill_value=0)
+            top = clv_data.nlargest(10, 'CLV')
+            top_customers = top if top_customers is None else pd.concat([top_customers, top]).nlargest(10, 'CLV')
+
+    print("\nCustomers per segment:")
+    print(segment_counts[segment_counts > 0].astype(int).to_string())
+    report_top_customers(top_customers)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the CLV pipeline.")
+    parser.add_argument('--out-of-core', action='store_true',
+                        help="Partition transactions by customer and process them bucket by bucket.")
+    parser.add_argument('--buckets', type=int, default=64, help="Number of customer buckets for --out-of-core.")
+    parser.add_argument('--transactions', default=TRANSACTIONS_PATH,
+                        help="Transactions file, directory or glob of shards for --out-of-core.")
+    parser.add_argument('--horizons', type=int, nargs='+',
+                        help="Also forecast these horizons in days (e.g. 30 90 180 365) from one simulation.")
+    args = parser.parse_args()
+
+    if args.out_of_core:
+        run_out_of_core(args.transactions, num_buckets=args.buckets)
+    else:
+        run_pipeline(build_stages(horizons=args.horizons))
 
-    # Plot Separate CLV Boxplots for Each Segment
-    plot_clv_separate_boxplots(clv_data)
+    # Make sure every queued figure is written before exiting
+    wait_for_plots()
 
-    # Plot actual daily purchase trends
-    plot_purchase_trends('outputs/iterative_purchase_simulations.csv')
+    # Per-stage timings and memory when CLV_INSTRUMENT is set
+    write_run_manifest()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,194 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+DEFAULT_RESULTS_PATH = 'outputs/benchmarks/results.json'
+DEFAULT_BASELINE_PATH = 'benchmarks/baseline.json'
+
+# Regressions are only flagged for stages slower than this, where timings are not noise
+MIN_COMPARABLE_SECONDS = 0.05
+
+def _peak_rss_mb():
+    """Peak resident set size of this process so far, in MB (ru_maxrss is in KB on Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _run_stages(num_customers, days, num_simulations, workers, seed):
+    """
+    Generate a dataset and time every pipeline stage on it; runs inside a fresh subprocess.
+
+    Peak RSS is the process high-water mark after each stage, so a stage's own footprint is
+    the growth over the previous stage's peak.
+    """
+    # Imported here so the parent process stays small and each size starts from a clean heap
+    from data.synthetic_data_gen import generate_transactions
+    from utils.data_loader import create_rfm
+    from utils.holdout_split import stratified_holdout_split
+    from models.train_model import train_bgnbd_model
+    from models.evaluate_model import evaluate_model
+    from models.monte_carlo_sim import monte_carlo_simulation
+    from analysis.customer_value_analysis import calculate_clv
+    from utils.plotting import wait_for_plots
+
+    results = []
+    state = {}
+
+    def timed(stage, func, rows):
+        wall, cpu = time.perf_counter(), time.process_time()
+        value = func()
+        wait_for_plots()
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        results.append({
+            'customers': num_customers,
+            'stage': stage,
+            'rows': rows(value) if callable(rows) else rows,
+            'seconds': wall,
+            'cpu_seconds': cpu,
+            'peak_rss_mb': _peak_rss_mb()
+        })
+        print(f"[{num_customers} customers] {stage}: {wall:.3f}s", file=sys.stderr)
+        return value
+
+    transactions = timed('generate', lambda: generate_transactions(num_customers, seed=seed), len)
+    rfm = timed('create_rfm', lambda: create_rfm(transactions), len(transactions))
+    calibration, holdout = timed('stratified_holdout_split',
+                                 lambda: stratified_holdout_split(transactions, seed=seed, plot=False),
+                                 len(transactions))
+    state['holdout_rfm'] = create_rfm(holdout)
+    del calibration, holdout
+    timed('train_bgnbd_model', lambda: train_bgnbd_model(rfm, method='compressed'), len(rfm))
+    timed('evaluate_model', lambda: evaluate_model(state['holdout_rfm']), len(state['holdout_rfm']))
+    summary = timed('monte_carlo_simulation',
+                    lambda: monte_carlo_simulation(rfm, days, num_simulations, seed=seed, workers=workers),
+                    len(rfm) * num_simulations * days)
+    timed('calculate_clv', lambda: calculate_clv(summary['customer_totals'], rfm), len(rfm))
+
+    for result in results:
+        result['transactions'] = len(transactions)
+    return results
+
+def run_size(num_customers, days=180, num_simulations=20, workers=1, seed=42):
+    """Benchmark one dataset size in a subprocess with its own working directory."""
+    with tempfile.TemporaryDirectory() as workdir:
+        result_path = os.path.join(workdir, 'result.json')
+        env = dict(os.environ, PYTHONPATH=PROJECT_ROOT, CLV_PLOT_WORKERS='0', MPLBACKEND='Agg')
+        subprocess.run(
+            [sys.executable, '-m', 'benchmarks.run_benchmarks', '--worker', str(num_customers),
+             '--days', str(days), '--simulations', str(num_simulations), '--workers', str(workers),
+             '--seed', str(seed), '--result-file', result_path],
+            cwd=workdir, env=env, check=True, stdout=subprocess.DEVNULL
+        )
+        with open(result_path) as f:
+            return json.load(f)
+
+def environment_metadata():
+    """Versions and machine details recorded next to the results."""
+    import numpy as np
+    import pandas as pd
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count()
+    }
+
+def compare_results(results, baseline, threshold=0.2):
+    """
+    Compare results with a baseline run.
+
+    Parameters:
+        results (dict): Benchmark output with a 'results' list.
+        baseline (dict): Earlier benchmark output in the same format.
+        threshold (float): Relative increase in seconds or peak RSS flagged as a regression.
+
+    Returns:
+        regressions (list): One dict per (customers, stage, metric) above the threshold.
+    """
+    previous = {(row['customers'], row['stage']): row for row in baseline['results']}
+    regressions = []
+    for row in results['results']:
+        before = previous.get((row['customers'], row['stage']))
+        if before is None:
+            continue
+        for metric in ('seconds', 'peak_rss_mb'):
+            if metric == 'seconds' and before[metric] < MIN_COMPARABLE_SECONDS:
+                continue
+            change = row[metric] / before[metric] - 1 if before[metric] else 0.0
+            if change > threshold:
+                regressions.append({'customers': row['customers'], 'stage': row['stage'], 'metric': metric,
+                                    'baseline': before[metric], 'current': row[metric], 'change': change})
+    return regressions
+
+def run_benchmarks(sizes=DEFAULT_SIZES, days=180, num_simulations=20, workers=1, seed=42,
+                   output_path=DEFAULT_RESULTS_PATH):
+    """Benchmark every stage at each size and write the results as JSON."""
+    results = {'metadata': environment_metadata(),
+               'parameters': {'days': days, 'num_simulations': num_simulations, 'workers': workers, 'seed': seed},
+               'results': []}
+    for num_customers in sizes:
+        results['results'].extend(run_size(num_customers, days, num_simulations, workers, seed))
+
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    with open(output_path, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Benchmark results saved to '{output_path}'.")
+    return results
+
+def print_results(results):
+    print(f"{'customers':>10} {'stage':<26} {'rows':>12} {'seconds':>9} {'cpu':>9} {'peak MB':>9}")
+    for row in results['results']:
+        print(f"{row['customers']:>10} {row['stage']:<26} {row['rows']:>12} {row['seconds']:>9.3f} "
+              f"{row['cpu_seconds']:>9.3f} {row['peak_rss_mb']:>9.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark pipeline stages across dataset sizes.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='Numbers of customers')
+    parser.add_argument('--days', type=int, default=180)
+    parser.add_argument('--simulations', type=int, default=20)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default=DEFAULT_RESULTS_PATH)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE_PATH,
+                        help='Results file to compare against, if it exists')
+    parser.add_argument('--save-baseline', action='store_true', help='Also save the results as the baseline')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Relative slowdown flagged as a regression')
+    parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        results = _run_stages(args.worker, args.days, args.simulations, args.workers, args.seed)
+        with open(args.result_file, 'w') as f:
+            json.dump(results, f)
+        return
+
+    results = run_benchmarks(args.sizes, args.days, args.simulations, args.workers, args.seed, args.output)
+    print_results(results)
+
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            regressions = compare_results(results, json.load(f), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression['stage']} @ {regression['customers']} customers: {regression['metric']} "
+                  f"{regression['baseline']:.3f} -> {regression['current']:.3f} (+{regression['change']:.0%})")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions above {args.threshold:.0%} against '{args.baseline}'.")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to '{args.baseline}'.")
+
+if __name__ == '__main__':
+    main()
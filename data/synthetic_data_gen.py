@@ -1,54 +1,130 @@
-import pandas as pd
+import argparse
+import os
 import numpy as np
-from datetime import timedelta, datetime
-
-# Set random seed for reproducibility
-np.random.seed(42)
-
-# Parameters
-num_customers = 1000
-start_date = datetime(2021, 1, 1)
-end_date = datetime(2022, 12, 31)
-total_days = (end_date - start_date).days
-
-# Initialize list to store transactions
-transactions = []
-
-# Generate synthetic data
-for customer_id in range(1, num_customers + 1):
-    # Determine number of purchases (0 to 50)
-    num_purchases = np.random.poisson(lam=10)
-    num_purchases = min(max(num_purchases, 0), 50)
-    
-    # Churn probability (Beta distribution)
-    churn_prob = np.random.beta(a=2, b=5)
-    
-    purchase_dates = []
-    current_date = start_date
-    
-    for i in range(num_purchases):
-        if np.random.rand() < churn_prob and i > 0:
-            break  # Customer churned
-        
-        # Generate next purchase date
-        days_until_next_purchase = np.random.poisson(lam=30)
-        current_date += timedelta(days=days_until_next_purchase)
-        
-        if current_date > end_date:
-            break  # Stop if date exceeds 2 years
-        
-        purchase_dates.append(current_date)
-    
-    # Add transactions to the list
-    for purchase_date in purchase_dates:
-        monetary_value = round(np.random.uniform(10, 500), 2)
-        transactions.append([customer_id, purchase_date, monetary_value])
-
-# Create DataFrame
-transactions_df = pd.DataFrame(transactions, columns=["CustomerID", "PurchaseDate", "MonetaryValue"])
-
-# Save as CSV
-transactions_df.to_csv('synthetic_customer_transactions.csv', index=False)
-
-# Save as Excel
-transactions_df.to_excel('synthetic_customer_transactions.xlsx', index=False)
\ No newline at end of file
+import pandas as pd
+
+# Customers drawn from one random stream; blocks are whole multiples of this, so the data
+# for a given seed is identical whatever block size it is generated with
+SEED_BLOCK_SIZE = 4096
+
+DEFAULT_OUTPUT_DIR = 'data/synthetic_transactions'
+
+def _seed_block(seed, index, num_customers, start_date, total_days, mean_purchases, max_purchases,
+                churn_a, churn_b, mean_gap_days, monetary_range):
+    """Draw the transactions of one fixed-size seed block of customers as arrays."""
+    rng = np.random.default_rng([seed, index])
+
+    # Determine number of purchases (0 to max_purchases) and churn probability per customer
+    num_purchases = np.clip(rng.poisson(mean_purchases, num_customers), 0, max_purchases)
+    churn_prob = rng.beta(churn_a, churn_b, num_customers)
+
+    # Every purchase after the first survives churn with probability 1 - churn_prob, so the
+    # number of purchase attempts is geometric, capped at the drawn purchase count
+    attempts = np.minimum(num_purchases, rng.geometric(churn_prob))
+
+    # Inter-purchase gaps accumulated per customer: cumulative sum minus the sum of all gaps
+    # of earlier customers (customers without attempts own no rows, so they need no offset)
+    total = attempts.sum()
+    owner = np.repeat(np.arange(num_customers), attempts)
+    gaps = rng.poisson(mean_gap_days, total)
+    cumulative = np.cumsum(gaps)
+    cumulative_before = np.concatenate([[0], cumulative])[np.cumsum(attempts) - attempts]
+    day_offsets = cumulative - np.repeat(cumulative_before, attempts)
+    monetary = np.round(rng.uniform(*monetary_range, total), 2)
+
+    # Stop at the end of the period; gaps are non-negative, so this only truncates sequences
+    keep = day_offsets <= total_days
+    customer_ids = index * SEED_BLOCK_SIZE + 1 + owner[keep]
+    purchase_dates = start_date + day_offsets[keep].astype('timedelta64[D]')
+    return customer_ids, purchase_dates, monetary[keep]
+
+def iter_transaction_blocks(num_customers=1000, start_date='2021-01-01', end_date='2022-12-31', seed=42,
+                            block_size=1_000_000, mean_purchases=10, max_purchases=50, churn_a=2,
+                            churn_b=5, mean_gap_days=30, monetary_range=(10, 500)):
+    """
+    Generate synthetic transactions block by block with vectorized draws.
+
+    Each customer draws a purchase count from Poisson(mean_purchases), a churn probability
+    from Beta(churn_a, churn_b) and Poisson(mean_gap_days) gaps between purchases, starting
+    from `start_date`. Customers are drawn in fixed seed blocks of SEED_BLOCK_SIZE, each with
+    its own generator, so output depends only on `seed` and never on `block_size`.
+
+    Parameters:
+        num_customers (int): Number of customers, with IDs 1 to num_customers.
+        start_date, end_date (str or datetime): Period purchases fall in.
+        seed (int): Root seed.
+        block_size (int): Customers per yielded block, rounded up to a multiple of SEED_BLOCK_SIZE.
+
+    Yields:
+        transactions_df (DataFrame): 'CustomerID', 'PurchaseDate' and 'MonetaryValue' for one block.
+    """
+    start = np.datetime64(pd.Timestamp(start_date).date(), 'D')
+    total_days = int((np.datetime64(pd.Timestamp(end_date).date(), 'D') - start).astype(int))
+    seed_blocks_per_block = max(1, -(-block_size // SEED_BLOCK_SIZE))
+    num_seed_blocks = -(-num_customers // SEED_BLOCK_SIZE)
+
+    for first in range(0, num_seed_blocks, seed_blocks_per_block):
+        parts = [
+            _seed_block(seed, index, min(SEED_BLOCK_SIZE, num_customers - index * SEED_BLOCK_SIZE),
+                        start, total_days, mean_purchases, max_purchases, churn_a, churn_b,
+                        mean_gap_days, monetary_range)
+            for index in range(first, min(first + seed_blocks_per_block, num_seed_blocks))
+        ]
+        customer_ids, purchase_dates, monetary = (np.concatenate(columns) for columns in zip(*parts))
+        yield pd.DataFrame({
+            'CustomerID': customer_ids,
+            'PurchaseDate': purchase_dates.astype('datetime64[ns]'),
+            'MonetaryValue': monetary
+        })
+
+def generate_transactions(num_customers=1000, seed=42, **kwargs):
+    """Generate a synthetic transaction set in memory; see iter_transaction_blocks for options."""
+    return pd.concat(iter_transaction_blocks(num_customers, seed=seed, **kwargs), ignore_index=True)
+
+def write_transactions(output_dir=DEFAULT_OUTPUT_DIR, num_customers=1000, seed=42, csv_path=None, **kwargs):
+    """
+    Stream synthetic transactions to Parquet shards (part-00000.parquet, ...) block by block.
+
+    Parameters:
+        output_dir (str): Directory for the Parquet shards; None to skip them.
+        num_customers (int): Number of customers.
+        seed (int): Root seed.
+        csv_path (str): Optional CSV file that every block is also appended to.
+        **kwargs: Options passed to iter_transaction_blocks.
+
+    Returns:
+        paths (list): Written shard paths.
+    """
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    rows = 0
+    for part, block in enumerate(iter_transaction_blocks(num_customers, seed=seed, **kwargs)):
+        if output_dir is not None:
+            path = os.path.join(output_dir, f'part-{part:05d}.parquet')
+            block.to_parquet(path, index=False)
+            paths.append(path)
+        if csv_path is not None:
+            block.to_csv(csv_path, mode='w' if part == 0 else 'a', header=part == 0, index=False,
+                         date_format='%Y-%m-%d')
+        rows += len(block)
+        print(f"Block {part + 1}: {rows} transactions written.")
+    return paths
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic customer transactions.')
+    parser.add_argument('--customers', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--block-size', type=int, default=1_000_000)
+    parser.add_argument('--start-date', default='2021-01-01')
+    parser.add_argument('--end-date', default='2022-12-31')
+    parser.add_argument('--output-dir', default=DEFAULT_OUTPUT_DIR)
+    parser.add_argument('--no-parquet', action='store_true', help='Only write the CSV file')
+    parser.add_argument('--csv', default=None, help='Also write all transactions to this CSV file')
+    args = parser.parse_args()
+    write_transactions(None if args.no_parquet else args.output_dir, args.customers, args.seed,
+                       csv_path=args.csv, block_size=args.block_size,
+                       start_date=args.start_date, end_date=args.end_date)
+
+if __name__ == '__main__':
+    main()
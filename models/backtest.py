@@ -0,0 +1,152 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+from models.bgnbd import fit_compressed
+from utils.schema import with_purchase_dates
+
+# Calibration-frequency buckets for the calibration table; the last bucket is open-ended
+FREQUENCY_BUCKETS = [0, 1, 2, 3, 4, 5, 6, 7]
+
+def rolling_cutoffs(transactions_df, num_cutoffs=10, horizon=90, step=30):
+    """
+    Calibration cutoffs spaced `step` days apart, the latest leaving a full `horizon` of data after it.
+
+    Returns:
+        cutoffs (list): Timestamps in ascending order.
+    """
+    latest = pd.Timestamp(with_purchase_dates(transactions_df)['PurchaseDate'].max()) - timedelta(days=horizon)
+    return [latest - timedelta(days=step * i) for i in reversed(range(num_cutoffs))]
+
+def cutoff_rfm(transactions_df, cutoffs, horizon=90):
+    """
+    Calibration RFM and realized holdout purchases for many cutoffs from one sorted pass.
+
+    Transactions are sorted by date once. Per-customer first purchase, last purchase, count
+    and monetary sum are then advanced from one cutoff to the next by applying only the
+    transactions in between, instead of regrouping the full history at every cutoff.
+
+    Parameters:
+        transactions_df (DataFrame): Transactions with 'CustomerID', 'PurchaseDate' and 'MonetaryValue'.
+        cutoffs (list): Calibration end dates.
+        horizon (int): Length of the holdout period after each cutoff, in days.
+
+    Yields:
+        (Timestamp, DataFrame): Each cutoff in ascending order with RFM ('Frequency',
+        'Recency', 'T' measured to the cutoff, 'MonetaryValue') and 'HoldoutPurchases' for
+        every customer who purchased on or before it.
+    """
+    transactions_df = with_purchase_dates(transactions_df)
+    codes, customer_ids = pd.factorize(transactions_df['CustomerID'], sort=True)
+    days = pd.to_datetime(transactions_df['PurchaseDate']).to_numpy().astype('datetime64[D]').astype(np.int64)
+    order = np.argsort(days, kind='stable')
+    days, codes = days[order], codes[order]
+    monetary = transactions_df['MonetaryValue'].to_numpy(dtype=float)[order]
+
+    num_customers = len(customer_ids)
+    first = np.full(num_customers, np.iinfo(np.int64).max)
+    last = np.full(num_customers, np.iinfo(np.int64).min)
+    count = np.zeros(num_customers, dtype=np.int64)
+    monetary_sum = np.zeros(num_customers)
+
+    applied = 0
+    for cutoff in sorted(pd.Timestamp(c) for c in cutoffs):
+        cutoff_day = cutoff.to_datetime64().astype('datetime64[D]').astype(np.int64)
+        stop = np.searchsorted(days, cutoff_day, side='right')
+
+        # Apply only the transactions between the previous cutoff and this one
+        batch_codes, batch_days = codes[applied:stop], days[applied:stop]
+        if len(batch_codes):
+            # The batch is date-sorted, so first/last occurrences hold each customer's extremes
+            seen, first_idx = np.unique(batch_codes, return_index=True)
+            first[seen] = np.minimum(first[seen], batch_days[first_idx])
+            seen, last_idx = np.unique(batch_codes[::-1], return_index=True)
+            last[seen] = np.maximum(last[seen], batch_days[::-1][last_idx])
+            count += np.bincount(batch_codes, minlength=num_customers)
+            monetary_sum += np.bincount(batch_codes, weights=monetary[applied:stop], minlength=num_customers)
+        applied = stop
+
+        holdout_stop = np.searchsorted(days, cutoff_day + horizon, side='right')
+        holdout = np.bincount(codes[stop:holdout_stop], minlength=num_customers)
+
+        active = count > 0
+        yield cutoff, pd.DataFrame({
+            'CustomerID': np.asarray(customer_ids)[active],
+            'Frequency': count[active] - 1,
+            'Recency': last[active] - first[active],
+            'T': cutoff_day - first[active],
+            'MonetaryValue': monetary_sum[active] / count[active],
+            'HoldoutPurchases': holdout[active]
+        })
+
+def _evaluate_cutoff(cutoff, rfm, horizon, penalizer_coef):
+    """Fit on one cutoff's calibration RFM and score its holdout; runs in worker processes."""
+    bgf, fit_stats = fit_compressed(rfm, penalizer_coef)
+    predicted = np.asarray(bgf.predict(horizon, rfm['Frequency'], rfm['Recency'], rfm['T']), dtype=float)
+    actual = rfm['HoldoutPurchases'].to_numpy(dtype=float)
+    error = predicted - actual
+
+    metrics = {
+        'Cutoff': cutoff,
+        'Customers': len(rfm),
+        'MAE': np.abs(error).mean(),
+        'RMSE': np.sqrt((error ** 2).mean()),
+        'PredictedPurchases': predicted.sum(),
+        'ActualPurchases': actual.sum(),
+        **{f'param_{name}': value for name, value in bgf.params_.items()},
+        'FitIterations': fit_stats['iterations']
+    }
+
+    bucket = np.minimum(rfm['Frequency'].to_numpy(), FREQUENCY_BUCKETS[-1])
+    calibration = (
+        pd.DataFrame({'FrequencyBucket': bucket, 'Predicted': predicted, 'Actual': actual})
+        .groupby('FrequencyBucket')
+        .agg(Customers=('Actual', 'size'), MeanPredicted=('Predicted', 'mean'), MeanActual=('Actual', 'mean'))
+        .reset_index()
+    )
+    calibration.insert(0, 'Cutoff', cutoff)
+    return metrics, calibration
+
+def backtest_model(transactions_df, cutoffs=None, horizon=90, penalizer_coef=0.01, workers=1,
+                   output_dir='outputs'):
+    """
+    Rolling-origin backtest of the BG/NBD model across many calibration cutoffs.
+
+    For each cutoff the model is fitted on calibration-period RFM and its expected purchases
+    over the next `horizon` days are compared with the purchases customers actually made.
+
+    Parameters:
+        transactions_df (DataFrame): Transactions with 'CustomerID', 'PurchaseDate' and 'MonetaryValue'.
+        cutoffs (list): Calibration end dates; defaults to rolling_cutoffs(transactions_df, horizon=horizon).
+        horizon (int): Holdout period length in days.
+        penalizer_coef (float): Penalization coefficient for each fit.
+        workers (int): Number of processes fitting and scoring cutoffs in parallel.
+        output_dir (str): Directory for 'backtest_metrics.csv' and 'backtest_calibration.csv'.
+
+    Returns:
+        (DataFrame, DataFrame): Metrics per cutoff (MAE, RMSE, totals, parameters) and mean
+        predicted vs actual purchases per cutoff and calibration-frequency bucket, where the
+        last bucket is open-ended (7 or more).
+    """
+    if cutoffs is None:
+        cutoffs = rolling_cutoffs(transactions_df, horizon=horizon)
+
+    print(f"Backtesting {len(cutoffs)} cutoffs with a {horizon}-day holdout period.")
+    frames = cutoff_rfm(transactions_df, cutoffs, horizon)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_evaluate_cutoff, cutoff, rfm, horizon, penalizer_coef)
+                       for cutoff, rfm in frames]
+            results = [future.result() for future in futures]
+    else:
+        results = [_evaluate_cutoff(cutoff, rfm, horizon, penalizer_coef) for cutoff, rfm in frames]
+
+    metrics = pd.DataFrame([metrics for metrics, _ in results])
+    calibration = pd.concat([calibration for _, calibration in results], ignore_index=True)
+
+    os.makedirs(output_dir, exist_ok=True)
+    metrics.to_csv(os.path.join(output_dir, 'backtest_metrics.csv'), index=False)
+    calibration.to_csv(os.path.join(output_dir, 'backtest_calibration.csv'), index=False)
+    print(metrics[['Cutoff', 'Customers', 'MAE', 'RMSE']].to_string(index=False))
+    return metrics, calibration
@@ -0,0 +1,164 @@
+import numpy as np
+import pandas as pd
+from scipy.optimize import minimize
+from scipy.special import digamma, gammaln
+from lifetimes.utils import ConvergenceError
+from models.model_store import PARAM_NAMES, build_model
+
+def compress_rfm(rfm_df):
+    """
+    Collapse RFM data into its sufficient statistics: unique (Frequency, Recency, T) triples.
+
+    Parameters:
+        rfm_df (DataFrame): DataFrame containing 'Frequency', 'Recency', and 'T' columns.
+
+    Returns:
+        compressed (DataFrame): One row per distinct triple with the number of customers
+            sharing it in 'Count'.
+    """
+    return (
+        rfm_df.groupby(['Frequency', 'Recency', 'T'], sort=True)
+        .size()
+        .rename('Count')
+        .reset_index()
+    )
+
+def merge_compressed_rfm(compressed_list):
+    """Merge compressed triples of disjoint sets of customers, summing the counts of shared triples."""
+    return (
+        pd.concat(compressed_list, ignore_index=True)
+        .groupby(['Frequency', 'Recency', 'T'], sort=True)['Count']
+        .sum()
+        .reset_index()
+    )
+
+def negative_log_likelihood(log_params, frequency, recency, T, weights, penalizer_coef=0.0):
+    """
+    Weighted mean BG/NBD negative log-likelihood and its analytic gradient.
+
+    Uses the log-likelihood from Fader, Hardie and Lee (2005) in the same form and with the
+    same penalty (penalizer_coef * sum(params ** 2)) as lifetimes.BetaGeoFitter.
+
+    Parameters:
+        log_params (ndarray): Logs of (r, alpha, a, b).
+        frequency, recency, T (ndarray): Per-row RFM values.
+        weights (ndarray): Number of customers represented by each row.
+        penalizer_coef (float): L2 penalty on the parameters.
+
+    Returns:
+        (float, ndarray): Objective value and gradient with respect to `log_params`.
+    """
+    params = np.exp(log_params)
+    r, alpha, a, b = params
+    x = frequency
+    repeat = x > 0
+    b_term = b + np.maximum(x, 1) - 1
+
+    A_1 = gammaln(r + x) - gammaln(r) + r * np.log(alpha)
+    A_2 = gammaln(a + b) + gammaln(b + x) - gammaln(b) - gammaln(a + b + x)
+    A_3 = -(r + x) * np.log(alpha + T)
+    A_4 = np.log(a) - np.log(b_term) - (r + x) * np.log(alpha + recency)
+
+    max_A_3_A_4 = np.maximum(A_3, A_4)
+    exp_3 = np.exp(A_3 - max_A_3_A_4)
+    exp_4 = np.exp(A_4 - max_A_3_A_4) * repeat
+    total = exp_3 + exp_4
+    ll = A_1 + A_2 + np.log(total) + max_A_3_A_4
+
+    # Share of the likelihood coming from the "still alive" (A_3) and "dropped out" (A_4) terms
+    w_3 = exp_3 / total
+    w_4 = exp_4 / total
+
+    d_r = (digamma(r + x) - digamma(r) + np.log(alpha)
+           - w_3 * np.log(alpha + T) - w_4 * np.log(alpha + recency))
+    d_alpha = r / alpha - (r + x) * (w_3 / (alpha + T) + w_4 / (alpha + recency))
+    d_a = digamma(a + b) - digamma(a + b + x) + w_4 / a
+    d_b = digamma(a + b) + digamma(b + x) - digamma(b) - digamma(a + b + x) - w_4 / b_term
+
+    weight_sum = weights.sum()
+    value = -(weights * ll).sum() / weight_sum + penalizer_coef * (params ** 2).sum()
+    grad_params = np.array([
+        -(weights * d).sum() / weight_sum for d in (d_r, d_alpha, d_a, d_b)
+    ]) + 2 * penalizer_coef * params
+
+    # Chain rule for optimizing over log-parameters
+    return value, grad_params * params
+
+def fit_bgnbd(frequency, recency, T, weights=None, penalizer_coef=0.01, initial_params=None, tol=1e-7):
+    """
+    Fit the BG/NBD model with a weighted, vectorized likelihood and analytic gradient.
+
+    Time is rescaled so the oldest customer has T = 1, as in lifetimes, and the optimizer
+    works on log-parameters.
+
+    Parameters:
+        frequency, recency, T (array-like): RFM values, typically distinct triples.
+        weights (array-like): Number of customers per row; defaults to one each.
+        penalizer_coef (float): L2 penalty on the (time-scaled) parameters.
+        initial_params (dict): Starting values for 'r', 'alpha', 'a' and 'b', e.g. from a
+            previous artifact; lifetimes' defaults are used if omitted.
+        tol (float): Optimizer tolerance.
+
+    Returns:
+        (dict, dict): Fitted parameters and fit statistics.
+    """
+    frequency = np.asarray(frequency, dtype=float)
+    recency = np.asarray(recency, dtype=float)
+    T = np.asarray(T, dtype=float)
+    weights = np.ones_like(T) if weights is None else np.asarray(weights, dtype=float)
+
+    scale = 1.0 / T.max()
+    if initial_params is None:
+        x0 = 0.1 * np.ones(len(PARAM_NAMES))
+    else:
+        start = np.array([float(initial_params[name]) for name in PARAM_NAMES])
+        start[1] *= scale
+        x0 = np.log(start)
+
+    output = minimize(
+        negative_log_likelihood,
+        x0,
+        args=(frequency, recency * scale, T * scale, weights, penalizer_coef),
+        jac=True,
+        method='L-BFGS-B',
+        tol=tol
+    )
+    if not output.success:
+        print(output)
+        raise ConvergenceError(
+            "The model did not converge. Try adding a larger penalizer to see if that helps convergence."
+        )
+
+    fitted = np.exp(output.x)
+    fitted[1] /= scale
+    params = dict(zip(PARAM_NAMES, fitted.tolist()))
+    fit_stats = {
+        'mean_negative_log_likelihood': float(output.fun),
+        'customers': int(weights.sum()),
+        'distinct_triples': int(len(T)),
+        'iterations': int(output.nit),
+        'warm_start': initial_params is not None
+    }
+    return params, fit_stats
+
+def fit_compressed(rfm_df, penalizer_coef=0.01, initial_params=None):
+    """
+    Fit the BG/NBD model on the distinct (Frequency, Recency, T) triples of an RFM table.
+
+    Returns:
+        (BetaGeoFitter, dict): Ready-to-predict model and fit statistics.
+    """
+    return fit_triples(compress_rfm(rfm_df), penalizer_coef, initial_params)
+
+def fit_triples(compressed, penalizer_coef=0.01, initial_params=None):
+    """
+    Fit the BG/NBD model on already compressed triples, e.g. merged from several partitions.
+
+    Returns:
+        (BetaGeoFitter, dict): Ready-to-predict model and fit statistics.
+    """
+    params, fit_stats = fit_bgnbd(
+        compressed['Frequency'], compressed['Recency'], compressed['T'], compressed['Count'],
+        penalizer_coef, initial_params
+    )
+    return build_model(params, penalizer_coef), fit_stats
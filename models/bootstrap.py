@@ -0,0 +1,167 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from lifetimes.utils import ConvergenceError
+from models.bgnbd import compress_rfm, fit_bgnbd
+from models.model_store import PARAM_NAMES, build_model, load_model
+
+def _bootstrap_shard(frequency, recency, T, counts, penalizer_coef, initial_params, seeds):
+    """Refit the model for a batch of bootstrap replicates; runs inside worker processes."""
+    num_customers = counts.sum()
+    probabilities = counts / num_customers
+    samples = np.full((len(seeds), len(PARAM_NAMES)), np.nan)
+
+    for row, seed in enumerate(seeds):
+        # Resampling customers with replacement only changes how many customers share each
+        # distinct triple, so a replicate is a multinomial reweighting of the triples
+        weights = np.random.default_rng(seed).multinomial(num_customers, probabilities)
+        keep = weights > 0
+        try:
+            params, _ = fit_bgnbd(frequency[keep], recency[keep], T[keep], weights[keep],
+                                  penalizer_coef, initial_params)
+        except ConvergenceError:
+            continue
+        samples[row] = [params[name] for name in PARAM_NAMES]
+    return samples
+
+def bootstrap_parameters(rfm_df, num_samples=200, penalizer_coef=0.01, initial_params=None, seed=42,
+                         workers=1, confidence=0.95):
+    """
+    Bootstrap confidence intervals of the BG/NBD parameters with weighted refits.
+
+    Each replicate draws multinomial customer counts over the distinct (Frequency, Recency, T)
+    triples, which is equivalent to resampling customers, and refits only those triples
+    warm-started from `initial_params`. Replicates are spread across a process pool; each
+    has its own seed spawned from `seed`, so results do not depend on the number of workers.
+
+    Parameters:
+        rfm_df (DataFrame): DataFrame containing 'Frequency', 'Recency', and 'T' columns.
+        num_samples (int): Number of bootstrap replicates.
+        penalizer_coef (float): Penalization coefficient of every refit.
+        initial_params (dict): Full-data estimates to start refits from; fitted here if omitted.
+        seed (int): Root seed of the replicates.
+        workers (int): Number of worker processes.
+        confidence (float): Coverage of the percentile intervals.
+
+    Returns:
+        (DataFrame, DataFrame): Per-parameter 'Estimate', 'StdError', 'Lower' and 'Upper', and
+        the parameter samples with one row per converged replicate.
+    """
+    compressed = compress_rfm(rfm_df)
+    frequency = compressed['Frequency'].to_numpy(dtype=float)
+    recency = compressed['Recency'].to_numpy(dtype=float)
+    T = compressed['T'].to_numpy(dtype=float)
+    counts = compressed['Count'].to_numpy()
+
+    if initial_params is None:
+        initial_params, _ = fit_bgnbd(frequency, recency, T, counts, penalizer_coef)
+
+    seeds = np.random.SeedSequence(seed).spawn(num_samples)
+    if workers > 1:
+        shards = [shard.tolist() for shard in np.array_split(np.arange(num_samples), workers * 4) if len(shard)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(_bootstrap_shard, frequency, recency, T, counts, penalizer_coef,
+                                initial_params, [seeds[i] for i in shard])
+                for shard in shards
+            ]
+            samples = np.vstack([future.result() for future in futures])
+    else:
+        samples = _bootstrap_shard(frequency, recency, T, counts, penalizer_coef, initial_params, seeds)
+
+    samples = pd.DataFrame(samples, columns=PARAM_NAMES).dropna().reset_index(drop=True)
+    if len(samples) < num_samples:
+        print(f"{num_samples - len(samples)} of {num_samples} bootstrap refits did not converge and were dropped.")
+
+    tail = (1 - confidence) / 2
+    intervals = pd.DataFrame({
+        'Parameter': PARAM_NAMES,
+        'Estimate': [float(initial_params[name]) for name in PARAM_NAMES],
+        'StdError': samples.std().to_numpy(),
+        'Lower': samples.quantile(tail).to_numpy(),
+        'Upper': samples.quantile(1 - tail).to_numpy()
+    })
+    return intervals, samples
+
+def propagate_intervals(rfm_df, samples, days=180, confidence=0.95, bgf=None):
+    """
+    Propagate bootstrap parameter samples to intervals on expected purchases and CLV.
+
+    Expected purchases are evaluated once per distinct triple and replicate, then gathered
+    to customers. CLV is expected purchases times 'MonetaryValue', when present.
+
+    Parameters:
+        rfm_df (DataFrame): RFM data with 'CustomerID', 'Frequency', 'Recency' and 'T' columns.
+        samples (DataFrame): Parameter samples from bootstrap_parameters.
+        days (int): Forecast period in days.
+        confidence (float): Coverage of the percentile intervals.
+        bgf (BetaGeoFitter): Model giving the point estimates; loaded from the artifact if omitted.
+
+    Returns:
+        intervals (DataFrame): 'CustomerID', 'ExpectedPurchases', 'ExpectedPurchasesLower',
+            'ExpectedPurchasesUpper' and, with monetary values, 'CLV', 'CLVLower', 'CLVUpper'.
+    """
+    bgf = load_model() if bgf is None else bgf
+    triples, inverse = np.unique(rfm_df[['Frequency', 'Recency', 'T']].to_numpy(dtype=float),
+                                 axis=0, return_inverse=True)
+    frequency, recency, T = triples.T
+
+    draws = np.vstack([
+        build_model(params).conditional_expected_number_of_purchases_up_to_time(days, frequency, recency, T)
+        for params in samples.to_dict('records')
+    ])
+    tail = (1 - confidence) / 2
+    lower, upper = np.quantile(draws, [tail, 1 - tail], axis=0)
+    point = np.asarray(bgf.conditional_expected_number_of_purchases_up_to_time(days, frequency, recency, T))
+
+    inverse = inverse.ravel()
+    intervals = pd.DataFrame({
+        'CustomerID': rfm_df['CustomerID'].to_numpy(),
+        'ExpectedPurchases': point[inverse],
+        'ExpectedPurchasesLower': lower[inverse],
+        'ExpectedPurchasesUpper': upper[inverse]
+    })
+    if 'MonetaryValue' in rfm_df:
+        monetary = rfm_df['MonetaryValue'].to_numpy(dtype=float)
+        for suffix in ('', 'Lower', 'Upper'):
+            intervals[f'CLV{suffix}'] = intervals[f'ExpectedPurchases{suffix}'] * monetary
+    return intervals
+
+def bootstrap_model(rfm_df, num_samples=200, penalizer_coef=0.01, days=None, seed=42, workers=None,
+                    confidence=0.95, output_dir='outputs'):
+    """
+    Fit the model, bootstrap its parameters and optionally propagate intervals to customers.
+
+    Parameters:
+        rfm_df (DataFrame): RFM data with 'CustomerID', 'Frequency', 'Recency', 'T' and 'MonetaryValue'.
+        num_samples (int): Number of bootstrap replicates.
+        penalizer_coef (float): Penalization coefficient.
+        days (int): Forecast period for expected purchase and CLV intervals; skipped if None.
+        seed (int): Root seed of the replicates.
+        workers (int): Number of worker processes; defaults to the CPU count.
+        confidence (float): Coverage of the intervals.
+        output_dir (str): Directory for 'bootstrap_parameters.csv' and 'bootstrap_customer_intervals.csv'.
+
+    Returns:
+        (DataFrame, DataFrame or None): Parameter intervals and per-customer intervals.
+    """
+    workers = workers or os.cpu_count() or 1
+    compressed = compress_rfm(rfm_df)
+    params, _ = fit_bgnbd(compressed['Frequency'], compressed['Recency'], compressed['T'],
+                          compressed['Count'], penalizer_coef)
+
+    print(f"Bootstrapping {num_samples} weighted refits over {len(compressed)} distinct triples...")
+    intervals, samples = bootstrap_parameters(rfm_df, num_samples, penalizer_coef, params, seed,
+                                              workers, confidence)
+    print(intervals.to_string(index=False))
+
+    os.makedirs(output_dir, exist_ok=True)
+    intervals.to_csv(os.path.join(output_dir, 'bootstrap_parameters.csv'), index=False)
+
+    customer_intervals = None
+    if days is not None:
+        customer_intervals = propagate_intervals(rfm_df, samples, days, confidence,
+                                                 build_model(params, penalizer_coef))
+        customer_intervals.to_csv(os.path.join(output_dir, 'bootstrap_customer_intervals.csv'), index=False)
+    return intervals, customer_intervals
@@ -1,60 +1,58 @@
-import pandas as pd
-from lifetimes import BetaGeoFitter
-import matplotlib.pyplot as plt
-import seaborn as sns
+from models.model_store import load_model
+from models.prediction_table import predict_expected_purchases
 import numpy as np
+from utils.plotting import draw_histogram, histogram_stats, render_figure
 
 def evaluate_model(holdout_rfm, holdout_period=90):
     """
-    Evaluate the BG/NBD model using holdout data by reloading saved parameters.
+    Evaluate the BG/NBD model using holdout data with the saved model artifact.
     
     Parameters:
         holdout_rfm (DataFrame): Holdout dataset with 'Frequency', 'Recency', and 'T' columns.
+            When it has 'HoldoutPurchases' (see utils.holdout_split.calendar_holdout_split),
+            predictions are compared with those realized purchases instead of 'Frequency'.
         holdout_period (int): Duration of the holdout period in days.
+
+    For many cutoffs at once use models.backtest.backtest_model.
     """
-    # Load model parameters
-    params_df = pd.read_csv('outputs/model_parameters.csv', index_col=0)
-    params = params_df['parameters'].to_dict()
-    
-    # Reinitialize the model and fit it with dummy data
-    bgf = BetaGeoFitter(penalizer_coef=0.01)
-    
-    # Fit the model with dummy data to initialize internal structures
-    dummy_data = pd.DataFrame({
-        'frequency': [0],
-        'recency': [0],
-        'T': [1]
-    })
-    bgf.fit(dummy_data['frequency'], dummy_data['recency'], dummy_data['T'])
-    
-    # Assign the loaded parameters
-    bgf.params_ = params
+    # Load the trained model artifact (cached per process)
+    bgf = load_model()
     
-    # Now predict expected purchases for the holdout period
-    holdout_rfm['PredictedPurchases'] = bgf.predict(
+    # Now predict expected purchases for the holdout period, once per distinct triple
+    holdout_rfm['PredictedPurchases'] = predict_expected_purchases(
+        bgf,
         holdout_period,
         holdout_rfm['Frequency'],
         holdout_rfm['Recency'],
         holdout_rfm['T']
     )
 
+    # Realized future purchases when the split provides them
+    actual_column = 'HoldoutPurchases' if 'HoldoutPurchases' in holdout_rfm else 'Frequency'
+
     # Visualize predicted vs actual purchases
-    plot_predicted_vs_actual(holdout_rfm)
+    plot_predicted_vs_actual(holdout_rfm, actual_column)
 
     # Calculate and print Mean Absolute Error
-    mae = (holdout_rfm['Frequency'] - holdout_rfm['PredictedPurchases']).abs().mean()
+    mae = (holdout_rfm[actual_column] - holdout_rfm['PredictedPurchases']).abs().mean()
     print(f"Mean Absolute Error (MAE) of Predictions: {mae:.2f}")
 
-def plot_predicted_vs_actual(holdout_rfm):
+def plot_predicted_vs_actual(holdout_rfm, actual_column='Frequency'):
     """Plot predicted vs actual purchases for holdout data."""
-    plt.figure(figsize=(10, 6))
-    sns.histplot(holdout_rfm['PredictedPurchases'], color='blue', label='Predicted', kde=True, stat="density")
-    sns.histplot(holdout_rfm['Frequency'], color='orange', label='Actual', kde=True, stat="density")
-    plt.legend()
-    plt.title('Predicted vs Actual Purchases in Holdout Period')
-    plt.xlabel('Number of Purchases')
-    plt.ylabel('Density')
-    
+    # Shared bin edges keep the two densities comparable
+    values = np.concatenate([holdout_rfm['PredictedPurchases'], holdout_rfm[actual_column]])
+    edges = np.histogram_bin_edges(values[np.isfinite(values)], bins=30)
+    predicted = histogram_stats(holdout_rfm['PredictedPurchases'], bins=edges, density=True)
+    actual = histogram_stats(holdout_rfm[actual_column], bins=edges, density=True)
+
+    def draw(fig):
+        ax = fig.subplots()
+        draw_histogram(ax, predicted, color='blue', label='Predicted')
+        draw_histogram(ax, actual, color='orange', label='Actual')
+        ax.legend()
+        ax.set_title('Predicted vs Actual Purchases in Holdout Period')
+        ax.set_xlabel('Number of Purchases')
+        ax.set_ylabel('Density')
+
     # Save plot
-    plt.savefig('outputs/eda_visualizations/predicted_vs_actual.png')
-    plt.show()
+    render_figure(draw, 'outputs/eda_visualizations/predicted_vs_actual.png')
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+from models.prediction_table import params_hash
+from models.simulation_store import CustomerDistributionReducer
+
+DEFAULT_CACHE_DIR = 'outputs/forecast_cache'
+
+# Per-customer part of the cache key; the model, horizon, simulations and seed select the cache directory
+KEY_COLUMNS = ['Frequency', 'Recency', 'T']
+
+_ARRAYS = ('customer_ids', 'keys', 'totals', 'histogram', 'daily_totals', 'simulation_totals')
+
+def forecast_cache_path(bgf, days, num_simulations, seed, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Directory of the forecast cache for a model artifact, horizon, number of simulations and seed.
+
+    The artifact hash from load_model is used when available, otherwise a hash of the parameters.
+    """
+    key = {'model': getattr(bgf, 'artifact_hash_', None) or params_hash(bgf),
+           'days': days, 'num_simulations': num_simulations, 'seed': seed}
+    return os.path.join(cache_dir, hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()[:16])
+
+class ForecastCache:
+    """
+    Per-customer simulation summaries from the last run, with the run-level totals they add up to.
+
+    Each customer is stored with the (Frequency, Recency, T) triple it was simulated for, its
+    total purchases and its histogram of purchases per simulation. The per-day and
+    per-simulation totals cover all cached customers, so a customer's contribution can be
+    replaced without re-simulating anyone else.
+
+    Parameters:
+        days (int): Simulated horizon in days.
+        num_simulations (int): Number of simulation runs.
+        max_purchases (int): Last bin of the purchases-per-simulation histogram.
+    """
+
+    def __init__(self, days, num_simulations, max_purchases=31):
+        self.days = days
+        self.num_simulations = num_simulations
+        self.max_purchases = max_purchases
+        self.customer_ids = np.zeros(0, dtype=np.int64)
+        self.keys = np.zeros((0, len(KEY_COLUMNS)))
+        self.totals = np.zeros(0, dtype=np.int64)
+        self.histogram = CustomerDistributionReducer([], days, num_simulations, max_purchases).counts
+        self.daily_totals = np.zeros(days, dtype=np.int64)
+        self.simulation_totals = np.zeros(num_simulations, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.customer_ids)
+
+    def match(self, rfm_df):
+        """
+        Find each customer's cached summary.
+
+        Returns:
+            (ndarray, ndarray): Cache row of every customer in `rfm_df`, or -1 where the
+            customer is new or its (Frequency, Recency, T) changed; and the cache rows that
+            are no longer valid, i.e. changed or removed customers.
+        """
+        positions = pd.Index(self.customer_ids).get_indexer(np.asarray(rfm_df['CustomerID']))
+        found = positions >= 0
+        keys = rfm_df[KEY_COLUMNS].to_numpy(dtype=float)
+        found[found] = (self.keys[positions[found]] == keys[found]).all(axis=1)
+        positions = np.where(found, positions, -1)
+        stale = np.setdiff1d(np.arange(len(self)), positions[found])
+        return positions, stale
+
+    def save(self, path):
+        """Write the cache to a directory of .npy arrays with a JSON header."""
+        os.makedirs(path, exist_ok=True)
+        for name in _ARRAYS:
+            values = getattr(self, name)
+            # Object arrays (e.g. string IDs) would need pickling; store them as fixed-width strings
+            np.save(os.path.join(path, f'{name}.tmp.npy'), values.astype(str) if values.dtype == object else values)
+            os.replace(os.path.join(path, f'{name}.tmp.npy'), os.path.join(path, f'{name}.npy'))
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump({'days': self.days, 'num_simulations': self.num_simulations,
+                       'max_purchases': self.max_purchases, 'customers': len(self)}, f, indent=2)
+        return path
+
+    @classmethod
+    def load(cls, path, days, num_simulations):
+        """
+        Reopen a saved cache.
+
+        Returns:
+            cache (ForecastCache): The saved cache, or an empty one if nothing is stored at `path`.
+        """
+        meta_path = os.path.join(path, 'meta.json')
+        if not os.path.exists(meta_path):
+            return cls(days, num_simulations)
+        with open(meta_path) as f:
+            meta = json.load(f)
+        cache = cls(meta['days'], meta['num_simulations'], meta['max_purchases'])
+        for name in _ARRAYS:
+            setattr(cache, name, np.load(os.path.join(path, f'{name}.npy')))
+        return cache
@@ -0,0 +1,104 @@
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+import pandas as pd
+from lifetimes import BetaGeoFitter
+
+DEFAULT_ARTIFACT_PATH = 'outputs/model_artifact.json'
+ARTIFACT_VERSION = 1
+PARAM_NAMES = ['r', 'alpha', 'a', 'b']
+
+# Process-wide cache of ready-to-predict models keyed by artifact hash
+_MODEL_CACHE = {}
+
+def rfm_fingerprint(rfm_df):
+    """SHA-256 fingerprint of the (Frequency, Recency, T) training data."""
+    hashed = pd.util.hash_pandas_object(rfm_df[['Frequency', 'Recency', 'T']], index=False)
+    return hashlib.sha256(hashed.to_numpy().tobytes()).hexdigest()
+
+def fit_statistics(bgf):
+    """Fit statistics of a BetaGeoFitter fitted with lifetimes."""
+    stats = {
+        'mean_negative_log_likelihood': float(bgf._negative_log_likelihood_),
+        'customers': int(bgf.data['weights'].sum())
+    }
+    standard_errors = getattr(bgf, 'standard_errors_', None)
+    if standard_errors is not None:
+        stats['standard_errors'] = {name: float(standard_errors[name]) for name in PARAM_NAMES}
+    return stats
+
+def save_model_artifact(bgf, rfm_df, path=DEFAULT_ARTIFACT_PATH, fit_stats=None):
+    """
+    Save a fitted BG/NBD model as a JSON artifact.
+
+    The artifact holds the parameters, penalizer, a fingerprint of the training data and
+    fit statistics, which is everything needed to rebuild a ready-to-predict model.
+
+    Parameters:
+        bgf (BetaGeoFitter): Fitted model.
+        rfm_df (DataFrame): Training data with 'Frequency', 'Recency', and 'T' columns.
+        path (str): Destination of the artifact.
+        fit_stats (dict): Fit statistics; taken from the lifetimes fit if omitted.
+
+    Returns:
+        path (str): Path of the saved artifact.
+    """
+    artifact = {
+        'version': ARTIFACT_VERSION,
+        'model': 'BetaGeoFitter',
+        'params': {name: float(bgf.params_[name]) for name in PARAM_NAMES},
+        'penalizer_coef': float(bgf.penalizer_coef),
+        'training_fingerprint': rfm_fingerprint(rfm_df),
+        'fit_statistics': fit_statistics(bgf) if fit_stats is None else fit_stats,
+        'created_at': datetime.now(timezone.utc).isoformat()
+    }
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(artifact, f, indent=2)
+    os.replace(path + '.tmp', path)
+    return path
+
+def build_model(params, penalizer_coef=0.01):
+    """Build a ready-to-predict BetaGeoFitter from parameters without fitting."""
+    bgf = BetaGeoFitter(penalizer_coef=penalizer_coef)
+    bgf.params_ = pd.Series({name: float(params[name]) for name in PARAM_NAMES})
+
+    # lifetimes only binds predict during fit
+    bgf.predict = bgf.conditional_expected_number_of_purchases_up_to_time
+    return bgf
+
+def load_model(path=DEFAULT_ARTIFACT_PATH, use_cache=True):
+    """
+    Load a BG/NBD model from an artifact, reusing the process-wide cache when possible.
+
+    Parameters:
+        path (str): Path of the artifact written by save_model_artifact.
+        use_cache (bool): Whether to reuse a model already loaded from identical content.
+
+    Returns:
+        bgf (BetaGeoFitter): Ready-to-predict model. Its `artifact_` attribute holds the
+            artifact contents and `artifact_hash_` the content hash.
+    """
+    with open(path, 'rb') as f:
+        content = f.read()
+    content_hash = hashlib.sha256(content).hexdigest()
+
+    if use_cache and content_hash in _MODEL_CACHE:
+        return _MODEL_CACHE[content_hash]
+
+    artifact = json.loads(content)
+    bgf = build_model(artifact['params'], artifact['penalizer_coef'])
+    bgf.artifact_ = artifact
+    bgf.artifact_hash_ = content_hash
+
+    if use_cache:
+        _MODEL_CACHE[content_hash] = bgf
+    return bgf
+
+def clear_model_cache():
+    """Drop all models held in the process-wide cache."""
+    _MODEL_CACHE.clear()
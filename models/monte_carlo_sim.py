@@ -1,92 +1,470 @@
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from lifetimes import BetaGeoFitter
+from concurrent.futures import ProcessPoolExecutor
 import sys
+from models.model_store import load_model
+from models.prediction_table import predict_expected_purchases
+from utils.plotting import draw_histogram, histogram_stats, render_figure
+from utils.schema import compact_counts
+from models.simulation_store import (DailyTotalsReducer, HorizonTotalsReducer, RawDrawStore, SimulationTotalsReducer,
+                                     create_reducers, save_simulation_summary)
+from models.forecast_cache import DEFAULT_CACHE_DIR, ForecastCache, forecast_cache_path
 
-def monte_carlo_simulation(rfm_df, days=180, num_simulations=1000):
+# Beta distribution used to scale each customer's daily purchase rate per simulation
+VARIABILITY_A = 2
+VARIABILITY_B = 5
+
+# Upper bound on simulated (simulation x customer x day) cells held in memory at once
+DEFAULT_MAX_CHUNK_CELLS = 2 ** 24
+
+# Horizons, in days, of the default multi-horizon forecast
+DEFAULT_HORIZONS = (30, 90, 180, 365)
+
+# Simulations per block; each block has its own random stream, so this also sets the
+# granularity at which simulations can be spread across workers
+SIMULATIONS_PER_BLOCK = 16
+
+def simulation_blocks(num_customers, days, num_simulations, max_chunk_cells=DEFAULT_MAX_CHUNK_CELLS):
+    """
+    Partition a simulation run into memory-bounded (simulation, customer) blocks.
+
+    The layout depends only on the problem size and `max_chunk_cells`, never on the number
+    of workers, so a block's random stream is the same however the blocks are distributed.
+
+    Returns:
+        blocks (list): (sim_start, sim_stop, customer_start, customer_stop) tuples in a fixed order.
+    """
+    customers_per_block = min(max(1, num_customers), max(1, max_chunk_cells // days))
+    sims_per_block = min(SIMULATIONS_PER_BLOCK,
+                         max(1, max_chunk_cells // (customers_per_block * days)))
+    return [
+        (sim_start, min(sim_start + sims_per_block, num_simulations),
+         customer_start, min(customer_start + customers_per_block, num_customers))
+        for sim_start in range(0, num_simulations, sims_per_block)
+        for customer_start in range(0, num_customers, customers_per_block)
+    ]
+
+def simulate_purchase_chunks(expected_purchases, days, num_simulations,
+                             max_chunk_cells=DEFAULT_MAX_CHUNK_CELLS, seed=None, block_ids=None):
+    """
+    Draw daily purchase counts for every simulation, customer and day in memory-bounded chunks.
+
+    Each simulation scales a customer's daily Poisson rate by (1 + v), with v ~ Beta(2, 5)
+    drawn once per customer and simulation. Every block from `simulation_blocks` draws from
+    its own generator spawned from `seed`, so any subset of blocks can be simulated
+    independently and still reproduce the draws of a full run.
+
+    Parameters:
+        expected_purchases (array-like): Expected purchases per customer over the full period,
+            spread evenly over the days, or a (customers, days) array of expected purchases
+            on each day.
+        days (int): Number of days to simulate.
+        num_simulations (int): Number of simulation runs.
+        max_chunk_cells (int): Maximum number of simulated cells drawn per chunk.
+        seed (int or SeedSequence): Root seed; fresh entropy is used if omitted.
+        block_ids (iterable): Indices of the blocks to simulate; all blocks if omitted.
+
+    Yields:
+        (int, int, ndarray): Zero-based index of the first simulation and first customer in
+        the chunk, and the purchase counts with shape (simulations, customers, days).
+    """
+    expected_purchases = np.asarray(expected_purchases, dtype=float)
+    daily_rate = expected_purchases[:, None] / days if expected_purchases.ndim == 1 else expected_purchases
+    blocks = simulation_blocks(len(daily_rate), days, num_simulations, max_chunk_cells)
+    seed_seq = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    streams = seed_seq.spawn(len(blocks))
+
+    for block_id in (range(len(blocks)) if block_ids is None else block_ids):
+        sim_start, sim_stop, customer_start, customer_stop = blocks[block_id]
+        rng = np.random.default_rng(streams[block_id])
+        rate = daily_rate[customer_start:customer_stop]
+        variability = rng.beta(VARIABILITY_A, VARIABILITY_B, size=(sim_stop - sim_start, len(rate)))
+        adjusted_lambda = rate * (1 + variability)[:, :, None]
+        purchases = rng.poisson(adjusted_lambda, size=(sim_stop - sim_start, len(rate), days))
+        yield sim_start, customer_start, purchases
+
+def _simulate_shard(expected_purchases, days, num_simulations, max_chunk_cells, seed, block_ids, reducers):
+    """Run a subset of blocks into fresh partial reducers; executed inside worker processes."""
+    for sim_start, customer_start, purchases in simulate_purchase_chunks(
+            expected_purchases, days, num_simulations, max_chunk_cells, seed, block_ids):
+        for reducer in reducers:
+            reducer.update(sim_start, purchases, customer_start)
+    for reducer in reducers:
+        reducer.flush()
+    return reducers
+
+def simulate_customer_chunks(expected_purchases, customer_ids, days, num_simulations, seed,
+                             max_chunk_cells=DEFAULT_MAX_CHUNK_CELLS, start=0, stop=None):
+    """
+    Draw daily purchase counts with one random stream per customer.
+
+    Uses the same model as simulate_purchase_chunks, but each customer's generator is seeded
+    from `seed` and a hash of the customer ID, so a customer's draws do not depend on which
+    other customers are simulated with it. The forecast cache relies on this to re-simulate
+    only changed customers.
+
+    Parameters:
+        expected_purchases (array-like): Expected purchases per customer over the full period.
+        customer_ids (array-like): Customer IDs aligned with `expected_purchases`.
+        days (int): Number of days to simulate.
+        num_simulations (int): Number of simulation runs.
+        seed (int): Root seed shared by all customer streams.
+        max_chunk_cells (int): Maximum number of simulated cells drawn per chunk.
+        start, stop (int): Range of customers to simulate; all customers if omitted.
+
+    Yields:
+        (int, int, ndarray): 0, the zero-based index of the first customer in the chunk, and
+        the purchase counts with shape (simulations, customers, days).
+    """
+    daily_rate = np.asarray(expected_purchases, dtype=float) / days
+    customer_hashes = pd.util.hash_pandas_object(pd.Series(np.asarray(customer_ids)), index=False).to_numpy()
+    stop = len(daily_rate) if stop is None else stop
+    customers_per_chunk = max(1, max_chunk_cells // (num_simulations * days))
+
+    for customer_start in range(start, stop, customers_per_chunk):
+        chunk = []
+        for position in range(customer_start, min(customer_start + customers_per_chunk, stop)):
+            rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(int(customer_hashes[position]),)))
+            variability = rng.beta(VARIABILITY_A, VARIABILITY_B, size=num_simulations)
+            adjusted_lambda = daily_rate[position] * (1 + variability)
+            chunk.append(rng.poisson(adjusted_lambda[:, None], size=(num_simulations, days)))
+        yield 0, customer_start, np.stack(chunk, axis=1)
+
+def _simulate_customer_shard(expected_purchases, customer_ids, days, num_simulations, seed,
+                             max_chunk_cells, start, stop, reducers):
+    """Run a range of customers into fresh partial reducers; executed inside worker processes."""
+    for sim_start, customer_start, purchases in simulate_customer_chunks(
+            expected_purchases, customer_ids, days, num_simulations, seed, max_chunk_cells, start, stop):
+        for reducer in reducers:
+            reducer.update(sim_start, purchases, customer_start)
+    return reducers
+
+def _simulate_customers(expected_purchases, customer_ids, days, num_simulations, seed,
+                        max_chunk_cells, workers, reducers):
+    """Feed per-customer-stream draws for all given customers into `reducers`, optionally in parallel."""
+    num_customers = len(customer_ids)
+    if workers > 1 and num_customers > 1:
+        bounds = np.linspace(0, num_customers, min(num_customers, workers * 4) + 1).astype(int)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(_simulate_customer_shard, expected_purchases, customer_ids, days,
+                                num_simulations, seed, max_chunk_cells, start, stop,
+                                [reducer.spawn() for reducer in reducers])
+                for start, stop in zip(bounds[:-1], bounds[1:])
+            ]
+            for future in futures:
+                for reducer, partial in zip(reducers, future.result()):
+                    reducer.merge(partial)
+    else:
+        _simulate_customer_shard(expected_purchases, customer_ids, days, num_simulations, seed,
+                                 max_chunk_cells, 0, num_customers, reducers)
+    return reducers
+
+def incremental_monte_carlo_simulation(rfm_df, days=180, num_simulations=1000, seed=42,
+                                       cache_dir=DEFAULT_CACHE_DIR, max_chunk_cells=DEFAULT_MAX_CHUNK_CELLS,
+                                       workers=1, output_dir='outputs', bgf=None):
+    """
+    Monte Carlo forecast that re-simulates only customers whose inputs changed since the last run.
+
+    Summaries are cached per customer under a directory keyed by the model artifact, horizon,
+    number of simulations and seed, together with the customer's (Frequency, Recency, T).
+    Customers with an unchanged key reuse their cached totals and purchase histogram. The
+    previous draws of changed and removed customers are regenerated from their old keys and
+    subtracted from the cached per-day and per-simulation totals, and the new draws added,
+    so the cost of a refresh scales with the number of changed customers. Results are
+    identical to simulating every customer from scratch with simulate_customer_chunks.
+
+    Parameters:
+        rfm_df (DataFrame): DataFrame with 'CustomerID', 'Frequency', 'Recency', and 'T' columns.
+        days (int): Number of days to simulate future purchases.
+        num_simulations (int): Number of simulation runs.
+        seed (int): Root seed of the per-customer random streams; required for caching.
+        cache_dir (str): Directory holding the forecast caches.
+        max_chunk_cells (int): Maximum number of simulated cells held in memory per chunk.
+        workers (int): Number of worker processes used to simulate changed customers.
+        output_dir (str): Directory in which the reduced results are saved.
+        bgf (BetaGeoFitter): Fitted model; loaded from the model artifact if omitted.
+
+    Returns:
+        simulation_summary (dict): Reduced results keyed by reducer name, as from monte_carlo_simulation.
+    """
+    if seed is None or isinstance(seed, np.random.SeedSequence):
+        raise ValueError("Incremental forecasting needs an integer seed.")
+    bgf = load_model() if bgf is None else bgf
+    path = forecast_cache_path(bgf, days, num_simulations, seed, cache_dir)
+    cache = ForecastCache.load(path, days, num_simulations)
+
+    positions, stale = cache.match(rfm_df)
+    changed = np.flatnonzero(positions < 0)
+    print(f"Forecast cache: re-simulating {len(changed)} of {len(rfm_df)} customers "
+          f"({len(rfm_df) - len(changed)} reused, {len(stale)} stale).")
+
+    # New draws for changed and new customers
+    changed_rfm = rfm_df.iloc[changed]
+    changed_ids = changed_rfm['CustomerID'].to_numpy()
+    fresh = {reducer.name: reducer for reducer in _simulate_customers(
+        expected_purchases(changed_rfm, days, bgf), changed_ids, days, num_simulations, seed,
+        max_chunk_cells, workers, create_reducers(changed_ids, days, num_simulations))}
+
+    # Previous draws of stale customers, to take out of the run-level totals
+    stale_rfm = pd.DataFrame(cache.keys[stale], columns=['Frequency', 'Recency', 'T'])
+    removed = {reducer.name: reducer for reducer in _simulate_customers(
+        expected_purchases(stale_rfm, days, bgf), cache.customer_ids[stale], days, num_simulations, seed,
+        max_chunk_cells, workers,
+        create_reducers(cache.customer_ids[stale], days, num_simulations,
+                        (DailyTotalsReducer, SimulationTotalsReducer)))}
+
+    customer_ids = rfm_df['CustomerID'].to_numpy()
+    summary = {reducer.name: reducer for reducer in create_reducers(customer_ids, days, num_simulations)}
+    reused = positions >= 0
+    for name, attribute, cached in (('customer_totals', 'totals', cache.totals),
+                                    ('customer_distribution', 'counts', cache.histogram)):
+        merged = getattr(summary[name], attribute)
+        merged[reused] = cached[positions[reused]]
+        merged[changed] = getattr(fresh[name], attribute)
+    for name, cached in (('daily_totals', cache.daily_totals), ('simulation_totals', cache.simulation_totals)):
+        summary[name].totals = cached - removed[name].totals + fresh[name].totals
+
+    cache.customer_ids = customer_ids
+    cache.keys = rfm_df[['Frequency', 'Recency', 'T']].to_numpy(dtype=float)
+    cache.totals = summary['customer_totals'].totals
+    cache.histogram = summary['customer_distribution'].counts
+    cache.daily_totals = summary['daily_totals'].totals
+    cache.simulation_totals = summary['simulation_totals'].totals
+    cache.save(path)
+
+    simulation_summary = {name: reducer.to_frame() for name, reducer in summary.items()}
+    for name, path in save_simulation_summary(simulation_summary, output_dir).items():
+        print(f"Simulation {name.replace('_', ' ')} saved to '{path}'.")
+    return simulation_summary
+
+def expected_purchases(rfm_df, days, bgf=None):
+    """Expected purchases per customer over `days` from the BG/NBD conditional expectation."""
+    bgf = load_model() if bgf is None else bgf
+    # Evaluated once per distinct (Frequency, Recency, T) triple and gathered per customer
+    return predict_expected_purchases(bgf, days, rfm_df['Frequency'], rfm_df['Recency'], rfm_df['T'])
+
+def expected_purchases_by_horizon(rfm_df, horizons, bgf=None):
+    """
+    Expected purchases per customer up to each horizon, in one vectorized evaluation.
+
+    The conditional expectation is broadcast over the distinct (Frequency, Recency, T)
+    triples and all horizons at once, then gathered per customer.
+
+    Returns:
+        expected (ndarray): Shape (customers, horizons).
+    """
+    bgf = load_model() if bgf is None else bgf
+    triples, inverse = np.unique(rfm_df[['Frequency', 'Recency', 'T']].to_numpy(dtype=float),
+                                 axis=0, return_inverse=True)
+    expected = bgf.conditional_expected_number_of_purchases_up_to_time(
+        np.asarray(horizons, dtype=float)[None, :], triples[:, :1], triples[:, 1:2], triples[:, 2:3])
+    return np.asarray(expected)[inverse.ravel()]
+
+def analytic_purchase_moments(rfm_df, days=180, num_simulations=1000, bgf=None):
+    """
+    Closed-form mean and variance of the purchases monte_carlo_simulation sums per customer.
+
+    Given v ~ Beta(2, 5), one simulation's total over the period is Poisson(mu * (1 + v)),
+    where mu is the BG/NBD conditional expectation. Its mean is mu * E[1 + v] and its
+    variance mu * E[1 + v] + mu^2 * Var(v); simulations are independent, so both scale
+    with `num_simulations`.
+
+    Parameters:
+        rfm_df (DataFrame): DataFrame with 'Frequency', 'Recency', and 'T' columns.
+        days (int or array-like): Forecast period in days, or several horizons.
+        num_simulations (int): Number of simulations the totals are summed over.
+        bgf (BetaGeoFitter): Fitted model; loaded from the model artifact if omitted.
+
+    Returns:
+        (ndarray, ndarray): Expected total purchases and their variance per customer, with
+        one column per horizon when `days` is array-like.
+    """
+    if np.ndim(days):
+        mu = expected_purchases_by_horizon(rfm_df, days, bgf)
+    else:
+        mu = expected_purchases(rfm_df, days, bgf)
+    total = VARIABILITY_A + VARIABILITY_B
+    variability_mean = VARIABILITY_A / total
+    variability_var = VARIABILITY_A * VARIABILITY_B / (total ** 2 * (total + 1))
+
+    mean = mu * (1 + variability_mean)
+    variance = mean + mu ** 2 * variability_var
+    return num_simulations * mean, num_simulations * variance
+
+def _run_simulation(expected_purchases, days, num_simulations, max_chunk_cells, seed, workers, reducers):
+    """Simulate every block into `reducers`, sharding blocks across a process pool when workers > 1."""
+    # Resolve the root seed once so every shard spawns from the same sequence
+    seed_seq = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    num_blocks = len(simulation_blocks(len(expected_purchases), days, num_simulations, max_chunk_cells))
+
+    if workers > 1 and num_blocks > 1:
+        # Several shards per worker keeps the pool busy when blocks finish unevenly
+        shards = np.array_split(np.arange(num_blocks), min(num_blocks, workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(_simulate_shard, expected_purchases, days, num_simulations,
+                                max_chunk_cells, seed_seq, shard.tolist(),
+                                [reducer.spawn() for reducer in reducers])
+                for shard in shards
+            ]
+            for completed, future in enumerate(futures, start=1):
+                for reducer, partial in zip(reducers, future.result()):
+                    reducer.merge(partial)
+
+                # Inline progress update
+                sys.stdout.write(f'\rShard {completed}/{len(shards)} complete...')
+                sys.stdout.flush()
+    else:
+        for sim_start, customer_start, purchases in simulate_purchase_chunks(
+                expected_purchases, days, num_simulations, max_chunk_cells, seed_seq):
+            for reducer in reducers:
+                reducer.update(sim_start, purchases, customer_start)
+
+            # Inline progress update
+            sys.stdout.write(f'\rSimulation {sim_start + purchases.shape[0]}/{num_simulations} in progress...')
+            sys.stdout.flush()
+    return reducers
+
+def monte_carlo_simulation(rfm_df, days=180, num_simulations=1000,
+                           max_chunk_cells=DEFAULT_MAX_CHUNK_CELLS, seed=None, workers=1,
+                           reducers=None, raw_draws_path=None, output_dir='outputs', bgf=None, cache_dir=None):
     """
     Perform Monte Carlo simulations to forecast future purchases with enhanced variability.
+
+    Draws are reduced online while simulating, so only per-customer, per-day and
+    per-simulation totals and a per-customer histogram of purchases per simulation are
+    kept unless a raw draw store is requested. With several
+    workers, simulation blocks are sharded across a process pool and only the partial
+    reductions are sent back and merged; results are identical for a given seed
+    regardless of the number of workers.
     
     Parameters:
         rfm_df (DataFrame): DataFrame with 'Frequency', 'Recency', and 'T' columns.
         days (int): Number of days to simulate future purchases.
         num_simulations (int): Number of simulation runs.
+        max_chunk_cells (int): Maximum number of simulated cells held in memory per chunk.
+        seed (int or SeedSequence): Root seed for the per-block random streams.
+        workers (int): Number of worker processes used to run the simulation.
+        reducers (list): SimulationReducer instances to feed; defaults to customer, daily
+            and simulation totals.
+        raw_draws_path (str): Optional directory in which raw draws are persisted as a
+            memory-mapped array.
+        output_dir (str): Directory in which the reduced results are saved.
+        bgf (BetaGeoFitter): Fitted model; loaded from the model artifact if omitted.
+        cache_dir (str): Optional forecast cache directory. When given, the run goes through
+            incremental_monte_carlo_simulation with per-customer random streams and only
+            customers whose inputs changed since the last run are re-simulated.
     
     Returns:
-        daily_simulation_results (DataFrame): Simulated daily purchases for all customers.
+        simulation_summary (dict): Reduced results keyed by reducer name
+            ('customer_totals', 'daily_totals', 'simulation_totals', 'customer_distribution').
     """
-    # Load model parameters
-    params_df = pd.read_csv('outputs/model_parameters.csv', index_col=0)
-    params = params_df['parameters'].to_dict()
-
-    # Reinitialize BG/NBD model
-    bgf = BetaGeoFitter(penalizer_coef=0.01)
-    dummy_data = pd.DataFrame({'frequency': [0], 'recency': [0], 'T': [1]})
-    bgf.fit(dummy_data['frequency'], dummy_data['recency'], dummy_data['T'])
-    bgf.params_ = params
-
     print(f"Starting Monte Carlo Simulation: Simulating purchases {days} days into the future.")
     print(f"Total Simulations: {num_simulations}\n")
 
-    # Initialize DataFrame to store daily purchases
-    all_simulations = []
-
-    for sim in range(1, num_simulations + 1):
-        # Simulate expected total purchases for each customer over the period
-        total_purchases = bgf.conditional_expected_number_of_purchases_up_to_time(
-            days,
-            rfm_df['Frequency'],
-            rfm_df['Recency'],
-            rfm_df['T']
-        )
-
-        # For each customer, simulate when purchases occur using Poisson distribution with added variability
-        daily_purchases = []
-        for customer_id, expected_purchases in zip(rfm_df['CustomerID'], total_purchases):
-            # Introduce variability with a Beta distribution scaling factor
-            variability_factor = np.random.beta(a=2, b=5)  # Skews towards lower values but allows for bursts
-            adjusted_lambda = (expected_purchases / days) * (1 + variability_factor)
-
-            # Simulate number of purchases per day using Poisson process with noise
-            purchases_per_day = np.random.poisson(lam=adjusted_lambda, size=days)
-
-            customer_data = pd.DataFrame({
-                'CustomerID': customer_id,
-                'Day': np.arange(1, days + 1),
-                'PurchasesToday': purchases_per_day
-            })
-            daily_purchases.append(customer_data)
-
-        # Concatenate all customers' data for this simulation
-        simulation_df = pd.concat(daily_purchases, ignore_index=True)
-        simulation_df['Simulation'] = sim
-        all_simulations.append(simulation_df)
-
-        # Inline progress update
-        sys.stdout.write(f'\rSimulation {sim}/{num_simulations} in progress...')
-        sys.stdout.flush()
+    if cache_dir is not None:
+        if reducers is not None or raw_draws_path is not None:
+            raise ValueError("Custom reducers and raw draws are not supported with a forecast cache.")
+        return incremental_monte_carlo_simulation(rfm_df, days, num_simulations, seed, cache_dir,
+                                                  max_chunk_cells, workers, output_dir, bgf)
+
+    # Expected total purchases per customer do not change between simulations
+    total_purchases = expected_purchases(rfm_df, days, bgf)
+
+    customer_ids = rfm_df['CustomerID'].to_numpy()
+    if reducers is None:
+        reducers = create_reducers(customer_ids, days, num_simulations)
+    if raw_draws_path is not None:
+        reducers = list(reducers) + [RawDrawStore(customer_ids, days, num_simulations, raw_draws_path)]
+
+    _run_simulation(total_purchases, days, num_simulations, max_chunk_cells, seed, workers, reducers)
 
     print("\nSimulation complete. Processing results...")
 
-    # Combine all simulation results into one DataFrame
-    daily_simulation_results = pd.concat(all_simulations, ignore_index=True)
+    simulation_summary = {}
+    for reducer in reducers:
+        if isinstance(reducer, RawDrawStore):
+            reducer.flush()
+            print(f"Raw simulation draws saved to '{reducer.path}'.")
+        else:
+            simulation_summary[reducer.name] = reducer.to_frame()
+
+    # Save reduced simulation results
+    for name, path in save_simulation_summary(simulation_summary, output_dir).items():
+        print(f"Simulation {name.replace('_', ' ')} saved to '{path}'.")
 
-    # Save daily simulation results
-    daily_simulation_results.to_csv('outputs/iterative_purchase_simulations.csv', index=False)
+    return simulation_summary
 
-    print("Daily simulation results saved to 'outputs/iterative_purchase_simulations.csv'.")
+def forecast_horizons(rfm_df, horizons=DEFAULT_HORIZONS, num_simulations=1000,
+                      max_chunk_cells=DEFAULT_MAX_CHUNK_CELLS, seed=None, workers=1, output_dir='outputs', bgf=None):
+    """
+    Forecast purchases at several horizons from one simulation to the longest horizon.
+
+    Each day is simulated with the model's expected purchases for that day, the increment of
+    the conditional expectation, rather than an even share of one period's total. Prefix sums
+    of the draws therefore match the model at every horizon, and each shorter horizon is
+    read off the same pass instead of being simulated again. Analytic means and variances
+    of the totals are computed for all horizons in one vectorized evaluation.
 
-    return daily_simulation_results
+    Parameters:
+        rfm_df (DataFrame): DataFrame with 'CustomerID', 'Frequency', 'Recency', and 'T' columns.
+        horizons (iterable): Forecast horizons in days.
+        num_simulations (int): Number of simulation runs.
+        max_chunk_cells (int): Maximum number of simulated cells held in memory per chunk.
+        seed (int or SeedSequence): Root seed for the per-block random streams.
+        workers (int): Number of worker processes used to run the simulation.
+        output_dir (str): Directory in which the results are saved.
+        bgf (BetaGeoFitter): Fitted model; loaded from the model artifact if omitted.
+
+    Returns:
+        simulation_summary (dict): 'horizon_totals', one row per horizon and customer with
+            the simulated total ('PurchasesToday') and its analytic 'ExpectedPurchases' and
+            'PurchasesVariance', and 'daily_horizons', simulated purchases per day up to the
+            longest horizon with the first 'Horizon' each day falls within. Both can be
+            passed to calculate_clv and plot_purchase_trends respectively.
+    """
+    horizons = np.unique(np.asarray(horizons, dtype=np.int64))
+    days = int(horizons.max())
+    bgf = load_model() if bgf is None else bgf
+    print(f"Starting Monte Carlo Simulation: Simulating purchases {days} days into the future "
+          f"for horizons {', '.join(str(horizon) for horizon in horizons)}.")
+    print(f"Total Simulations: {num_simulations}\n")
+
+    # Expected purchases on each day from the cumulative expectation at every day
+    cumulative = expected_purchases_by_horizon(rfm_df, np.arange(1, days + 1), bgf)
+    daily_expected = np.diff(cumulative, axis=1, prepend=0)
+
+    customer_ids = rfm_df['CustomerID'].to_numpy()
+    horizon_reducer = HorizonTotalsReducer(customer_ids, days, num_simulations, horizons)
+    daily_reducer = DailyTotalsReducer(customer_ids, days, num_simulations)
+    _run_simulation(daily_expected, days, num_simulations, max_chunk_cells, seed, workers,
+                    [horizon_reducer, daily_reducer])
+    print("\nSimulation complete. Processing results...")
+
+    horizon_totals = horizon_reducer.to_frame()
+    mean, variance = analytic_purchase_moments(rfm_df, horizons, num_simulations, bgf)
+    horizon_totals['ExpectedPurchases'] = mean.T.ravel()
+    horizon_totals['PurchasesVariance'] = variance.T.ravel()
+
+    daily_horizons = daily_reducer.to_frame()
+    daily_horizons.insert(0, 'Horizon', compact_counts(horizons[np.searchsorted(horizons, daily_horizons['Day'])]))
+
+    simulation_summary = {'horizon_totals': horizon_totals, 'daily_horizons': daily_horizons}
+    for name, path in save_simulation_summary(simulation_summary, output_dir).items():
+        print(f"Simulation {name.replace('_', ' ')} saved to '{path}'.")
+    return simulation_summary
 
 def plot_simulation_results(simulation_results):
     """Plot the distribution of average simulated purchases."""
-    plt.figure(figsize=(10, 6))
-    plt.hist(simulation_results['AverageSimulatedPurchases'], bins=30, color='purple', alpha=0.7)
-    plt.title('Monte Carlo Simulation: Average Future Purchases')
-    plt.xlabel('Average Number of Purchases')
-    plt.ylabel('Number of Customers')
-    
+    stats = histogram_stats(simulation_results['AverageSimulatedPurchases'], bins=30, kde=False)
+
+    def draw(fig):
+        ax = fig.subplots()
+        draw_histogram(ax, stats, color='purple', alpha=0.7)
+        ax.set_title('Monte Carlo Simulation: Average Future Purchases')
+        ax.set_xlabel('Average Number of Purchases')
+        ax.set_ylabel('Number of Customers')
+
     # Save plot
-    plt.savefig('outputs/eda_visualizations/monte_carlo_simulation.png')
-    plt.show()
+    render_figure(draw, 'outputs/eda_visualizations/monte_carlo_simulation.png')
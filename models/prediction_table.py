@@ -0,0 +1,229 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+from models.model_store import PARAM_NAMES
+
+DEFAULT_TABLE_DIR = 'outputs/prediction_tables'
+
+# Bits per field of the packed (Frequency, Recency, T) key
+_RECENCY_BITS = 21
+_T_BITS = 21
+_MAX_FREQUENCY = 2 ** (63 - _RECENCY_BITS - _T_BITS) - 1
+_MAX_DAYS = 2 ** _T_BITS - 1
+
+# Process-wide tables keyed by (parameter hash, horizon), least recently used first
+MAX_CACHED_TABLES = 16
+_TABLES = OrderedDict()
+_TABLES_LOCK = threading.Lock()
+
+def params_hash(bgf):
+    """SHA-256 of a model's parameters; any change to them gives a new prediction table."""
+    params = {name: float(bgf.params_[name]) for name in PARAM_NAMES}
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+def _pack(frequency, recency, T):
+    """
+    Pack integer (Frequency, Recency, T) triples into sortable int64 keys.
+
+    Returns:
+        keys (ndarray or None): Packed keys, or None if any value is not a non-negative
+        integer within the packable range.
+    """
+    values = [np.asarray(column) for column in (frequency, recency, T)]
+    as_int = [column.astype(np.int64) for column in values]
+    for column, integers, limit in zip(values, as_int, (_MAX_FREQUENCY, _MAX_DAYS, _MAX_DAYS)):
+        if len(column) and ((integers != column).any() or integers.min() < 0 or integers.max() > limit):
+            return None
+    frequency, recency, T = as_int
+    return (frequency << (_RECENCY_BITS + _T_BITS)) | (recency << _T_BITS) | T
+
+def _unpack(keys):
+    T = keys & _MAX_DAYS
+    recency = (keys >> _T_BITS) & (2 ** _RECENCY_BITS - 1)
+    frequency = keys >> (_RECENCY_BITS + _T_BITS)
+    return frequency, recency, T
+
+class PredictionTable:
+    """
+    Expected purchases and probability alive per distinct integer (Frequency, Recency, T) triple.
+
+    Predictions for one parameter set and horizon are evaluated once per distinct triple and
+    stored as sorted packed keys with aligned value arrays, so batch lookups are a binary
+    search and a gather. Triples not yet in the table are evaluated on first lookup and
+    added; probability alive is only evaluated once a lookup asks for it (NaN until then).
+    Tables can be saved to a directory and reopened memory-mapped.
+
+    Parameters:
+        bgf (BetaGeoFitter): Fitted model used to evaluate new triples.
+        horizon (float): Days over which expected purchases are predicted.
+    """
+
+    def __init__(self, bgf, horizon):
+        self.bgf = bgf
+        self.horizon = horizon
+        self.params_hash = params_hash(bgf)
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.expected = np.zeros(0)
+        self.alive = np.zeros(0)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _evaluate_expected(self, frequency, recency, T):
+        expected = self.bgf.conditional_expected_number_of_purchases_up_to_time(self.horizon, frequency, recency, T)
+        return np.asarray(expected, dtype=float)
+
+    def _evaluate_alive(self, frequency, recency, T):
+        return np.asarray(self.bgf.conditional_probability_alive(frequency, recency, T), dtype=float)
+
+    def _snapshot(self):
+        """Keys and values as one consistent set, even while another thread inserts."""
+        with self._lock:
+            return self.keys, self.expected, self.alive
+
+    def _insert(self, new_keys, probability_alive=True):
+        """Evaluate and add keys that are not in the table yet."""
+        with self._lock:
+            new_keys = np.setdiff1d(new_keys, self.keys)
+            if not len(new_keys):
+                return
+            triples = [column.astype(float) for column in _unpack(new_keys)]
+            expected = self._evaluate_expected(*triples)
+            alive = self._evaluate_alive(*triples) if probability_alive else np.full(len(new_keys), np.nan)
+            keys = np.concatenate([self.keys, new_keys])
+            order = np.argsort(keys, kind='stable')
+            self.keys = keys[order]
+            self.expected = np.concatenate([self.expected, expected])[order]
+            self.alive = np.concatenate([self.alive, alive])[order]
+
+    def _fill_alive(self, keys):
+        """Evaluate probability alive for table keys added without it."""
+        with self._lock:
+            positions = np.searchsorted(self.keys, keys)
+            positions = positions[np.isnan(self.alive[positions])]
+            if len(positions):
+                # Replace rather than modify the array, which may be memory-mapped or in use by a snapshot
+                alive = np.array(self.alive)
+                alive[positions] = self._evaluate_alive(*(column.astype(float) for column in _unpack(self.keys[positions])))
+                self.alive = alive
+
+    def lookup(self, frequency, recency, T, probability_alive=True):
+        """
+        Predictions for a batch of customers.
+
+        Non-integer inputs are evaluated directly rather than through the table.
+
+        Returns:
+            (ndarray, ndarray): Expected purchases over the horizon and probability alive, or
+            None instead of the latter when `probability_alive` is False.
+        """
+        keys = _pack(frequency, recency, T)
+        if keys is None:
+            triples = [np.asarray(column, dtype=float) for column in (frequency, recency, T)]
+            return self._evaluate_expected(*triples), self._evaluate_alive(*triples) if probability_alive else None
+
+        table_keys, expected, alive = self._snapshot()
+        positions = np.searchsorted(table_keys, keys)
+        found = positions < len(table_keys)
+        found[found] = table_keys[positions[found]] == keys[found]
+        if not found.all():
+            self._insert(np.unique(keys[~found]), probability_alive)
+            table_keys, expected, alive = self._snapshot()
+            positions = np.searchsorted(table_keys, keys)
+        if not probability_alive:
+            return expected[positions], None
+
+        missing = np.isnan(alive[positions])
+        if missing.any():
+            self._fill_alive(np.unique(keys[missing]))
+            table_keys, expected, alive = self._snapshot()
+        return expected[positions], alive[positions]
+
+    def save(self, path):
+        """Write the table to a directory of .npy arrays with a JSON header."""
+        os.makedirs(path, exist_ok=True)
+        for name in ('keys', 'expected', 'alive'):
+            np.save(os.path.join(path, f'{name}.npy'), getattr(self, name))
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump({'params_hash': self.params_hash, 'horizon': self.horizon, 'triples': len(self)}, f, indent=2)
+        return path
+
+    @classmethod
+    def load(cls, path, bgf, mmap_mode='r'):
+        """
+        Reopen a saved table for `bgf`, memory-mapped by default.
+
+        Returns:
+            table (PredictionTable or None): The table, or None if it was built for other parameters.
+        """
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        table = cls(bgf, meta['horizon'])
+        if meta['params_hash'] != table.params_hash:
+            return None
+        for name in ('keys', 'expected', 'alive'):
+            setattr(table, name, np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode))
+        return table
+
+def table_path(bgf, horizon, table_dir=DEFAULT_TABLE_DIR):
+    """Directory of the saved table for a parameter set and horizon."""
+    return os.path.join(table_dir, f'{params_hash(bgf)[:16]}-{horizon:g}')
+
+def get_prediction_table(bgf, horizon, table_dir=None):
+    """
+    Process-wide prediction table for a model's parameters and a horizon.
+
+    Tables are keyed by the parameter hash, so a refitted model never reuses stale values.
+    At most MAX_CACHED_TABLES tables are kept; the least recently used one is dropped first.
+
+    Parameters:
+        bgf (BetaGeoFitter): Fitted model.
+        horizon (float): Prediction horizon in days.
+        table_dir (str): Directory to reopen a saved table from, if one exists there.
+
+    Returns:
+        table (PredictionTable): Shared table for (parameters, horizon).
+    """
+    key = (params_hash(bgf), float(horizon))
+    with _TABLES_LOCK:
+        table = _TABLES.get(key)
+        if table is not None:
+            _TABLES.move_to_end(key)
+            return table
+
+        path = table_path(bgf, horizon, table_dir) if table_dir is not None else None
+        if path is not None and os.path.exists(os.path.join(path, 'meta.json')):
+            table = PredictionTable.load(path, bgf)
+        if table is None:
+            table = PredictionTable(bgf, horizon)
+        _TABLES[key] = table
+        while len(_TABLES) > MAX_CACHED_TABLES:
+            _TABLES.popitem(last=False)
+        return table
+
+def build_prediction_table(rfm_df, horizon, bgf, table_dir=DEFAULT_TABLE_DIR):
+    """
+    Precompute predictions for every distinct triple in `rfm_df` and save the table.
+
+    Returns:
+        path (str): Directory of the saved table, for get_prediction_table(table_dir=...)
+        or the scoring service's --table-dir.
+    """
+    table = get_prediction_table(bgf, horizon)
+    table.lookup(rfm_df['Frequency'], rfm_df['Recency'], rfm_df['T'])
+    path = table.save(table_path(bgf, horizon, table_dir))
+    print(f"Prediction table with {len(table)} distinct triples saved to '{path}'.")
+    return path
+
+def predict_expected_purchases(bgf, horizon, frequency, recency, T):
+    """Expected purchases over `horizon` per customer, gathered from the shared prediction table."""
+    return get_prediction_table(bgf, horizon).lookup(frequency, recency, T, probability_alive=False)[0]
+
+def clear_prediction_tables():
+    """Drop all tables held in the process-wide cache."""
+    with _TABLES_LOCK:
+        _TABLES.clear()
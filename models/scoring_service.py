@@ -0,0 +1,306 @@
+"""
+Low-latency scoring service for per-customer BG/NBD predictions.
+
+Run a local instance with:
+
+    python -m models.scoring_service --port 8080
+
+Endpoints:
+    POST /score        {"Frequency": 3, "Recency": 120, "T": 300, "MonetaryValue": 45.0, "horizon": 90}
+    POST /score/batch  {"customers": [{...}, ...], "horizon": 90}
+    GET  /metrics      request, batch and latency counters
+    GET  /health
+"""
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+import numpy as np
+from models.model_store import DEFAULT_ARTIFACT_PATH, load_model
+from models.prediction_table import get_prediction_table
+
+DEFAULT_HORIZON = 90
+MAX_BODY_BYTES = 64 * 1024 * 1024
+REQUIRED_FIELDS = ('Frequency', 'Recency', 'T')
+
+class ScoringService:
+    """
+    Micro-batching scorer around a loaded BG/NBD model.
+
+    Concurrent requests are queued and scored together in one vectorized call once
+    `max_batch_size` customers are waiting or `max_wait_ms` has passed.
+
+    Parameters:
+        bgf (BetaGeoFitter): Ready-to-predict model.
+        max_batch_size (int): Maximum number of customers per vectorized call.
+        max_wait_ms (float): Longest time the first queued request waits for others.
+        latency_window (int): Number of recent request latencies kept for percentiles.
+        table_dir (str): Directory of saved prediction tables to reopen memory-mapped.
+    """
+
+    def __init__(self, bgf, max_batch_size=4096, max_wait_ms=2.0, latency_window=10000, table_dir=None):
+        self.bgf = bgf
+        self.table_dir = table_dir
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.latencies = deque(maxlen=latency_window)
+        self.requests = 0
+        self.customers_scored = 0
+        self.batches = 0
+        self.started = time.perf_counter()
+        self._queue = None
+        self._batcher = None
+
+    def start(self):
+        """Start the background batching task on the running event loop."""
+        self._queue = asyncio.Queue()
+        self._batcher = asyncio.get_running_loop().create_task(self._batch_loop())
+
+    async def stop(self):
+        if self._batcher is not None:
+            self._batcher.cancel()
+            try:
+                await self._batcher
+            except asyncio.CancelledError:
+                pass
+
+    async def score(self, customers, horizon=DEFAULT_HORIZON):
+        """
+        Score a list of customer records.
+
+        Parameters:
+            customers (list): Dicts with 'Frequency', 'Recency', 'T' and optional 'MonetaryValue'.
+            horizon (float): Days over which expected purchases are predicted.
+
+        Returns:
+            scores (list): One dict per customer with 'ProbabilityAlive', 'ExpectedPurchases'
+                and, when MonetaryValue is given, 'ExpectedValue'.
+        """
+        features = _parse_customers(customers, horizon)
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((features, future))
+        return await future
+
+    async def _batch_loop(self):
+        while True:
+            items = [await self._queue.get()]
+            size = len(items[0][0]['T'])
+            deadline = time.perf_counter() + self.max_wait
+
+            while size < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                items.append(item)
+                size += len(item[0]['T'])
+
+            self._score_batch(items)
+
+    def _score_batch(self, items):
+        columns = {name: np.concatenate([features[name] for features, _ in items])
+                   for name in items[0][0]}
+        try:
+            # Gather from the per-horizon prediction tables instead of re-evaluating the model
+            probability_alive = np.empty(len(columns['T']))
+            expected = np.empty(len(columns['T']))
+            for horizon in np.unique(columns['horizon']):
+                rows = columns['horizon'] == horizon
+                expected[rows], probability_alive[rows] = get_prediction_table(
+                    self.bgf, horizon, self.table_dir).lookup(
+                    columns['Frequency'][rows], columns['Recency'][rows], columns['T'][rows])
+        except Exception as e:
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches += 1
+        start = 0
+        for features, future in items:
+            stop = start + len(features['T'])
+            scores = []
+            for i in range(start, stop):
+                score = {'ProbabilityAlive': float(probability_alive[i]),
+                         'ExpectedPurchases': float(expected[i])}
+                if not np.isnan(columns['MonetaryValue'][i]):
+                    score['ExpectedValue'] = float(expected[i] * columns['MonetaryValue'][i])
+                scores.append(score)
+            if not future.done():
+                future.set_result(scores)
+            start = stop
+        self.customers_scored += len(columns['T'])
+
+    def record_latency(self, seconds):
+        self.requests += 1
+        self.latencies.append(seconds)
+
+    def metrics(self):
+        """Request counters, throughput and p50/p99 latency over the recent window."""
+        uptime = time.perf_counter() - self.started
+        latencies_ms = np.array(self.latencies) * 1000
+        return {
+            'requests': self.requests,
+            'customers_scored': self.customers_scored,
+            'batches': self.batches,
+            'mean_batch_customers': self.customers_scored / self.batches if self.batches else 0.0,
+            'p50_ms': float(np.percentile(latencies_ms, 50)) if len(latencies_ms) else None,
+            'p99_ms': float(np.percentile(latencies_ms, 99)) if len(latencies_ms) else None,
+            'requests_per_second': self.requests / uptime if uptime > 0 else 0.0,
+            'customers_per_second': self.customers_scored / uptime if uptime > 0 else 0.0,
+            'uptime_seconds': uptime
+        }
+
+def _finite_number(value, name):
+    """Return `value` as a float, rejecting booleans, strings, NaN and infinities."""
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not np.isfinite(value):
+        raise ValueError(f"'{name}' must be a finite number.")
+    return float(value)
+
+def _parse_customers(customers, horizon):
+    """Validate customer records and convert them to float arrays."""
+    if not isinstance(customers, list) or not customers:
+        raise ValueError("Expected a non-empty list of customers.")
+    for customer in customers:
+        if not isinstance(customer, dict):
+            raise ValueError("Each customer must be a JSON object.")
+        missing = [name for name in REQUIRED_FIELDS if name not in customer]
+        if missing:
+            raise ValueError(f"Customer record is missing {', '.join(missing)}.")
+
+    features = {name: np.array([_finite_number(customer[name], name) for customer in customers])
+                for name in REQUIRED_FIELDS}
+    features['MonetaryValue'] = np.array(
+        [np.nan if customer.get('MonetaryValue') is None
+         else _finite_number(customer['MonetaryValue'], 'MonetaryValue') for customer in customers])
+    features['horizon'] = np.array(
+        [_finite_number(customer.get('horizon', horizon), 'horizon') for customer in customers])
+
+    if (features['Recency'] > features['T']).any() or (features['Frequency'] < 0).any():
+        raise ValueError("Recency must not exceed T and Frequency must be non-negative.")
+    if (features['horizon'] <= 0).any():
+        raise ValueError("'horizon' must be positive.")
+    return features
+
+async def _read_request(reader):
+    """Read one HTTP/1.1 request; returns (method, path, headers, body) or None on EOF."""
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    method, path, _ = request_line.decode('latin-1').split(' ', 2)
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    length = int(headers.get('content-length', 0))
+    if length > MAX_BODY_BYTES:
+        raise ValueError("Request body too large.")
+    body = await reader.readexactly(length) if length else b''
+    return method, path, headers, body
+
+def _response(status, payload, keep_alive):
+    reasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 500: 'Internal Server Error'}
+    body = json.dumps(payload).encode()
+    head = (f'HTTP/1.1 {status} {reasons[status]}\r\n'
+            'Content-Type: application/json\r\n'
+            f'Content-Length: {len(body)}\r\n'
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode() + body
+
+async def _dispatch(service, method, path, body):
+    if method == 'GET' and path == '/health':
+        return 200, {'status': 'ok'}
+    if method == 'GET' and path == '/metrics':
+        return 200, service.metrics()
+    if method == 'POST' and path in ('/score', '/score/batch'):
+        payload = json.loads(body or b'{}')
+        if not isinstance(payload, dict):
+            raise ValueError("Request body must be a JSON object.")
+        if path == '/score':
+            scores = await service.score([payload], payload.get('horizon', DEFAULT_HORIZON))
+            return 200, scores[0]
+        scores = await service.score(payload.get('customers'), payload.get('horizon', DEFAULT_HORIZON))
+        return 200, {'scores': scores}
+    return 404, {'error': f'No route for {method} {path}.'}
+
+async def _handle_connection(service, reader, writer):
+    try:
+        while True:
+            try:
+                request = await _read_request(reader)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                break
+            except ValueError as e:
+                writer.write(_response(400, {'error': str(e)}, False))
+                break
+            if request is None:
+                break
+
+            method, path, headers, body = request
+            keep_alive = headers.get('connection', '').lower() != 'close'
+            started = time.perf_counter()
+            try:
+                status, payload = await _dispatch(service, method, path.split('?', 1)[0], body)
+            except (ValueError, TypeError, KeyError) as e:
+                status, payload = 400, {'error': str(e)}
+            except Exception as e:
+                status, payload = 500, {'error': str(e)}
+            if method == 'POST':
+                service.record_latency(time.perf_counter() - started)
+
+            writer.write(_response(status, payload, keep_alive))
+            await writer.drain()
+            if not keep_alive:
+                break
+    finally:
+        writer.close()
+
+async def start_server(host='127.0.0.1', port=8080, artifact_path=DEFAULT_ARTIFACT_PATH, **service_options):
+    """
+    Load the model once and start serving on the running event loop.
+
+    Passing port=0 binds a free port, which is convenient for local testing.
+
+    Returns:
+        (Server, ScoringService): The asyncio server and the scoring service behind it.
+    """
+    service = ScoringService(load_model(artifact_path), **service_options)
+    service.start()
+    server = await asyncio.start_server(
+        lambda reader, writer: _handle_connection(service, reader, writer), host, port)
+    return server, service
+
+async def serve(host='127.0.0.1', port=8080, artifact_path=DEFAULT_ARTIFACT_PATH, **service_options):
+    """Run the scoring service until cancelled."""
+    server, service = await start_server(host, port, artifact_path, **service_options)
+    address = server.sockets[0].getsockname()
+    print(f"Scoring service listening on http://{address[0]}:{address[1]}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve BG/NBD predictions over HTTP.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--artifact', default=DEFAULT_ARTIFACT_PATH)
+    parser.add_argument('--max-batch-size', type=int, default=4096)
+    parser.add_argument('--max-wait-ms', type=float, default=2.0)
+    parser.add_argument('--table-dir', default=None, help='Directory of saved prediction tables')
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port, args.artifact, max_batch_size=args.max_batch_size,
+                      max_wait_ms=args.max_wait_ms, table_dir=args.table_dir))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,285 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from utils.schema import compact_counts, smallest_uint
+
+class SimulationReducer:
+    """
+    Base class for online reductions over simulated purchase chunks.
+
+    Reducers receive every chunk drawn by the simulation engine as an array of
+    shape (simulations, customers, days) and keep only the aggregate they need,
+    so the full set of draws never has to be materialized.
+    """
+    name = None
+
+    def __init__(self, customer_ids, days, num_simulations):
+        self.customer_ids = np.asarray(customer_ids)
+        self.days = days
+        self.num_simulations = num_simulations
+
+    def update(self, sim_start, purchases, customer_start=0):
+        """
+        Fold a chunk of draws into the reduction.
+
+        `sim_start` and `customer_start` are the zero-based positions of the chunk's first
+        simulation and first customer within the full run.
+        """
+        raise NotImplementedError
+
+    def spawn(self):
+        """Return an empty reducer with the same configuration, used for partial reductions."""
+        return type(self)(self.customer_ids, self.days, self.num_simulations)
+
+    def merge(self, other):
+        """Combine a partial reduction of the same shape into this one."""
+        raise NotImplementedError
+
+    def to_frame(self):
+        """Return the reduction as a DataFrame."""
+        raise NotImplementedError
+
+    def flush(self):
+        """Write any buffered state to disk; reducers held purely in memory do nothing."""
+
+class CustomerTotalsReducer(SimulationReducer):
+    """Total simulated purchases per customer, summed over all days and simulations."""
+    name = 'customer_totals'
+
+    def __init__(self, customer_ids, days, num_simulations):
+        super().__init__(customer_ids, days, num_simulations)
+        self.totals = np.zeros(len(self.customer_ids), dtype=np.int64)
+
+    def update(self, sim_start, purchases, customer_start=0):
+        self.totals[customer_start:customer_start + purchases.shape[1]] += purchases.sum(axis=(0, 2))
+
+    def merge(self, other):
+        self.totals += other.totals
+        return self
+
+    def to_frame(self):
+        return pd.DataFrame({'CustomerID': self.customer_ids, 'PurchasesToday': compact_counts(self.totals)})
+
+class DailyTotalsReducer(SimulationReducer):
+    """Total simulated purchases per day, summed over all customers and simulations."""
+    name = 'daily_totals'
+
+    def __init__(self, customer_ids, days, num_simulations):
+        super().__init__(customer_ids, days, num_simulations)
+        self.totals = np.zeros(days, dtype=np.int64)
+
+    def update(self, sim_start, purchases, customer_start=0):
+        self.totals += purchases.sum(axis=(0, 1))
+
+    def merge(self, other):
+        self.totals += other.totals
+        return self
+
+    def to_frame(self):
+        return pd.DataFrame({'Day': np.arange(1, self.days + 1, dtype=np.int16),
+                             'PurchasesToday': compact_counts(self.totals)})
+
+class SimulationTotalsReducer(SimulationReducer):
+    """Total simulated purchases per simulation run, summed over all customers and days."""
+    name = 'simulation_totals'
+
+    def __init__(self, customer_ids, days, num_simulations):
+        super().__init__(customer_ids, days, num_simulations)
+        self.totals = np.zeros(num_simulations, dtype=np.int64)
+
+    def update(self, sim_start, purchases, customer_start=0):
+        self.totals[sim_start:sim_start + purchases.shape[0]] += purchases.sum(axis=(1, 2))
+
+    def merge(self, other):
+        self.totals += other.totals
+        return self
+
+    def to_frame(self):
+        return pd.DataFrame({'Simulation': compact_counts(np.arange(1, self.num_simulations + 1)),
+                             'PurchasesToday': compact_counts(self.totals)})
+
+class CustomerDistributionReducer(SimulationReducer):
+    """
+    Per-customer distribution of total purchases per simulation, as a fixed-bin histogram.
+
+    Bin k counts the simulations in which a customer made k purchases over the whole
+    period; the last bin collects `max_purchases` or more. Memory is customers x bins
+    counters, whatever the number of days and simulations.
+    """
+    name = 'customer_distribution'
+    QUANTILES = {'PurchasesP10': 0.1, 'PurchasesP50': 0.5, 'PurchasesP90': 0.9}
+
+    def __init__(self, customer_ids, days, num_simulations, max_purchases=31):
+        super().__init__(customer_ids, days, num_simulations)
+        self.max_purchases = max_purchases
+        self.counts = np.zeros((len(self.customer_ids), max_purchases + 1), dtype=smallest_uint(num_simulations))
+
+    def update(self, sim_start, purchases, customer_start=0):
+        num_customers = purchases.shape[1]
+        totals = np.minimum(purchases.sum(axis=2), self.max_purchases)
+        flat = (np.arange(num_customers) * (self.max_purchases + 1) + totals).ravel()
+        histogram = np.bincount(flat, minlength=num_customers * (self.max_purchases + 1))
+        self.counts[customer_start:customer_start + num_customers] += histogram.reshape(num_customers, -1).astype(
+            self.counts.dtype)
+
+    def spawn(self):
+        return type(self)(self.customer_ids, self.days, self.num_simulations, self.max_purchases)
+
+    def merge(self, other):
+        self.counts += other.counts
+        return self
+
+    def to_frame(self):
+        """
+        Quantiles of purchases per simulation and the probability of at least one purchase.
+
+        Quantiles are the smallest purchase count reached by that share of simulations;
+        a value of `max_purchases` means at least that many.
+        """
+        cumulative = self.counts.cumsum(axis=1, dtype=np.int64)
+        simulations = cumulative[:, -1:]
+        frame = pd.DataFrame({'CustomerID': self.customer_ids})
+        for column, q in self.QUANTILES.items():
+            threshold = np.maximum(np.ceil(q * simulations), 1)
+            frame[column] = compact_counts((cumulative < threshold).sum(axis=1))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            frame['ProbabilityAtLeastOne'] = (simulations[:, 0] - self.counts[:, 0]) / simulations[:, 0]
+        return frame
+
+class HorizonTotalsReducer(SimulationReducer):
+    """
+    Cumulative simulated purchases per customer up to each of several horizons.
+
+    One simulation to the longest horizon serves every shorter one: daily draws are
+    prefix-summed per customer and read off at each horizon.
+    """
+    name = 'horizon_totals'
+
+    def __init__(self, customer_ids, days, num_simulations, horizons=None):
+        super().__init__(customer_ids, days, num_simulations)
+        self.horizons = np.unique(np.asarray([days] if horizons is None else horizons, dtype=np.int64))
+        if self.horizons.min() < 1 or self.horizons.max() > days:
+            raise ValueError(f"Horizons must be between 1 and the {days} simulated days.")
+        self.totals = np.zeros((len(self.customer_ids), len(self.horizons)), dtype=np.int64)
+
+    def update(self, sim_start, purchases, customer_start=0):
+        cumulative = purchases.sum(axis=0).cumsum(axis=1)
+        self.totals[customer_start:customer_start + purchases.shape[1]] += cumulative[:, self.horizons - 1]
+
+    def spawn(self):
+        return type(self)(self.customer_ids, self.days, self.num_simulations, self.horizons)
+
+    def merge(self, other):
+        self.totals += other.totals
+        return self
+
+    def to_frame(self):
+        """Tidy totals with one row per horizon and customer."""
+        return pd.DataFrame({
+            'Horizon': compact_counts(np.repeat(self.horizons, len(self.customer_ids))),
+            'CustomerID': np.tile(self.customer_ids, len(self.horizons)),
+            'PurchasesToday': compact_counts(self.totals.T.ravel())
+        })
+
+DEFAULT_REDUCERS = (CustomerTotalsReducer, DailyTotalsReducer, SimulationTotalsReducer,
+                    CustomerDistributionReducer)
+
+def create_reducers(customer_ids, days, num_simulations, reducer_types=DEFAULT_REDUCERS):
+    """Instantiate one reducer of each type for a simulation run."""
+    return [reducer_type(customer_ids, days, num_simulations) for reducer_type in reducer_types]
+
+def save_simulation_summary(summary, output_dir='outputs'):
+    """
+    Save reduced simulation results as small CSV files.
+
+    Parameters:
+        summary (dict): Mapping of reducer name to DataFrame.
+        output_dir (str): Directory in which 'simulation_<name>.csv' files are written.
+
+    Returns:
+        paths (dict): Mapping of reducer name to the saved file path.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    paths = {}
+    for name, frame in summary.items():
+        paths[name] = os.path.join(output_dir, f'simulation_{name}.csv')
+        frame.to_csv(paths[name], index=False)
+    return paths
+
+class RawDrawStore(SimulationReducer):
+    """
+    Persist raw simulated draws as a memory-mapped integer array.
+
+    The store is a directory holding 'draws.npy' with shape (simulations, customers, days),
+    'customer_ids.npy' and a small 'meta.json' header describing the layout. The array is
+    created when the store is constructed with mode 'w+'; spawned copies reopen it with
+    mode 'r+' so worker processes write their own blocks directly to disk.
+    """
+    name = 'raw_draws'
+
+    def __init__(self, customer_ids, days, num_simulations, path='outputs/simulation_draws',
+                 dtype=np.uint16, mode='w+'):
+        super().__init__(customer_ids, days, num_simulations)
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.draws = None
+
+        if mode == 'w+':
+            os.makedirs(path, exist_ok=True)
+            np.save(os.path.join(path, 'customer_ids.npy'), self.customer_ids)
+            self.draws = np.lib.format.open_memmap(
+                os.path.join(path, 'draws.npy'), mode='w+', dtype=self.dtype,
+                shape=(num_simulations, len(self.customer_ids), days)
+            )
+            meta = {
+                'layout': ['simulation', 'customer', 'day'],
+                'num_simulations': num_simulations,
+                'num_customers': len(self.customer_ids),
+                'days': days,
+                'dtype': self.dtype.name
+            }
+            with open(os.path.join(path, 'meta.json'), 'w') as f:
+                json.dump(meta, f, indent=2)
+
+    def __getstate__(self):
+        # Never pickle the mapped array itself; it is reopened lazily from disk
+        state = self.__dict__.copy()
+        state['draws'] = None
+        return state
+
+    def update(self, sim_start, purchases, customer_start=0):
+        if self.draws is None:
+            self.draws = np.load(os.path.join(self.path, 'draws.npy'), mmap_mode='r+')
+        max_count = np.iinfo(self.dtype).max
+        self.draws[sim_start:sim_start + purchases.shape[0],
+                   customer_start:customer_start + purchases.shape[1]] = np.minimum(purchases, max_count)
+
+    def spawn(self):
+        self.flush()
+        return RawDrawStore(self.customer_ids, self.days, self.num_simulations,
+                            self.path, self.dtype, mode='r+')
+
+    def merge(self, other):
+        # Draws are written straight to disk, so there is nothing to combine in memory
+        return self
+
+    def to_frame(self):
+        return None
+
+    def flush(self):
+        if self.draws is not None:
+            self.draws.flush()
+
+def load_raw_draws(path='outputs/simulation_draws', mode='r'):
+    """
+    Open a raw draw store written by RawDrawStore without loading it into memory.
+
+    Returns:
+        (ndarray, ndarray, dict): Memory-mapped draws, customer IDs and the metadata header.
+    """
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    draws = np.load(os.path.join(path, 'draws.npy'), mmap_mode=mode)
+    customer_ids = np.load(os.path.join(path, 'customer_ids.npy'))
+    return draws, customer_ids, meta
@@ -1,25 +1,55 @@
-'''trouble pickling'''
-
-import pandas as pd
+import json
 from lifetimes import BetaGeoFitter
+from models.bgnbd import fit_compressed
+from models.bootstrap import bootstrap_parameters
+from models.model_store import DEFAULT_ARTIFACT_PATH, PARAM_NAMES, fit_statistics, save_model_artifact
 
-def train_bgnbd_model(rfm_df, penalizer_coef=0.01):
+def train_bgnbd_model(rfm_df, penalizer_coef=0.01, artifact_path=DEFAULT_ARTIFACT_PATH,
+                      method='lifetimes', warm_start=None, bootstrap_samples=0, workers=1):
     """
-    Train the BG/NBD model and save model parameters instead of the entire object.
+    Train the BG/NBD model and save it as a model artifact instead of pickling the object.
     
     Parameters:
         rfm_df (DataFrame): DataFrame containing 'Frequency', 'Recency', and 'T' columns.
         penalizer_coef (float): Penalization coefficient to avoid overfitting.
-    
+        artifact_path (str): Path of the model artifact to write.
+        method (str): 'lifetimes' to fit every customer row with BetaGeoFitter.fit, or
+            'compressed' to fit the weighted distinct (Frequency, Recency, T) triples with
+            the vectorized fitter in models.bgnbd.
+        warm_start (str or dict): Previous artifact path or parameters to start the
+            'compressed' fit from.
+        bootstrap_samples (int): Number of bootstrap refits for 95% parameter intervals,
+            stored in the artifact's fit statistics; 0 to skip the bootstrap.
+        workers (int): Number of worker processes running the bootstrap refits.
+
     Returns:
         bgf (BetaGeoFitter): Trained BG/NBD model.
     """
-    bgf = BetaGeoFitter(penalizer_coef=penalizer_coef)
-    bgf.fit(rfm_df['Frequency'], rfm_df['Recency'], rfm_df['T'])
+    if method == 'compressed':
+        if isinstance(warm_start, str):
+            with open(warm_start) as f:
+                warm_start = json.load(f)['params']
+        bgf, fit_stats = fit_compressed(rfm_df, penalizer_coef, warm_start)
+        print(f"Fitted {fit_stats['distinct_triples']} distinct (Frequency, Recency, T) triples "
+              f"covering {fit_stats['customers']} customers.")
+    elif method == 'lifetimes':
+        bgf = BetaGeoFitter(penalizer_coef=penalizer_coef)
+        bgf.fit(rfm_df['Frequency'], rfm_df['Recency'], rfm_df['T'])
+        fit_stats = None
+    else:
+        raise ValueError(f"Unknown training method '{method}'. Use 'lifetimes' or 'compressed'.")
+
+    if bootstrap_samples:
+        fit_stats = fit_statistics(bgf) if fit_stats is None else fit_stats
+        intervals, _ = bootstrap_parameters(rfm_df, bootstrap_samples, penalizer_coef,
+                                            {name: bgf.params_[name] for name in PARAM_NAMES},
+                                            workers=workers)
+        fit_stats['parameter_intervals'] = intervals.set_index('Parameter').to_dict('index')
+        print(f"Bootstrap 95% parameter intervals from {bootstrap_samples} refits:")
+        print(intervals.to_string(index=False))
     
-    # Save model parameters to a CSV file
-    params = pd.Series(bgf.params_, name='parameters')
-    params.to_csv('outputs/model_parameters.csv')
+    # Save model parameters, penalizer and fit statistics as an artifact
+    save_model_artifact(bgf, rfm_df, artifact_path, fit_stats)
     
     print("BG/NBD model trained and parameters saved successfully.")
     return bgf
@@ -0,0 +1,36 @@
+import os
+import numpy as np
+from lifetimes import BetaGeoFitter
+from scipy.optimize import check_grad
+from models.bgnbd import compress_rfm, fit_compressed, negative_log_likelihood
+from models.model_store import PARAM_NAMES
+from utils.data_loader import create_rfm, load_data
+
+SAMPLE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                           'data', 'synthetic_customer_transactions.csv')
+
+def _sample_rfm():
+    return create_rfm(load_data(SAMPLE_PATH))
+
+def test_compressed_fit_matches_lifetimes():
+    rfm_df = _sample_rfm()
+    reference = BetaGeoFitter(penalizer_coef=0.01)
+    reference.fit(rfm_df['Frequency'], rfm_df['Recency'], rfm_df['T'])
+
+    bgf, fit_stats = fit_compressed(rfm_df, penalizer_coef=0.01)
+
+    assert fit_stats['customers'] == len(rfm_df)
+    for name in PARAM_NAMES:
+        np.testing.assert_allclose(bgf.params_[name], reference.params_[name], rtol=1e-4)
+
+def test_analytic_gradient_matches_finite_differences():
+    compressed = compress_rfm(_sample_rfm())
+    scale = 1.0 / compressed['T'].max()
+    args = (compressed['Frequency'].to_numpy(dtype=float), compressed['Recency'].to_numpy(dtype=float) * scale,
+            compressed['T'].to_numpy(dtype=float) * scale, compressed['Count'].to_numpy(dtype=float), 0.01)
+
+    for log_params in (np.log([0.1, 0.1, 0.1, 0.1]), np.log([0.8, 0.05, 0.3, 2.0])):
+        gradient = negative_log_likelihood(log_params, *args)[1]
+        error = check_grad(lambda p: negative_log_likelihood(p, *args)[0],
+                           lambda p: negative_log_likelihood(p, *args)[1], log_params)
+        assert error < 1e-5 * max(1.0, np.linalg.norm(gradient))
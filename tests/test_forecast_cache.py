@@ -0,0 +1,31 @@
+import os
+import pandas as pd
+from models.bgnbd import fit_compressed
+from models.monte_carlo_sim import monte_carlo_simulation
+from utils.data_loader import create_rfm, load_data
+
+SAMPLE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                           'data', 'synthetic_customer_transactions.csv')
+
+def _forecast(rfm_df, bgf, tmp_path, cache_name):
+    return monte_carlo_simulation(rfm_df, days=60, num_simulations=50, seed=42, bgf=bgf,
+                                  output_dir=str(tmp_path / 'outputs'), cache_dir=str(tmp_path / cache_name))
+
+def test_incremental_forecast_matches_from_scratch(tmp_path):
+    rfm_df = create_rfm(load_data(SAMPLE_PATH)).reset_index(drop=True)
+    bgf, _ = fit_compressed(rfm_df)
+    _forecast(rfm_df, bgf, tmp_path, 'cache')
+
+    # Change the first 20 customers, remove the next 20 and add 20 new ones
+    updated = rfm_df.iloc[list(range(20)) + list(range(40, len(rfm_df)))].copy()
+    updated.iloc[:20, updated.columns.get_loc('T')] += 7
+    updated.iloc[:20, updated.columns.get_loc('Frequency')] += 1
+    added = rfm_df.iloc[40:60].assign(CustomerID=rfm_df['CustomerID'].max() + 1 + pd.RangeIndex(20))
+    updated = pd.concat([updated, added], ignore_index=True)
+
+    incremental = _forecast(updated, bgf, tmp_path, 'cache')
+    from_scratch = _forecast(updated, bgf, tmp_path, 'empty_cache')
+
+    assert incremental.keys() == from_scratch.keys()
+    for name in from_scratch:
+        pd.testing.assert_frame_equal(incremental[name], from_scratch[name])
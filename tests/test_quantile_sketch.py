@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+from utils.quantile_sketch import QuantileSketch
+
+QUANTILES = np.linspace(0, 1, 101)
+
+def _values():
+    rng = np.random.default_rng(0)
+    # Heavy-tailed positive values plus a block of zeros, like CLV with non-buyers
+    return np.concatenate([rng.lognormal(8, 2, 50_000), np.zeros(5_000)])
+
+def _assert_within_accuracy(sketch, values, relative_accuracy):
+    # Each estimate is within the relative accuracy of the value at rank floor(q * (n - 1))
+    exact = np.quantile(values, QUANTILES, method='lower')
+    estimates = sketch.quantile(QUANTILES)
+    assert np.all(np.abs(estimates - exact) <= relative_accuracy * exact * (1 + 1e-12))
+
+@pytest.mark.parametrize('relative_accuracy', [0.01, 0.05])
+def test_quantiles_within_relative_accuracy(relative_accuracy):
+    values = _values()
+    sketch = QuantileSketch(relative_accuracy).add(values)
+    assert sketch.count == len(values)
+    _assert_within_accuracy(sketch, values, relative_accuracy)
+
+@pytest.mark.parametrize('relative_accuracy', [0.01, 0.05])
+def test_merged_partial_sketches_match_single_sketch(relative_accuracy):
+    values = np.random.default_rng(1).permutation(_values())
+    single = QuantileSketch(relative_accuracy).add(values)
+
+    merged = QuantileSketch(relative_accuracy)
+    for chunk in np.split(values, [10, 7_000, 30_000, 54_990]):
+        merged.merge(QuantileSketch(relative_accuracy).add(chunk))
+
+    assert merged.count == single.count
+    assert merged.zero_count == single.zero_count
+    np.testing.assert_array_equal(merged.quantile(QUANTILES), single.quantile(QUANTILES))
+    _assert_within_accuracy(merged, values, relative_accuracy)
+
+def test_merge_rejects_different_accuracy():
+    with pytest.raises(ValueError):
+        QuantileSketch(0.01).merge(QuantileSketch(0.02))
@@ -0,0 +1,62 @@
+import pandas as pd
+import pytest
+from data.synthetic_data_gen import generate_transactions
+from utils.rfm_state import load_rfm_state, update_rfm_state
+
+def _batches():
+    """Transactions split by date into three consecutive batches of complete days."""
+    transactions_df = generate_transactions(500, seed=7)
+    dates = transactions_df['PurchaseDate']
+    first_cut, second_cut = pd.Timestamp('2021-09-01'), pd.Timestamp('2022-05-01')
+    return (transactions_df[dates < first_cut],
+            transactions_df[(dates >= first_cut) & (dates < second_cut)],
+            transactions_df[dates >= second_cut])
+
+def _total_purchases(state_path):
+    state, _ = load_rfm_state(state_path)
+    return state['Purchases'].sum()
+
+def test_reapplying_last_batch_is_a_no_op(tmp_path):
+    state_path = str(tmp_path / 'rfm_state.csv')
+    batch_a, batch_b, _ = _batches()
+    update_rfm_state(batch_a, state_path)
+    update_rfm_state(batch_b, state_path)
+    state_before, watermark_before = load_rfm_state(state_path)
+
+    update_rfm_state(batch_b, state_path)
+    update_rfm_state(pd.concat([batch_a, batch_b]), state_path)
+
+    state_after, watermark_after = load_rfm_state(state_path)
+    pd.testing.assert_frame_equal(state_after, state_before)
+    assert watermark_after == watermark_before
+    assert _total_purchases(state_path) == len(batch_a) + len(batch_b)
+
+def test_partial_overlap_raises_and_keeps_state(tmp_path):
+    state_path = str(tmp_path / 'rfm_state.csv')
+    batch_a, batch_b, batch_c = _batches()
+    update_rfm_state(batch_a, state_path)
+    update_rfm_state(batch_b, state_path)
+    state_before, watermark_before = load_rfm_state(state_path)
+
+    # Second half of B plus C overlaps the applied history only partly
+    overlap = pd.concat([batch_b[batch_b['PurchaseDate'] >= pd.Timestamp('2022-01-01')], batch_c])
+    with pytest.raises(ValueError, match='rebuild=True'):
+        update_rfm_state(overlap, state_path)
+
+    state_after, watermark_after = load_rfm_state(state_path)
+    pd.testing.assert_frame_equal(state_after, state_before)
+    assert watermark_after == watermark_before
+
+def test_rebuild_from_full_history(tmp_path):
+    state_path = str(tmp_path / 'rfm_state.csv')
+    batch_a, batch_b, batch_c = _batches()
+    update_rfm_state(batch_a, state_path)
+    update_rfm_state(batch_b, state_path)
+
+    # A corrected historical row only rebuilds the state when the full history is passed
+    corrected = pd.concat([batch_a, batch_b, batch_c])
+    corrected.iloc[0, corrected.columns.get_loc('MonetaryValue')] += 1
+    with pytest.raises(ValueError):
+        update_rfm_state(corrected, state_path)
+    update_rfm_state(corrected, state_path, rebuild=True)
+    assert _total_purchases(state_path) == len(corrected)
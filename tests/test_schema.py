@@ -0,0 +1,18 @@
+import os
+import numpy as np
+from utils.data_loader import load_data
+
+SAMPLE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                           'data', 'synthetic_customer_transactions.csv')
+
+def test_compact_load_is_smaller_with_same_values():
+    full_df = load_data(SAMPLE_PATH)
+    compact_df = load_data(SAMPLE_PATH, compact=True)
+
+    assert compact_df.memory_usage(deep=True).sum() < full_df.memory_usage(deep=True).sum()
+    assert list(compact_df.columns) == list(full_df.columns)
+    assert len(compact_df) == len(full_df)
+    np.testing.assert_array_equal(compact_df['CustomerID'].astype('int64'), full_df['CustomerID'])
+    np.testing.assert_array_equal(compact_df['PurchaseDate'], full_df['PurchaseDate'])
+    # float32 keeps monetary values to the cent
+    np.testing.assert_allclose(compact_df['MonetaryValue'], full_df['MonetaryValue'], atol=0.005)
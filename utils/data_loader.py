@@ -1,32 +1,134 @@
+import glob
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
-from datetime import timedelta
+from utils.rfm import build_rfm
+from utils.schema import compact_rfm, compact_transactions, memory_reduction
 
-def load_data(filepath):
-    """Load transaction data from a CSV file."""
-    return pd.read_csv(filepath, parse_dates=['PurchaseDate'])
+# Only these columns are read from any shard
+TRANSACTION_COLUMNS = ['CustomerID', 'PurchaseDate', 'MonetaryValue']
+DATE_FORMAT = '%Y-%m-%d'
+SHARD_EXTENSIONS = ('.csv', '.csv.gz', '.parquet', '.feather', '.xlsx')
 
-def create_rfm(transactions_df, reference_date=None):
-    """Create Customer Frequency Matrix (RFM) for BG/NBD modeling."""
-    
-    # Set reference date as the day after the last purchase if not provided
-    if reference_date is None:
-        reference_date = transactions_df['PurchaseDate'].max() + timedelta(days=1)
-    
-    rfm = transactions_df.groupby('CustomerID').agg({
-        'PurchaseDate': [
-            lambda x: (x.max() - x.min()).days,  # Recency: Last purchase - first purchase
-            lambda x: (reference_date - x.min()).days  # T: End of observation period - first purchase
-        ],
-        'CustomerID': 'count',  # Frequency: Total purchases
-        'MonetaryValue': 'mean'  # Average purchase value
-    }).reset_index()
-    
-    # Rename columns
-    rfm.columns = ['CustomerID', 'Recency', 'T', 'Frequency', 'MonetaryValue']
-    
-    # Adjust Frequency to reflect repeat purchases
-    rfm['Frequency'] = rfm['Frequency'] - 1
-    
+def resolve_shards(path):
+    """
+    Transaction files behind a path: a single file, every supported file in a directory,
+    or the matches of a glob pattern, in sorted order.
+    """
+    if os.path.isdir(path):
+        shards = [os.path.join(path, name) for name in os.listdir(path) if name.endswith(SHARD_EXTENSIONS)]
+    elif glob.has_magic(path):
+        shards = glob.glob(path)
+    else:
+        shards = [path]
+    if not shards:
+        raise FileNotFoundError(f"No transaction files found for '{path}'.")
+    return sorted(shards)
+
+def read_shard(path, date_format=DATE_FORMAT):
+    """Read the transaction columns of one CSV, Parquet, Feather or Excel file."""
+    if path.endswith('.parquet'):
+        shard = pd.read_parquet(path, columns=TRANSACTION_COLUMNS)
+    elif path.endswith('.feather'):
+        shard = pd.read_feather(path, columns=TRANSACTION_COLUMNS)
+    elif path.endswith('.xlsx'):
+        shard = pd.read_excel(path, usecols=TRANSACTION_COLUMNS)
+    else:
+        shard = pd.read_csv(path, usecols=TRANSACTION_COLUMNS, parse_dates=['PurchaseDate'],
+                            date_format=date_format)
+
+    if not pd.api.types.is_datetime64_any_dtype(shard['PurchaseDate']):
+        shard['PurchaseDate'] = pd.to_datetime(shard['PurchaseDate'], format=date_format)
+    return shard[TRANSACTION_COLUMNS]
+
+def iter_transaction_chunks(path, chunksize=1_000_000, date_format=DATE_FORMAT):
+    """
+    Stream the transactions behind `path` shard by shard, reading CSV shards in chunks of
+    `chunksize` rows so memory stays bounded for inputs larger than RAM.
+    """
+    for shard in resolve_shards(path):
+        if shard.endswith(('.csv', '.csv.gz')):
+            yield from pd.read_csv(shard, usecols=TRANSACTION_COLUMNS, parse_dates=['PurchaseDate'],
+                                   date_format=date_format, chunksize=chunksize)
+        else:
+            yield read_shard(shard, date_format)
+
+def _shards_key(shards, date_format):
+    """Cache key from each shard's path, size and modification time."""
+    digest = hashlib.sha256(date_format.encode())
+    for shard in shards:
+        stat = os.stat(shard)
+        digest.update(f'{os.path.abspath(shard)}|{stat.st_size}|{stat.st_mtime_ns}'.encode())
+    return digest.hexdigest()[:24]
+
+def read_transactions(path, date_format=DATE_FORMAT, workers=None, cache_dir=None):
+    """
+    Read every transaction shard behind `path` in parallel and concatenate them.
+
+    Parameters:
+        path (str): A file, a directory of shards or a glob pattern.
+        date_format (str): Explicit PurchaseDate format for text formats.
+        workers (int): Number of threads parsing shards; defaults to min(8, CPU count).
+        cache_dir (str): Optional directory holding a Parquet copy of the combined shards,
+            reused while no shard changes so later runs skip text parsing.
+
+    Returns:
+        transactions_df (DataFrame): 'CustomerID', 'PurchaseDate' and 'MonetaryValue' columns.
+    """
+    shards = resolve_shards(path)
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = os.path.join(cache_dir, f'transactions-{_shards_key(shards, date_format)}.parquet')
+        if os.path.exists(cache_path):
+            return pd.read_parquet(cache_path)
+
+    if len(shards) == 1:
+        transactions_df = read_shard(shards[0], date_format)
+    else:
+        workers = workers or min(8, os.cpu_count() or 1)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            frames = list(executor.map(lambda shard: read_shard(shard, date_format), shards))
+        transactions_df = pd.concat(frames, ignore_index=True)
+        print(f"Loaded {len(transactions_df)} transactions from {len(shards)} shards.")
+
+    if cache_path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        transactions_df.to_parquet(cache_path + '.tmp', index=False)
+        os.replace(cache_path + '.tmp', cache_path)
+    return transactions_df
+
+def load_data(filepath, compact=False, day_offsets=False, date_format=DATE_FORMAT, workers=None, cache_dir=None):
+    """
+    Load transaction data from a CSV file, or from shards in CSV, Parquet, Feather or Excel.
+
+    Parameters:
+        filepath (str): Path to a transactions file, a directory of shards or a glob pattern.
+        compact (bool): Apply the compact schema from utils.schema (downcast or dictionary-encoded
+            IDs, float32 monetary values) and report the memory saved.
+        day_offsets (bool): With `compact`, store dates as int16 'PurchaseDay' offsets instead
+            of a datetime 'PurchaseDate'.
+        date_format (str): Explicit PurchaseDate format of text shards.
+        workers (int): Number of threads parsing shards.
+        cache_dir (str): Directory for a columnar copy reused while the shards are unchanged.
+    """
+    transactions_df = read_transactions(filepath, date_format, workers, cache_dir)
+    if not compact:
+        return transactions_df
+
+    compact_df = compact_transactions(transactions_df, day_offsets)
+    report = memory_reduction(transactions_df, compact_df)
+    print(f"Compact schema: {report['after_bytes'] / 2 ** 20:.1f} MB instead of "
+          f"{report['before_bytes'] / 2 ** 20:.1f} MB ({report['reduction']:.0%} smaller).")
+    return compact_df
+
+def create_rfm(transactions_df, reference_date=None, compact=False):
+    """Create Customer Frequency Matrix (RFM) for BG/NBD modeling, optionally with compact dtypes."""
+    rfm = filter_rfm(build_rfm(transactions_df, reference_date))
+    return compact_rfm(rfm) if compact else rfm
+
+def filter_rfm(rfm):
+    """Keep customers usable for BG/NBD modeling: Recency within T and at least one repeat purchase."""
     # Ensure Recency is not greater than T
     rfm = rfm[rfm['Recency'] <= rfm['T']]
     
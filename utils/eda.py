@@ -1,6 +1,4 @@
-import matplotlib.pyplot as plt
-import seaborn as sns
-import os
+from utils.plotting import draw_histogram, histogram_stats, render_figure
 
 def plot_rfm_distributions(rfm_df, output_path='outputs/eda_visualizations/rfm_distributions.png'):
     """
@@ -14,32 +12,20 @@ def plot_rfm_distributions(rfm_df, output_path='outputs/eda_visualizations/rfm_d
         print("RFM Data is empty. Cannot generate distribution plots.")
         return
 
-    # Ensure output directory exists
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-
-    try:
-        plt.figure(figsize=(15, 5))
-
-        # Recency distribution
-        plt.subplot(1, 3, 1)
-        sns.histplot(rfm_df['Recency'], bins=30, kde=True)
-        plt.title('Recency Distribution')
-
-        # Frequency distribution
-        plt.subplot(1, 3, 2)
-        sns.histplot(rfm_df['Frequency'], bins=30, kde=True)
-        plt.title('Frequency Distribution')
-
-        # Monetary value distribution
-        plt.subplot(1, 3, 3)
-        sns.histplot(rfm_df['MonetaryValue'], bins=30, kde=True)
-        plt.title('Monetary Value Distribution')
-
-        plt.tight_layout()
-        plt.savefig(output_path)
-        plt.show()
-
-        print(f"RFM Distributions saved to: {output_path}")
-
-    except Exception as e:
-        print(f"Error while generating RFM distributions: {e}")
\ No newline at end of file
+    # Precompute histograms and KDEs so rendering does not touch the DataFrame
+    panels = [
+        (histogram_stats(rfm_df['Recency'], bins=30), 'Recency Distribution'),
+        (histogram_stats(rfm_df['Frequency'], bins=30), 'Frequency Distribution'),
+        (histogram_stats(rfm_df['MonetaryValue'], bins=30), 'Monetary Value Distribution')
+    ]
+
+    def draw(fig):
+        axes = fig.subplots(1, 3)
+        for ax, (stats, title) in zip(axes, panels):
+            draw_histogram(ax, stats, color='tab:blue')
+            ax.set_title(title)
+            ax.set_ylabel('Count')
+        fig.tight_layout()
+
+    render_figure(draw, output_path, figsize=(15, 5))
+    print(f"RFM Distributions queued for: {output_path}")
@@ -1,95 +1,178 @@
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-from datetime import timedelta
 import os
+from utils.rfm import build_rfm
+from utils.plotting import draw_histogram, histogram_stats, render_figure
+from utils.schema import with_purchase_dates
 
 def calculate_rfm(data, reference_date):
-    """Calculate RFM metrics for the provided dataset."""
-    rfm = data.groupby('CustomerID').agg({
-        'PurchaseDate': [
-            lambda x: (x.max() - x.min()).days,  # Recency
-            lambda x: (reference_date - x.max()).days  # T (customer age)
-        ],
-        'CustomerID': 'count',  # Frequency
-        'MonetaryValue': 'mean'  # Average monetary value
-    }).reset_index()
-    
-    rfm.columns = ['CustomerID', 'Recency', 'T', 'Frequency', 'MonetaryValue']
-    rfm['Frequency'] = rfm['Frequency'] - 1  # Adjust frequency for repeat purchases
-    return rfm
-
-def stratified_holdout_split(transactions_df, holdout_fraction=0.2):
+    """Calculate RFM metrics for the provided dataset (T is measured from the first purchase)."""
+    return build_rfm(data, reference_date)
+
+def _with_datetime_dates(transactions_df):
+    """Return the transactions with a datetime PurchaseDate, never modifying the caller's DataFrame."""
+    transactions_df = with_purchase_dates(transactions_df)
+    if pd.api.types.is_datetime64_any_dtype(transactions_df['PurchaseDate']):
+        return transactions_df
+    return transactions_df.assign(PurchaseDate=pd.to_datetime(transactions_df['PurchaseDate']))
+
+def _stratified_ranks(frequency, seed=42, n_strata=3):
+    """
+    Randomly order customers within frequency-quantile strata in one vectorized pass.
+
+    Returns:
+        (ndarray, ndarray, ndarray): Each customer's rank within its stratum, its stratum
+        and the size of every stratum.
+    """
+    strata = pd.qcut(frequency, q=n_strata, labels=False, duplicates='drop').astype(np.int64)
+    random_keys = np.random.default_rng(seed).random(len(frequency))
+
+    # Sort by stratum, then randomly within it; rank = position minus the stratum's start
+    order = np.lexsort((random_keys, strata))
+    sorted_strata = strata[order]
+    ranks = np.empty(len(frequency), dtype=np.int64)
+    ranks[order] = np.arange(len(frequency)) - np.searchsorted(sorted_strata, sorted_strata, side='left')
+    return ranks, strata, np.bincount(strata)
+
+def _customer_codes(transactions_df):
+    """Factorize CustomerID into dense codes and derive each customer's repeat purchases."""
+    codes, customer_ids = pd.factorize(transactions_df['CustomerID'], sort=True)
+    frequency = np.bincount(codes, minlength=len(customer_ids)) - 1
+    return codes, np.asarray(customer_ids), frequency
+
+def assign_stratified_folds(transactions_df, n_folds=5, seed=42, n_strata=3):
+    """
+    Assign every customer to one of `n_folds` folds, stratified by frequency quantiles.
+
+    Customers are shuffled within each stratum and dealt round-robin into folds, so every
+    fold has a similar frequency mix. No per-group callbacks or DataFrame copies are made.
+
+    Parameters:
+        transactions_df (DataFrame): Transactions with a 'CustomerID' column.
+        n_folds (int): Number of folds.
+        seed (int): Seed of the within-stratum shuffle.
+        n_strata (int): Number of frequency quantile bins.
+
+    Returns:
+        (ndarray, ndarray, ndarray): Sorted customer IDs, the fold of each customer, and the
+        customer code (index into the customer IDs) of every transaction.
+    """
+    codes, customer_ids, frequency = _customer_codes(transactions_df)
+    ranks, _, _ = _stratified_ranks(frequency, seed, n_strata)
+    return customer_ids, ranks % n_folds, codes
+
+def fold_indices(customer_folds, codes, fold):
+    """Positional indices of the transactions whose customer belongs to `fold`."""
+    return np.flatnonzero(customer_folds[codes] == fold)
+
+def stratified_holdout_split(transactions_df, holdout_fraction=0.2, seed=42, return_indices=False, plot=True):
     """
     Splits the dataset into calibration and holdout sets using stratified sampling 
     based on frequency bins to ensure balanced RFM characteristics.
+
+    Parameters:
+        transactions_df (DataFrame): Transactions with 'CustomerID', 'PurchaseDate' and 'MonetaryValue'.
+        holdout_fraction (float): Share of each frequency bin assigned to the holdout set.
+        seed (int): Seed of the within-bin shuffle.
+        return_indices (bool): Return positional transaction indices instead of DataFrames.
+        plot (bool): Plot calibration and holdout RFM distributions for verification.
+
+    Returns:
+        (calibration, holdout): DataFrames, or index arrays if `return_indices` is set.
     """
-    # Ensure PurchaseDate is in datetime format
-    transactions_df['PurchaseDate'] = pd.to_datetime(transactions_df['PurchaseDate'])
-    
-    # Reference date for RFM calculation
-    latest_date = transactions_df['PurchaseDate'].max()
-    reference_date = latest_date + timedelta(days=1)
+    codes, customer_ids, frequency = _customer_codes(transactions_df)
+
+    # Stratified sampling: the first share of each shuffled frequency bin goes to holdout
+    ranks, strata, sizes = _stratified_ranks(frequency, seed)
+    holdout_customers = ranks < np.rint(holdout_fraction * sizes)[strata]
+
+    holdout_rows = holdout_customers[codes]
+    calibration_idx = np.flatnonzero(~holdout_rows)
+    holdout_idx = np.flatnonzero(holdout_rows)
+
+    if plot:
+        # The split is by customer, so both sets' RFM are rows of one full-data RFM table;
+        # build_rfm sorts by CustomerID, matching the factorized customer order
+        full_rfm = build_rfm(_with_datetime_dates(transactions_df))
+        plot_rfm_distributions(full_rfm[~holdout_customers], full_rfm[holdout_customers])
 
-    # Calculate RFM for the full dataset
-    full_rfm = calculate_rfm(transactions_df, reference_date)
-    
-    # Create frequency bins (Low, Medium, High) for stratification
-    full_rfm['FrequencyBin'] = pd.qcut(full_rfm['Frequency'], q=3, labels=['Low', 'Medium', 'High'])
+    if return_indices:
+        return calibration_idx, holdout_idx
+    return transactions_df.take(calibration_idx), transactions_df.take(holdout_idx)
 
-    # Stratified sampling: Select holdout customers from each frequency bin
-    holdout_customers = full_rfm.groupby('FrequencyBin', group_keys=False).apply(
-        lambda x: x.sample(frac=holdout_fraction, random_state=42)
-    )['CustomerID']
+def hashed_holdout_customers(customer_ids, holdout_fraction=0.2, seed=42):
+    """
+    Holdout membership decided per customer from a seeded hash of the CustomerID.
+
+    Needs no global view of the customers, so it can run partition by partition on data
+    that does not fit in memory, and a customer always gets the same assignment. Every
+    frequency stratum receives `holdout_fraction` of its customers in expectation rather
+    than exactly as in stratified_holdout_split.
 
-    # Split transactions into calibration and holdout sets
-    calibration_df = transactions_df[~transactions_df['CustomerID'].isin(holdout_customers)]
-    holdout_df = transactions_df[transactions_df['CustomerID'].isin(holdout_customers)]
+    Returns:
+        holdout (ndarray): Boolean mask, True for holdout customers.
+    """
+    hashed = pd.util.hash_pandas_object(pd.Series(np.asarray(customer_ids)), index=False,
+                                        hash_key=f'{seed:016d}'[-16:]).to_numpy()
+    return (hashed >> np.uint64(11)) / 2.0 ** 53 < holdout_fraction
 
-    # Recalculate RFM for both sets
-    calibration_rfm = calculate_rfm(calibration_df, reference_date)
-    holdout_rfm = calculate_rfm(holdout_df, reference_date)
+def calendar_holdout_split(transactions_df, calibration_end, observation_end=None):
+    """
+    Split transactions at a calendar cutoff, as BG/NBD validation requires.
 
-    # Plot RFM distributions for verification
-    plot_rfm_distributions(calibration_rfm, holdout_rfm)
+    RFM is computed from transactions up to and including `calibration_end`, with T measured
+    to the cutoff. Each of those customers' purchases after the cutoff, up to
+    `observation_end`, are counted as realized holdout purchases.
 
-    return calibration_df, holdout_df
+    Parameters:
+        transactions_df (DataFrame): Transactions with 'CustomerID', 'PurchaseDate' and 'MonetaryValue'.
+        calibration_end (datetime): Last day of the calibration period.
+        observation_end (datetime): Last day of the holdout period; defaults to the last purchase.
+
+    Returns:
+        calibration_rfm (DataFrame): RFM per calibration customer plus 'HoldoutPurchases' and
+            'HoldoutDays' (length of the holdout period).
+    """
+    transactions_df = _with_datetime_dates(transactions_df)
+    dates = transactions_df['PurchaseDate']
+    calibration_end = pd.Timestamp(calibration_end)
+    observation_end = dates.max() if observation_end is None else pd.Timestamp(observation_end)
+
+    in_calibration = (dates <= calibration_end).to_numpy()
+    in_holdout = ((dates > calibration_end) & (dates <= observation_end)).to_numpy()
+
+    calibration_rfm = build_rfm(transactions_df[in_calibration], reference_date=calibration_end)
+
+    holdout_counts = transactions_df['CustomerID'][in_holdout].value_counts()
+    calibration_rfm['HoldoutPurchases'] = (
+        holdout_counts.reindex(calibration_rfm['CustomerID'], fill_value=0).to_numpy()
+    )
+    calibration_rfm['HoldoutDays'] = (observation_end - calibration_end).days
+    return calibration_rfm
 
 def plot_rfm_distributions(calibration_rfm, holdout_rfm):
     """Plot RFM distributions to verify similarity between calibration and holdout sets."""
-    
-    # Create output directory if it doesn't exist
     output_dir = 'outputs/eda_visualizations'
-    os.makedirs(output_dir, exist_ok=True)
-
-    # Plotting
-    fig, axes = plt.subplots(3, 2, figsize=(15, 12))
-
-    # Recency Distribution
-    sns.histplot(calibration_rfm['Recency'], bins=30, kde=True, color='blue', ax=axes[0, 0])
-    axes[0, 0].set_title('Calibration Recency Distribution')
-    sns.histplot(holdout_rfm['Recency'], bins=30, kde=True, color='orange', ax=axes[0, 1])
-    axes[0, 1].set_title('Holdout Recency Distribution')
-
-    # Frequency Distribution
-    sns.histplot(calibration_rfm['Frequency'], bins=30, kde=True, color='blue', ax=axes[1, 0])
-    axes[1, 0].set_title('Calibration Frequency Distribution')
-    sns.histplot(holdout_rfm['Frequency'], bins=30, kde=True, color='orange', ax=axes[1, 1])
-    axes[1, 1].set_title('Holdout Frequency Distribution')
-
-    # Monetary Value Distribution
-    sns.histplot(calibration_rfm['MonetaryValue'], bins=30, kde=True, color='blue', ax=axes[2, 0])
-    axes[2, 0].set_title('Calibration Monetary Value Distribution')
-    sns.histplot(holdout_rfm['MonetaryValue'], bins=30, kde=True, color='orange', ax=axes[2, 1])
-    axes[2, 1].set_title('Holdout Monetary Value Distribution')
-
-    plt.tight_layout()
-    
-    # Save the figure
     plot_filename = os.path.join(output_dir, 'rfm_distributions_comparison.png')
-    plt.savefig(plot_filename)
-    
-    # Display the plot
-    plt.show()
 
-    print(f"RFM distribution plots saved to: {plot_filename}")
\ No newline at end of file
+    # Precompute histograms and KDEs: one row per metric, calibration left and holdout right
+    rows = [
+        (column, label, histogram_stats(calibration_rfm[column], bins=30),
+         histogram_stats(holdout_rfm[column], bins=30))
+        for column, label in [('Recency', 'Recency'), ('Frequency', 'Frequency'),
+                              ('MonetaryValue', 'Monetary Value')]
+    ]
+
+    def draw(fig):
+        axes = fig.subplots(3, 2)
+        for row, (column, label, calibration_stats, holdout_stats) in enumerate(rows):
+            draw_histogram(axes[row, 0], calibration_stats, color='blue')
+            axes[row, 0].set_title(f'Calibration {label} Distribution')
+            axes[row, 0].set_xlabel(column)
+            draw_histogram(axes[row, 1], holdout_stats, color='orange')
+            axes[row, 1].set_title(f'Holdout {label} Distribution')
+            axes[row, 1].set_xlabel(column)
+        fig.tight_layout()
+
+    render_figure(draw, plot_filename, figsize=(15, 12))
+    print(f"RFM distribution plots queued for: {plot_filename}")
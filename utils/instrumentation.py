@@ -0,0 +1,165 @@
+import cProfile
+import json
+import os
+import platform
+import resource
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# CLV_INSTRUMENT=1 records per-stage timings; CLV_INSTRUMENT=profile also dumps cProfile stats
+INSTRUMENT_MODE = os.environ.get('CLV_INSTRUMENT', '').lower()
+ENABLED = INSTRUMENT_MODE not in ('', '0', 'false', 'off')
+PROFILE = INSTRUMENT_MODE == 'profile'
+
+DEFAULT_MANIFEST_PATH = 'outputs/run_manifest.json'
+PROFILE_DIR = 'outputs/profiles'
+
+_records = []
+_records_lock = threading.Lock()
+_started = datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+def row_count(value):
+    """Rows in a DataFrame, Series or array, summed over tuples, lists and dicts; None otherwise."""
+    if isinstance(value, dict):
+        value = list(value.values())
+    if isinstance(value, (tuple, list)):
+        counts = [row_count(item) for item in value]
+        counts = [count for count in counts if count is not None]
+        return sum(counts) if counts else None
+    if hasattr(value, 'shape') and len(getattr(value, 'shape', ())) > 0:
+        return int(value.shape[0])
+    return None
+
+def _rss_mb():
+    """Current resident set size in MB, from /proc on Linux; None elsewhere."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError):
+        return None
+
+# Interval at which a running stage samples the resident set size for its peak
+RSS_SAMPLE_SECONDS = 0.01
+
+class _RssSampler(threading.Thread):
+    """Background thread tracking the highest resident set size seen while a stage runs."""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.peak = _rss_mb()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(RSS_SAMPLE_SECONDS):
+            rss = _rss_mb()
+            if rss is not None and (self.peak is None or rss > self.peak):
+                self.peak = rss
+
+    def stop(self):
+        """Stop sampling; returns the stage peak in MB, or None where RSS is unavailable."""
+        self._stop_event.set()
+        self.join()
+        rss = _rss_mb()
+        if rss is not None and (self.peak is None or rss > self.peak):
+            self.peak = rss
+        return self.peak
+
+def _peak_rss_mb():
+    """Process high-water mark of the resident set size in MB (ru_maxrss is in KB on Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+@contextmanager
+def stage_timer(name, inputs=None):
+    """
+    Record wall time, CPU time, memory and row counts of a block of work.
+
+    Does nothing unless CLV_INSTRUMENT is set. CPU time is that of the calling thread plus
+    any worker processes reaped meanwhile. 'peak_rss_mb' is the highest resident set size
+    sampled every RSS_SAMPLE_SECONDS during the stage (the process-wide peak since start-up
+    is in the manifest header); RSS is per process, so stages running concurrently see each
+    other's memory.
+
+    Parameters:
+        name (str): Stage name in the run manifest.
+        inputs: Stage inputs whose rows are counted.
+
+    Yields:
+        record (dict or None): The manifest entry; set 'output_rows' via set_output().
+    """
+    if not ENABLED:
+        yield None
+        return
+
+    record = {'stage': name, 'thread': threading.current_thread().name, 'input_rows': row_count(inputs)}
+    profiler = cProfile.Profile() if PROFILE else None
+    if profiler is not None:
+        try:
+            profiler.enable()
+        except ValueError:
+            # Only one profiler may be active at a time; concurrent stages go unprofiled
+            profiler = None
+
+    sampler = _RssSampler()
+    rss_before = sampler.peak
+    sampler.start()
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    wall, cpu = time.perf_counter(), time.thread_time()
+    try:
+        yield record
+    finally:
+        record['seconds'] = time.perf_counter() - wall
+        children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+        record['cpu_seconds'] = time.thread_time() - cpu
+        record['child_cpu_seconds'] = (children_after.ru_utime + children_after.ru_stime
+                                       - children.ru_utime - children.ru_stime)
+        record['peak_rss_mb'] = sampler.stop()
+        record['rss_before_mb'] = rss_before
+        record['rss_after_mb'] = _rss_mb()
+
+        if profiler is not None:
+            profiler.disable()
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            record['profile'] = os.path.join(PROFILE_DIR, f'{name}.prof')
+            profiler.dump_stats(record['profile'])
+
+        with _records_lock:
+            _records.append(record)
+
+def set_output(record, value):
+    """Store the output row count of `value` on a record from stage_timer, if instrumenting."""
+    if record is not None:
+        record['output_rows'] = row_count(value)
+    return value
+
+def record_event(name, **fields):
+    """Add a manifest entry without timing, e.g. a stage served from the cache."""
+    if ENABLED:
+        with _records_lock:
+            _records.append({'stage': name, **fields})
+
+def write_run_manifest(path=DEFAULT_MANIFEST_PATH):
+    """
+    Write the recorded stages as a JSON run manifest.
+
+    Returns:
+        path (str): The manifest path, or None if instrumentation is off.
+    """
+    if not ENABLED:
+        return None
+    with _records_lock:
+        stages = list(_records)
+    manifest = {
+        'started': _started,
+        'finished': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'peak_rss_mb': _peak_rss_mb(),
+        'stages': stages
+    }
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(manifest, f, indent=2, default=str)
+    print(f"Run manifest saved to '{path}'.")
+    return path
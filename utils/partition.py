@@ -0,0 +1,87 @@
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from utils.data_loader import DATE_FORMAT, iter_transaction_chunks, read_transactions
+
+DEFAULT_BUCKET_DIR = 'outputs/buckets'
+
+def customer_buckets(customer_ids, num_buckets):
+    """Bucket of every customer: a stable hash of the CustomerID modulo `num_buckets`."""
+    hashed = pd.util.hash_pandas_object(pd.Series(np.asarray(customer_ids)), index=False).to_numpy()
+    return (hashed % np.uint64(num_buckets)).astype(np.int64)
+
+def bucket_path(bucket_dir, kind, bucket):
+    """Location of one bucket's data of a given kind, e.g. 'transactions' or 'rfm'."""
+    return os.path.join(bucket_dir, kind, f'bucket-{bucket:05d}')
+
+def partition_transactions(source, bucket_dir=DEFAULT_BUCKET_DIR, num_buckets=64, chunksize=1_000_000,
+                           date_format=DATE_FORMAT):
+    """
+    Partition transactions by hashed CustomerID into on-disk Parquet buckets.
+
+    The source is streamed in chunks and every chunk is split across the buckets, so all of
+    a customer's transactions land in the same bucket and memory is bounded by one chunk.
+    Each bucket is a directory of Parquet parts that read_transactions can load. Global
+    aggregates needed before any per-customer work, the transaction count and purchase
+    date range, are written to 'meta.json'. A source without transactions raises ValueError.
+
+    Parameters:
+        source (str): Transactions file, directory of shards or glob pattern.
+        bucket_dir (str): Directory receiving the buckets; existing transaction buckets are replaced.
+        num_buckets (int): Number of buckets; pick it so one bucket fits comfortably in memory.
+        chunksize (int): Number of CSV rows read per chunk.
+        date_format (str): Explicit PurchaseDate format of text shards.
+
+    Returns:
+        meta (dict): 'num_buckets', 'transactions', 'first_purchase' and 'last_purchase'.
+    """
+    shutil.rmtree(os.path.join(bucket_dir, 'transactions'), ignore_errors=True)
+    for bucket in range(num_buckets):
+        os.makedirs(bucket_path(bucket_dir, 'transactions', bucket))
+
+    transactions, first_purchase, last_purchase = 0, None, None
+    for part, chunk in enumerate(iter_transaction_chunks(source, chunksize, date_format)):
+        if chunk.empty:
+            continue
+        buckets = customer_buckets(chunk['CustomerID'], num_buckets)
+        order = np.argsort(buckets, kind='stable')
+        bounds = np.searchsorted(buckets[order], np.arange(num_buckets + 1))
+        for bucket in np.flatnonzero(np.diff(bounds)):
+            rows = chunk.take(order[bounds[bucket]:bounds[bucket + 1]])
+            rows.to_parquet(os.path.join(bucket_path(bucket_dir, 'transactions', bucket), f'part-{part:05d}.parquet'),
+                            index=False)
+
+        transactions += len(chunk)
+        chunk_first, chunk_last = chunk['PurchaseDate'].min(), chunk['PurchaseDate'].max()
+        first_purchase = chunk_first if first_purchase is None else min(first_purchase, chunk_first)
+        last_purchase = chunk_last if last_purchase is None else max(last_purchase, chunk_last)
+        print(f"Partitioned {transactions} transactions into {num_buckets} buckets...")
+
+    if not transactions:
+        raise ValueError(f"No transactions in '{source}'.")
+    meta = {'num_buckets': num_buckets, 'transactions': transactions,
+            'first_purchase': first_purchase.isoformat(), 'last_purchase': last_purchase.isoformat()}
+    with open(os.path.join(bucket_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+def read_bucket(bucket_dir, kind, bucket):
+    """
+    Load one bucket.
+
+    Returns:
+        frame (DataFrame or None): The bucket's rows, or None if the bucket is empty.
+    """
+    path = bucket_path(bucket_dir, kind, bucket)
+    if kind == 'transactions':
+        return read_transactions(path) if os.path.isdir(path) and os.listdir(path) else None
+    return pd.read_parquet(path + '.parquet') if os.path.exists(path + '.parquet') else None
+
+def write_bucket(frame, bucket_dir, kind, bucket):
+    """Save one bucket's per-customer results as a single Parquet file."""
+    path = bucket_path(bucket_dir, kind, bucket) + '.parquet'
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    frame.to_parquet(path, index=False)
+    return path
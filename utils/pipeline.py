@@ -0,0 +1,204 @@
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from utils.plotting import wait_for_plots
+from utils.instrumentation import record_event, set_output, stage_timer
+
+DEFAULT_CACHE_DIR = 'outputs/.stage_cache'
+
+# Stages marked exclusive never run at the same time as each other
+_EXCLUSIVE_LOCK = threading.Lock()
+
+def file_hash(path):
+    """SHA-256 of a file's contents, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+# Source files under this directory count towards a stage's code version
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _project_file(obj):
+    """Source file of the project module defining `obj`, or None for third-party code."""
+    module = obj if inspect.ismodule(obj) else inspect.getmodule(obj)
+    path = getattr(module, '__file__', None)
+    if path is None or not os.path.abspath(path).startswith(PROJECT_ROOT + os.sep):
+        return None
+    return os.path.abspath(path)
+
+def _module_files(path, module):
+    """A project module's file plus the project modules its globals refer to."""
+    files = {path}
+    for value in list(vars(module).values()):
+        referenced = _project_file(value)
+        if referenced is not None:
+            files.add(referenced)
+    return files
+
+def _code_hash(func):
+    """
+    Code version of a stage: the function's source plus the project modules it refers to.
+
+    Every project name used by the function pulls in its module file and the project
+    modules that module imports, so editing a plotting module does not invalidate a
+    simulation stage that never touches it.
+    """
+    files = set()
+    for name in func.__code__.co_names:
+        value = func.__globals__.get(name)
+        path = _project_file(value) if value is not None else None
+        if path is not None:
+            files |= _module_files(path, inspect.getmodule(value) if not inspect.ismodule(value) else value)
+
+    digest = hashlib.sha256(inspect.getsource(func).encode())
+    for path in sorted(files):
+        digest.update(file_hash(path).encode())
+    return digest.hexdigest()
+
+class Stage:
+    """
+    A pipeline step with declared inputs and outputs.
+
+    Parameters:
+        name (str): Unique stage name.
+        func (callable): Called as func(*upstream_results, **params, **options).
+        inputs (list): Names of upstream stages whose results are passed positionally.
+        after (list): Names of upstream stages that must run first but whose results are not
+            passed, e.g. a stage that writes a file this one reads.
+        params (dict): Keyword arguments that affect the result and are part of the cache key.
+        options (dict): Keyword arguments that do not affect the result (e.g. worker counts).
+        files (list): Input files whose contents are part of the cache key.
+        outputs (list): Files the stage writes; a cached result is reused only while they are unchanged.
+        cache (bool): Whether the stage result may be cached.
+        exclusive (bool): Run under a shared lock, for stages that touch non-thread-safe state.
+    """
+
+    def __init__(self, name, func, inputs=(), after=(), params=None, options=None, files=(), outputs=(),
+                 cache=True, exclusive=False):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.after = list(after)
+        self.params = params or {}
+        self.options = options or {}
+        self.files = list(files)
+        self.outputs = list(outputs)
+        self.cache = cache
+        self.exclusive = exclusive
+
+    def key(self, upstream_keys):
+        """Cache key from the code version, parameters, input files and upstream stage keys."""
+        payload = {
+            'name': self.name,
+            'code': _code_hash(self.func),
+            'params': self.params,
+            'files': {path: file_hash(path) for path in self.files},
+            'upstream': [upstream_keys[name] for name in self.inputs + self.after]
+        }
+        encoded = json.dumps(payload, sort_keys=True, default=str).encode()
+        return hashlib.sha256(encoded).hexdigest()[:24]
+
+def _topological_order(stages):
+    by_name = {stage.name: stage for stage in stages}
+    order, visiting, done = [], set(), set()
+
+    def visit(name):
+        if name in done:
+            return
+        if name in visiting:
+            raise ValueError(f"Pipeline has a cycle through stage '{name}'.")
+        if name not in by_name:
+            raise ValueError(f"Unknown pipeline stage '{name}'.")
+        visiting.add(name)
+        for upstream in by_name[name].inputs + by_name[name].after:
+            visit(upstream)
+        visiting.discard(name)
+        done.add(name)
+        order.append(by_name[name])
+
+    for stage in stages:
+        visit(stage.name)
+    return order
+
+def _load_cached(stage, key, cache_dir):
+    path = os.path.join(cache_dir, f'{stage.name}-{key}.pkl')
+    if not stage.cache or not os.path.exists(path):
+        return False, None
+    with open(path, 'rb') as f:
+        entry = pickle.load(f)
+    for output, digest in entry['outputs'].items():
+        if not os.path.exists(output) or file_hash(output) != digest:
+            return False, None
+    return True, entry['result']
+
+def _save_cached(stage, key, result, cache_dir):
+    if not stage.cache:
+        return
+    os.makedirs(cache_dir, exist_ok=True)
+    entry = {'result': result, 'outputs': {path: file_hash(path) for path in stage.outputs}}
+    path = os.path.join(cache_dir, f'{stage.name}-{key}.pkl')
+    with open(path + '.tmp', 'wb') as f:
+        pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + '.tmp', path)
+
+def _run_stage(stage, key, upstream_results, cache_dir):
+    hit, result = _load_cached(stage, key, cache_dir)
+    if hit:
+        print(f"[pipeline] {stage.name}: cached ({key})")
+        record_event(stage.name, cached=True)
+        return result
+
+    print(f"[pipeline] {stage.name}: running")
+    with stage_timer(stage.name, upstream_results) as record:
+        if stage.exclusive:
+            with _EXCLUSIVE_LOCK:
+                result = stage.func(*upstream_results, **stage.params, **stage.options)
+        else:
+            result = stage.func(*upstream_results, **stage.params, **stage.options)
+
+        # Figures render in the background; outputs must be on disk before they are hashed
+        wait_for_plots(current_thread_only=True)
+        set_output(record, result)
+    _save_cached(stage, key, result, cache_dir)
+    return result
+
+def run_pipeline(stages, cache_dir=DEFAULT_CACHE_DIR, max_workers=4):
+    """
+    Run a DAG of stages, reusing cached results and running independent stages concurrently.
+
+    Stage keys are derived in topological order before anything runs, so a stage whose code,
+    parameters, input files and upstream keys are unchanged is loaded from the cache.
+
+    Parameters:
+        stages (list): Stage objects; order does not matter.
+        cache_dir (str): Directory holding pickled stage results.
+        max_workers (int): Maximum number of stages running at once.
+
+    Returns:
+        results (dict): Result of every stage keyed by stage name.
+    """
+    order = _topological_order(stages)
+    keys = {}
+    for stage in order:
+        keys[stage.name] = stage.key(keys)
+
+    results, pending, running = {}, list(order), {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            for stage in [s for s in pending if all(name in results for name in s.inputs + s.after)]:
+                pending.remove(stage)
+                upstream_results = [results[name] for name in stage.inputs]
+                future = executor.submit(_run_stage, stage, keys[stage.name], upstream_results, cache_dir)
+                running[future] = stage
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                results[stage.name] = future.result()
+    return results
@@ -0,0 +1,144 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import matplotlib
+from matplotlib.figure import Figure
+
+# Render off-screen; figures are saved to disk and never shown
+matplotlib.use('Agg')
+
+# Number of background rendering threads; 0 renders synchronously in the caller
+PLOT_WORKERS = int(os.environ.get('CLV_PLOT_WORKERS', 2))
+
+# Above this many values, densities come from a binned KDE and boxplot fliers are sampled
+KDE_EXACT_THRESHOLD = 5000
+KDE_GRID_SIZE = 512
+MAX_FLIERS = 500
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = []
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=PLOT_WORKERS, thread_name_prefix='plot')
+        return _executor
+
+def render_figure(draw, output_path, figsize=(10, 6), **kwargs):
+    """
+    Render a figure in the background and save it to `output_path`.
+
+    `draw(fig, **kwargs)` receives a fresh matplotlib Figure. Because figures are built with
+    the object-oriented API instead of pyplot, several can be rendered concurrently.
+    Statistics should be computed before calling this so the caller's data is not
+    referenced by the background job.
+
+    Returns:
+        future (Future): Resolves to `output_path` once the file is written.
+    """
+    def job():
+        directory = os.path.dirname(output_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        fig = Figure(figsize=figsize)
+        draw(fig, **kwargs)
+        fig.savefig(output_path)
+        return output_path
+
+    if PLOT_WORKERS <= 0:
+        job()
+        future = None
+    else:
+        future = _get_executor().submit(job)
+        with _executor_lock:
+            _pending.append((threading.get_ident(), future))
+    return future
+
+def wait_for_plots(current_thread_only=False):
+    """
+    Block until queued figures are written, re-raising the first rendering error.
+
+    Parameters:
+        current_thread_only (bool): Only wait for figures submitted from the calling thread.
+    """
+    thread_id = threading.get_ident()
+    with _executor_lock:
+        waiting = [future for owner, future in _pending if not current_thread_only or owner == thread_id]
+        _pending[:] = [(owner, future) for owner, future in _pending if future not in waiting]
+    for future in waiting:
+        future.result()
+
+def histogram_stats(values, bins=30, density=False, kde=True):
+    """
+    Precompute histogram bars and an optional KDE curve on the same scale.
+
+    Small inputs use an exact Gaussian KDE; larger ones use a binned KDE on a fixed grid,
+    so the cost after the single histogram pass does not grow with the number of values.
+
+    Returns:
+        stats (dict): 'edges' and 'heights' of the bars and, with kde, 'kde_x' and 'kde_y'.
+    """
+    values = np.asarray(values, dtype=float)
+    values = values[np.isfinite(values)]
+    heights, edges = np.histogram(values, bins=bins, density=density)
+    stats = {'edges': edges, 'heights': heights}
+
+    if kde and len(values) > 1 and values.std() > 0:
+        kde_x, kde_y = _kde(values)
+        # Match the bar scale: counts per bin unless the histogram is a density
+        stats['kde_x'] = kde_x
+        stats['kde_y'] = kde_y if density else kde_y * len(values) * (edges[1] - edges[0])
+    return stats
+
+def _kde(values):
+    """Gaussian KDE with Scott's bandwidth, binned above KDE_EXACT_THRESHOLD values."""
+    bandwidth = values.std(ddof=1) * len(values) ** (-1 / 5)
+    low, high = values.min() - 3 * bandwidth, values.max() + 3 * bandwidth
+    grid = np.linspace(low, high, KDE_GRID_SIZE)
+
+    if len(values) <= KDE_EXACT_THRESHOLD:
+        z = (grid[:, None] - values[None, :]) / bandwidth
+        density = np.exp(-0.5 * z ** 2).sum(axis=1) / (len(values) * bandwidth * np.sqrt(2 * np.pi))
+        return grid, density
+
+    # Bin onto a fixed grid and spread each bin's count with the Gaussian kernel
+    counts, bin_edges = np.histogram(values, bins=KDE_GRID_SIZE, range=(low, high))
+    centers = (bin_edges[:-1] + bin_edges[1:]) / 2
+    z = (grid[:, None] - centers[None, :]) / bandwidth
+    density = np.exp(-0.5 * z ** 2) @ counts / (len(values) * bandwidth * np.sqrt(2 * np.pi))
+    return grid, density
+
+def draw_histogram(ax, stats, color, label=None, alpha=0.5):
+    """Draw bars (and KDE line, if present) from histogram_stats output."""
+    edges = stats['edges']
+    ax.bar(edges[:-1], stats['heights'], width=np.diff(edges), align='edge',
+           color=color, alpha=alpha, edgecolor='white', label=label)
+    if 'kde_x' in stats:
+        ax.plot(stats['kde_x'], stats['kde_y'], color=color)
+
+def box_stats(values, label=''):
+    """
+    Precompute boxplot statistics (Tukey whiskers) in the form Axes.bxp expects.
+
+    Outliers beyond the whiskers are subsampled to at most MAX_FLIERS points.
+    """
+    values = np.asarray(values, dtype=float)
+    values = values[np.isfinite(values)]
+    if len(values) == 0:
+        return {'label': label, 'med': np.nan, 'q1': np.nan, 'q3': np.nan,
+                'whislo': np.nan, 'whishi': np.nan, 'fliers': np.array([])}
+
+    q1, med, q3 = np.percentile(values, [25, 50, 75])
+    iqr = q3 - q1
+    inside = values[(values >= q1 - 1.5 * iqr) & (values <= q3 + 1.5 * iqr)]
+    fliers = values[(values < q1 - 1.5 * iqr) | (values > q3 + 1.5 * iqr)]
+    if len(fliers) > MAX_FLIERS:
+        fliers = np.random.default_rng(0).choice(fliers, MAX_FLIERS, replace=False)
+
+    return {'label': label, 'med': med, 'q1': q1, 'q3': q3,
+            'whislo': inside.min() if len(inside) else q1,
+            'whishi': inside.max() if len(inside) else q3,
+            'fliers': fliers}
@@ -0,0 +1,96 @@
+import numpy as np
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch for non-negative values with a relative accuracy guarantee.
+
+    Positive values fall into logarithmic buckets (gamma^(i-1), gamma^i] with
+    gamma = (1 + a) / (1 - a), as in DDSketch, so every quantile estimate is within a
+    relative error `a` of a true quantile. Zeros and negative values share one bucket and
+    are reported as 0. Memory depends only on the range of the values, e.g. about 1,700
+    buckets for values between 1e-6 and 1e9 at 1% accuracy, never on how many are added.
+    Sketches built on disjoint chunks merge into the sketch of their union.
+
+    Parameters:
+        relative_accuracy (float): Maximum relative error of quantile estimates.
+    """
+
+    def __init__(self, relative_accuracy=0.01):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be between 0 and 1.")
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = np.log(self.gamma)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.offset = 0
+        self.zero_count = 0
+        self.count = 0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def _cover(self, low, high):
+        """Extend the bucket array so bucket indices low..high are stored."""
+        if not len(self.counts):
+            self.offset = low
+            self.counts = np.zeros(high - low + 1, dtype=np.int64)
+            return
+        new_low = min(low, self.offset)
+        new_high = max(high, self.offset + len(self.counts) - 1)
+        if new_low < self.offset or new_high >= self.offset + len(self.counts):
+            counts = np.zeros(new_high - new_low + 1, dtype=np.int64)
+            counts[self.offset - new_low:self.offset - new_low + len(self.counts)] = self.counts
+            self.counts, self.offset = counts, new_low
+
+    def add(self, values):
+        """Add a chunk of values; NaNs are ignored. Returns the sketch."""
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return self
+
+        self.count += len(values)
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+
+        positive = values[values > 0]
+        self.zero_count += len(values) - len(positive)
+        if len(positive):
+            index = np.ceil(np.log(positive) / self._log_gamma).astype(np.int64)
+            self._cover(index.min(), index.max())
+            self.counts += np.bincount(index - self.offset, minlength=len(self.counts))
+        return self
+
+    def merge(self, other):
+        """Fold another sketch with the same accuracy into this one. Returns the sketch."""
+        if other.gamma != self.gamma:
+            raise ValueError("Only sketches with the same relative accuracy can be merged.")
+        if len(other.counts):
+            self._cover(other.offset, other.offset + len(other.counts) - 1)
+            start = other.offset - self.offset
+            self.counts[start:start + len(other.counts)] += other.counts
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def quantile(self, q):
+        """
+        Estimate quantiles of the added values.
+
+        Parameters:
+            q (float or array-like): Quantiles between 0 and 1.
+
+        Returns:
+            estimates (float or ndarray): Values at the requested quantiles; NaN if empty.
+        """
+        q = np.asarray(q, dtype=float)
+        if self.count == 0:
+            return np.full(q.shape, np.nan)[()]
+
+        rank = q * (self.count - 1)
+        cumulative = self.zero_count + np.cumsum(self.counts)
+        bucket = np.minimum(np.searchsorted(cumulative, rank, side='right'), len(self.counts) - 1)
+        estimates = 2 * self.gamma ** (bucket + self.offset) / (self.gamma + 1)
+        estimates = np.where(rank < self.zero_count, 0.0, estimates)
+        return np.clip(estimates, min(self.min, 0.0) if self.zero_count else self.min, self.max)[()]
@@ -0,0 +1,100 @@
+import pandas as pd
+from datetime import timedelta
+from utils.schema import to_day_offsets
+
+# Per-customer aggregates from which RFM can be derived for any reference date
+PARTIAL_COLUMNS = ['CustomerID', 'FirstPurchase', 'LastPurchase', 'Purchases', 'MonetarySum']
+
+def rfm_partials(transactions_df):
+    """
+    Reduce transactions to per-customer partial aggregates using native groupby reductions.
+
+    Parameters:
+        transactions_df (DataFrame): Transactions with 'CustomerID', 'PurchaseDate' (or int16
+            'PurchaseDay' offsets, see utils.schema) and 'MonetaryValue'.
+
+    Returns:
+        partials (DataFrame): One row per customer with first and last purchase dates (day
+            offsets for 'PurchaseDay' input), number of purchases and monetary sum.
+    """
+    date_column = 'PurchaseDate' if 'PurchaseDate' in transactions_df else 'PurchaseDay'
+    grouped = transactions_df.groupby('CustomerID', sort=True, observed=True)
+    partials = pd.DataFrame({
+        'FirstPurchase': grouped[date_column].min(),
+        'LastPurchase': grouped[date_column].max(),
+        'Purchases': grouped.size(),
+        'MonetarySum': grouped['MonetaryValue'].sum()
+    }).reset_index()
+    return partials[PARTIAL_COLUMNS]
+
+def merge_rfm_partials(partials_list):
+    """Merge partial aggregates computed on disjoint sets of transactions."""
+    combined = pd.concat(partials_list, ignore_index=True)
+    merged = combined.groupby('CustomerID', sort=True, observed=True).agg(
+        FirstPurchase=('FirstPurchase', 'min'),
+        LastPurchase=('LastPurchase', 'max'),
+        Purchases=('Purchases', 'sum'),
+        MonetarySum=('MonetarySum', 'sum')
+    ).reset_index()
+    return merged[PARTIAL_COLUMNS]
+
+def rfm_from_partials(partials, reference_date=None):
+    """
+    Derive RFM metrics from per-customer partial aggregates.
+
+    Recency is the time between a customer's first and last purchase, T the time between the
+    first purchase and the reference date, and Frequency the number of repeat purchases.
+
+    Parameters:
+        partials (DataFrame): Output of rfm_partials or merge_rfm_partials.
+        reference_date (datetime): End of the observation period; defaults to the day after
+            the last purchase.
+
+    Returns:
+        rfm (DataFrame): 'CustomerID', 'Recency', 'T', 'Frequency' and 'MonetaryValue' columns.
+    """
+    if pd.api.types.is_integer_dtype(partials['FirstPurchase']):
+        # Day offsets: widen before subtracting so int16 offsets cannot overflow
+        first = partials['FirstPurchase'].astype('int32')
+        last = partials['LastPurchase'].astype('int32')
+        reference = last.max() + 1 if reference_date is None else int(to_day_offsets([reference_date])[0])
+        recency, T = last - first, reference - first
+    else:
+        if reference_date is None:
+            reference_date = partials['LastPurchase'].max() + timedelta(days=1)
+        recency = (partials['LastPurchase'] - partials['FirstPurchase']).dt.days
+        T = (pd.Timestamp(reference_date) - partials['FirstPurchase']).dt.days
+
+    return pd.DataFrame({
+        'CustomerID': partials['CustomerID'],
+        'Recency': recency,
+        'T': T,
+        'Frequency': partials['Purchases'] - 1,
+        'MonetaryValue': partials['MonetarySum'] / partials['Purchases']
+    })
+
+def build_rfm(transactions_df, reference_date=None):
+    """Build RFM metrics for every customer in an in-memory transaction table."""
+    return rfm_from_partials(rfm_partials(transactions_df), reference_date)
+
+def build_rfm_from_csv(filepath, reference_date=None, chunksize=1_000_000):
+    """
+    Build RFM metrics from a transactions CSV read in chunks, merging partial aggregates.
+
+    Memory is bounded by the chunk size plus one row of aggregates per customer.
+
+    Parameters:
+        filepath (str): Path to a CSV with 'CustomerID', 'PurchaseDate' and 'MonetaryValue' columns.
+        reference_date (datetime): End of the observation period; defaults to the day after
+            the last purchase.
+        chunksize (int): Number of transactions parsed per chunk.
+
+    Returns:
+        rfm (DataFrame): RFM metrics for every customer.
+    """
+    partials = None
+    for chunk in pd.read_csv(filepath, parse_dates=['PurchaseDate'], chunksize=chunksize,
+                             usecols=['CustomerID', 'PurchaseDate', 'MonetaryValue']):
+        chunk_partials = rfm_partials(chunk)
+        partials = chunk_partials if partials is None else merge_rfm_partials([partials, chunk_partials])
+    return rfm_from_partials(partials, reference_date)
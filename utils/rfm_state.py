@@ -0,0 +1,146 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from utils.rfm import PARTIAL_COLUMNS, merge_rfm_partials, rfm_from_partials, rfm_partials
+from utils.schema import to_day_offsets, with_purchase_dates
+
+DEFAULT_STATE_PATH = 'data/rfm_state.csv'
+
+def _meta_path(state_path):
+    return os.path.splitext(state_path)[0] + '.json'
+
+def _load_meta(state_path):
+    meta_path = _meta_path(state_path)
+    if not os.path.exists(meta_path):
+        return {}
+    with open(meta_path) as f:
+        return json.load(f)
+
+def transactions_fingerprint(transactions_df):
+    """
+    Order-independent fingerprint of a set of transactions: the row count and the sum of
+    per-row hashes modulo 2**64.
+
+    Rows are hashed on CustomerID, the purchase day and the float32 monetary value, so the
+    raw and compact schemas of the same data agree. Fingerprints of disjoint sets add up.
+    """
+    transactions_df = with_purchase_dates(transactions_df)
+    rows = pd.DataFrame({
+        'CustomerID': transactions_df['CustomerID'].to_numpy(),
+        'PurchaseDay': to_day_offsets(transactions_df['PurchaseDate']),
+        'MonetaryValue': transactions_df['MonetaryValue'].to_numpy(dtype=np.float32)
+    })
+    hashed = pd.util.hash_pandas_object(rows, index=False).to_numpy()
+    return len(rows), int(hashed.sum(dtype=np.uint64))
+
+def load_rfm_state(state_path=DEFAULT_STATE_PATH):
+    """
+    Load the persisted per-customer RFM state.
+
+    Returns:
+        (DataFrame, Timestamp): Per-customer partial aggregates and the watermark, i.e. the
+        latest purchase date already applied. An empty state and None if nothing is stored yet.
+    """
+    if not os.path.exists(state_path):
+        return pd.DataFrame(columns=PARTIAL_COLUMNS), None
+
+    state = pd.read_csv(state_path, parse_dates=['FirstPurchase', 'LastPurchase'])
+    watermark = _load_meta(state_path)['watermark']
+    return state, (pd.Timestamp(watermark) if watermark is not None else None)
+
+def save_rfm_state(state, watermark, state_path=DEFAULT_STATE_PATH, fingerprint=None, batch_fingerprint=None):
+    """
+    Persist the RFM state and its watermark, replacing any previous files atomically.
+
+    `fingerprint` is the transactions_fingerprint of every transaction applied so far and
+    `batch_fingerprint` that of the last batch applied.
+    """
+    directory = os.path.dirname(state_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    state.to_csv(state_path + '.tmp', index=False)
+    with open(_meta_path(state_path) + '.tmp', 'w') as f:
+        json.dump({'watermark': None if watermark is None else watermark.isoformat(),
+                   'customers': len(state),
+                   'applied_rows': None if fingerprint is None else fingerprint[0],
+                   'applied_hash': None if fingerprint is None else fingerprint[1],
+                   'last_batch': None if batch_fingerprint is None else list(batch_fingerprint)}, f, indent=2)
+    os.replace(state_path + '.tmp', state_path)
+    os.replace(_meta_path(state_path) + '.tmp', _meta_path(state_path))
+
+def update_rfm_state(batch_df, state_path=DEFAULT_STATE_PATH, rebuild=False):
+    """
+    Apply a batch of transactions to the persisted RFM state.
+
+    The batch is either only new transactions or the full history including them. Only
+    transactions dated after the stored watermark are applied, and the watermark then
+    advances to the latest purchase date in the batch, so re-applying the full history or
+    the last batch is a no-op. Otherwise, when the batch contains transactions up to the
+    watermark, their fingerprint must match the transactions already applied. A batch that
+    overlaps only part of the applied history, or whose historical rows were corrected,
+    deleted or added, raises ValueError and leaves the stored state untouched, unless
+    `rebuild` is set, in which case the batch is taken as the full history and the state is
+    rebuilt from it. Batches are expected to contain complete days of transactions.
+
+    Parameters:
+        batch_df (DataFrame): New transactions with 'CustomerID', 'PurchaseDate' and 'MonetaryValue'.
+        state_path (str): Path of the state CSV; the watermark and fingerprint of the applied
+            transactions are kept in a JSON file beside it.
+        rebuild (bool): Rebuild the state from `batch_df` when its history does not match the
+            applied transactions; only correct if `batch_df` is the full transaction history.
+
+    Returns:
+        state (DataFrame): Updated per-customer partial aggregates.
+    """
+    state, watermark = load_rfm_state(state_path)
+    meta = _load_meta(state_path)
+
+    # The state is kept in dates, whatever the batch's date encoding
+    batch_df = with_purchase_dates(batch_df)
+    applied_rows, applied_hash = meta.get('applied_rows'), meta.get('applied_hash')
+    if watermark is not None:
+        history = batch_df[batch_df['PurchaseDate'] <= watermark]
+        history_fingerprint = transactions_fingerprint(history) if not history.empty else None
+        last_batch = tuple(meta['last_batch']) if meta.get('last_batch') else None
+        if history_fingerprint not in (None, (applied_rows, applied_hash), last_batch):
+            if not rebuild:
+                raise ValueError(
+                    f"Transactions up to the RFM state watermark ({watermark.date()}) do not match the "
+                    f"{applied_rows} transactions already applied to '{state_path}'. Pass only new "
+                    "transactions, or the full transaction history with rebuild=True.")
+            print("Transactions up to the RFM state watermark changed; rebuilding the state from the full history.")
+            state, watermark, applied_rows, applied_hash = pd.DataFrame(columns=PARTIAL_COLUMNS), None, 0, 0
+
+    new_transactions = batch_df if watermark is None else batch_df[batch_df['PurchaseDate'] > watermark]
+    if new_transactions.empty:
+        print("RFM state is up to date; no new transactions to apply.")
+        return state
+
+    batch_partials = rfm_partials(new_transactions)
+    state = batch_partials if state.empty else merge_rfm_partials([state, batch_partials])
+    watermark = new_transactions['PurchaseDate'].max()
+    new_rows, new_hash = transactions_fingerprint(new_transactions)
+    fingerprint = ((applied_rows or 0) + new_rows, ((applied_hash or 0) + new_hash) % 2 ** 64)
+    save_rfm_state(state, watermark, state_path, fingerprint, (new_rows, new_hash))
+
+    print(f"Applied {len(new_transactions)} transactions to RFM state (watermark {watermark.date()}).")
+    return state
+
+def rfm_from_state(reference_date=None, state_path=DEFAULT_STATE_PATH, state=None):
+    """
+    Derive Recency, Frequency, T and MonetaryValue from the stored state without rescanning history.
+
+    Parameters:
+        reference_date (datetime): End of the observation period; defaults to the day after
+            the watermark.
+        state_path (str): Path of the state CSV.
+        state (DataFrame): Already loaded state; read from `state_path` if omitted.
+
+    Returns:
+        rfm (DataFrame): RFM metrics for every customer in the state.
+    """
+    if state is None:
+        state, _ = load_rfm_state(state_path)
+    return rfm_from_partials(state, reference_date)
@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+
+# Purchase dates can be stored as int16 day offsets from this epoch (1910-04-15 to 2089-09-17)
+DAY_EPOCH = pd.Timestamp('2000-01-01')
+
+# Largest rounding error accepted when storing monetary values as float32 (half a cent)
+MONETARY_TOLERANCE = 0.005
+
+# Compact dtypes used for every table, by column; None means chosen from the data
+TRANSACTION_SCHEMA = {
+    'CustomerID': None,          # smallest unsigned integer, or categorical for string IDs
+    'PurchaseDate': 'datetime64[ns]',
+    'PurchaseDay': 'int16',      # day offset from DAY_EPOCH, replacing PurchaseDate
+    'MonetaryValue': 'float32'
+}
+RFM_SCHEMA = {
+    'CustomerID': None,
+    'Recency': 'int16',
+    'T': 'int16',
+    'Frequency': None,           # smallest unsigned integer
+    'MonetaryValue': 'float32'
+}
+
+def smallest_uint(max_value):
+    """Smallest unsigned integer dtype holding values up to `max_value`."""
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if max_value <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.uint64)
+
+def compact_counts(values):
+    """Non-negative counts in the smallest unsigned integer dtype that holds them."""
+    values = np.asarray(values)
+    return values.astype(smallest_uint(values.max() if len(values) else 0))
+
+def compact_ids(ids):
+    """
+    Integer IDs downcast to the smallest integer dtype; other IDs dictionary-encoded.
+
+    Returns:
+        ids (Series): IDs as unsigned (or signed, if negative) integers, or as a categorical.
+    """
+    ids = pd.Series(ids)
+    if pd.api.types.is_integer_dtype(ids):
+        if len(ids) and ids.min() >= 0:
+            return ids.astype(smallest_uint(ids.max()))
+        return pd.to_numeric(ids, downcast='integer')
+    return ids.astype('category')
+
+def compact_money(values):
+    """Monetary values as float32 when that rounds no value by more than MONETARY_TOLERANCE."""
+    values = pd.Series(values)
+    compact = values.astype(np.float32)
+    if (compact.astype(np.float64) - values).abs().max() <= MONETARY_TOLERANCE:
+        return compact
+    return values
+
+def to_day_offsets(dates):
+    """Dates as int16 day offsets from DAY_EPOCH; raises ValueError outside the int16 range."""
+    days = (pd.to_datetime(pd.Series(dates)) - DAY_EPOCH).dt.days.to_numpy()
+    limits = np.iinfo(np.int16)
+    if len(days) and (days.min() < limits.min or days.max() > limits.max):
+        raise ValueError(f"Dates must fall within {limits.max} days of {DAY_EPOCH.date()} "
+                         f"to be stored as int16 day offsets.")
+    return days.astype(np.int16)
+
+def from_day_offsets(days):
+    """int16 day offsets from DAY_EPOCH back to datetime64 values."""
+    return DAY_EPOCH + pd.to_timedelta(np.asarray(days, dtype=np.int64), unit='D')
+
+def with_purchase_dates(transactions_df):
+    """Transactions with a datetime 'PurchaseDate', converted from 'PurchaseDay' if needed."""
+    if 'PurchaseDate' in transactions_df or 'PurchaseDay' not in transactions_df:
+        return transactions_df
+    return transactions_df.assign(PurchaseDate=from_day_offsets(transactions_df['PurchaseDay'])) \
+        .drop(columns='PurchaseDay')
+
+def compact_transactions(transactions_df, day_offsets=False):
+    """
+    Apply the compact transaction schema.
+
+    Parameters:
+        transactions_df (DataFrame): 'CustomerID', 'PurchaseDate' and 'MonetaryValue' columns.
+        day_offsets (bool): Replace 'PurchaseDate' with int16 'PurchaseDay' offsets from DAY_EPOCH.
+
+    Returns:
+        transactions_df (DataFrame): A new DataFrame with compact columns.
+    """
+    compact = pd.DataFrame({
+        'CustomerID': compact_ids(transactions_df['CustomerID']).array,
+        'PurchaseDate': pd.to_datetime(transactions_df['PurchaseDate']).array,
+        'MonetaryValue': compact_money(transactions_df['MonetaryValue']).array
+    }, index=transactions_df.index)
+    if day_offsets:
+        compact.insert(1, 'PurchaseDay', to_day_offsets(compact.pop('PurchaseDate')))
+    return compact
+
+def compact_rfm(rfm_df):
+    """Apply the compact RFM schema, keeping any extra columns as they are."""
+    compact = rfm_df.copy()
+    compact['CustomerID'] = compact_ids(rfm_df['CustomerID']).array
+    for column in ('Recency', 'T'):
+        values = rfm_df[column].to_numpy()
+        fits = len(values) == 0 or np.abs(values).max() <= np.iinfo(np.int16).max
+        compact[column] = values.astype(np.int16 if fits else np.int32)
+    compact['Frequency'] = compact_counts(rfm_df['Frequency'])
+    compact['MonetaryValue'] = compact_money(rfm_df['MonetaryValue']).array
+    return compact
+
+def memory_usage(frame):
+    """Deep memory usage of a DataFrame in bytes."""
+    return int(frame.memory_usage(deep=True).sum())
+
+def memory_reduction(before, after):
+    """
+    Compare the memory footprint of a table before and after compacting.
+
+    Returns:
+        report (dict): 'before_bytes', 'after_bytes' and the fractional 'reduction'.
+    """
+    before_bytes, after_bytes = memory_usage(before), memory_usage(after)
+    return {'before_bytes': before_bytes, 'after_bytes': after_bytes,
+            'reduction': 1 - after_bytes / before_bytes if before_bytes else 0.0}